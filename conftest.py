@@ -4,42 +4,110 @@ Support for embedding screenshots in pytest-html report.
 Works with --self-contained-html because we pass base64 content.
 """
 
+import re
+import time
+from datetime import datetime
+
+# start of conftest and plugin imports, for the collection budget of framework/startup.py
+import_started = time.perf_counter()
+
 import pytest
-from pytest_html import extras
 import logging
 
-# !!!!! don't directly call logging.basicConfig as it will also change selenium logging outputs. Set level DEBUG for debugging selenium !!!!!
-# %(levelname)7s to align 7 bytes to right, %(levelname)-7s to left.
-common_formatter = logging.Formatter(
-    "%(asctime)s [%(levelname)-7s][%(lineno)-3d]: %(message)s",
-    datefmt="%Y-%m-%d %I:%M:%S",
-)
+# framework modules may use assert, register them for rewriting before the first import.
+pytest.register_assert_rewrite("framework")
+from framework.logs import add_jsonl, log_test_start, set_current_test, setup_logger  # noqa: E402
 
+# default debug logger, non-blocking, one file per pytest-xdist worker (see framework/logs.py)
+log = setup_logger("debug.log", logging.INFO, name=__name__)
 
-# Note: To create multiple log files, must use different logger name.
-def setup_logger(log_file, level=logging.INFO, name="", formatter=common_formatter):
-    """Function setup as many loggers as you want."""
-    handler = logging.FileHandler(log_file, mode="w")  # default mode is append
-    # Or use a rotating file handler
-    # handler = RotatingFileHandler(log_file,maxBytes=1024, backupCount=5)
-    handler.setFormatter(formatter)
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
-    return logger
+# driver used by a test, see register_driver()
+driver_key = pytest.StashKey[object]()
 
 
-# default debug logger
-log = setup_logger("debug.log", logging.INFO, name=__name__)
+def register_driver(item, driver):
+    """Register the driver a test uses, to take its screenshot on failure.
+
+    The "wd" fixture registers its drivers, call this for drivers a test creates itself.
+    """
+    item.stash[driver_key] = driver
+
+
+pytest_plugins = [
+    "framework.timing",
+    "framework.page_metrics",
+    "framework.impact",
+    "framework.screenshots",
+    "framework.artifacts",
+    "framework.driver_pool",
+    "framework.browser_processes",
+    "framework.storage_state",
+    "framework.resource_blocking",
+    "framework.waits",
+    "framework.timeouts",
+    "framework.circuit_breaker",
+    "framework.site_replay",
+    "framework.smoke",
+    "framework.visual",
+    "framework.scheduling",
+    "framework.startup",
+]
+
+# framework modules log via the logger above, so import them after it is defined.
+from framework.screenshots import capture  # noqa: E402
+from framework.artifacts import store as artifact_store  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addini("log_jsonl", "Also write the debug log as JSONL records to this file.", default="")
+    parser.addoption(
+        "--log-jsonl",
+        default=None,
+        help="Also write the debug log as JSONL records with nodeid and phase, e.g. debug.jsonl.",
+    )
+
+
+def pytest_configure(config):
+    jsonl = config.getoption("log_jsonl") or config.getini("log_jsonl")
+    if jsonl:
+        add_jsonl(log, jsonl)
+
+
+def pytest_runtest_logstart(nodeid, location):
+    log_test_start(log, nodeid)
+
+
+# the running test of log records and framework/timing.py, outermost so other hooks see it
+@pytest.hookimpl(hookwrapper=True, tryfirst=True)
+def pytest_runtest_setup(item):
+    set_current_test(item.nodeid, "setup")
+    yield
+
+
+@pytest.hookimpl(hookwrapper=True, tryfirst=True)
+def pytest_runtest_call(item):
+    set_current_test(item.nodeid, "call")
+    yield
+
+
+@pytest.hookimpl(hookwrapper=True, tryfirst=True)
+def pytest_runtest_teardown(item):
+    set_current_test(item.nodeid, "teardown")
+    yield
+    set_current_test(None)
 
 
 def _get_driver_from_item(item):
     """Try multiple ways to retrieve the webdriver from test item.
     Supports:
+      - Drivers registered by register_driver(), e.g. by the pooled "wd" fixture
       - Class based tests using self.wd (setup_method style)
-      - Global "browser"
       - funcargs if someone uses a "driver" fixture
     """
+    driver = item.stash.get(driver_key, None)
+    if driver is not None:
+        return driver
+
     # Class instance style: def setup_method(self): self.wd = ...
     if hasattr(item, "instance"):
         driver = getattr(item.instance, "wd", None)
@@ -53,15 +121,6 @@ def _get_driver_from_item(item):
             if d is not None:
                 return d
 
-    # Legacy global used in some tests here
-    try:
-        import test_selenium_pytest as tmod
-
-        if hasattr(tmod, "browser"):
-            return tmod.browser
-    except Exception:
-        pass
-
     return None
 
 
@@ -87,22 +146,32 @@ def pytest_runtest_makereport(item, call):
     if not report.failed:
         return
 
+    from framework.circuit_breaker import breaker
+
+    # stopped by an open circuit, the first failure of its cause has the screenshot
+    if item.nodeid in breaker.tripped:
+        return
+
     driver = _get_driver_from_item(item)
     if driver is None:
         return
 
     try:
-        # Prefer the exact screenshot captured by ScreenshotListener (on_exception)
-        screenshot_base64 = getattr(driver, "_last_screenshot_base64", None)
+        # Prefer the exact screenshot captured by ScreenshotListener (on_exception).
+        # Look it up on the real driver, a missing attribute of EventFiringWebDriver fires on_exception.
+        shot = getattr(driver, "wrapped_driver", driver).__dict__.get("_last_screenshot")
 
         # Fall back to taking one now (covers assert failures, and tests without the listener)
-        if not screenshot_base64:
-            screenshot_base64 = driver.get_screenshot_as_base64()
+        if shot is None:
+            now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            test_name = re.sub(r"[^\w.-]", "_", item.name)
+            shot = capture(driver, "screenshot_on_failure_%s_%s" % (test_name, now))
 
         # Use the modern report.extras list (pytest-html >= 4.0.0)
         new_extras = getattr(report, "extras", [])
-        # extras.png(base64) is a convenience for image(..., mime_type=image/png)
-        new_extras.append(extras.png(screenshot_base64, name="Screenshot"))
+        # Only waits for encoding, the file is written in background.
+        # Identical screenshots of other tests are stored once in the report.
+        new_extras.append(artifact_store.screenshot_extra(shot, item.nodeid))
         report.extras = new_extras
         # Note this log won't be captured in the pytest outputs as this function is defined in the hook
         log.info("Attached screenshot to HTML report for failed test: %s", item.nodeid)
@@ -0,0 +1,5 @@
+"""
+Helpers shared by the tests: driver pool, factory, waits, reporting, etc.
+
+Modules which provide fixtures or hooks are registered as pytest plugins in conftest.py.
+"""
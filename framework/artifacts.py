@@ -0,0 +1,185 @@
+"""
+Content-addressed store of report screenshots, so the HTML report doesn't grow with every repeated failure.
+
+When a shared page breaks, many tests fail with the same screenshot. Screenshots are keyed by
+the URL of their page and the SHA-256 of their content, and with Pillow installed also by a
+64-bit perceptual hash (dHash), so identical and near-identical screenshots of a page are stored
+once, and screenshots of different pages with the same layout are all kept:
+  - inline mode (default, for --self-contained-html): the first screenshot is embedded,
+    later duplicates link to the report row of the test which embedded it
+  - external mode: each unique screenshot is written once to artifacts/<hash>.<ext> next to
+    report.html and the report links to it
+
+Once embedded screenshots exceed artifact_max_mb, further screenshots are not embedded, the
+report gives the path of the screenshot file on disk instead. The terminal summary shows how
+much was deduplicated.
+
+Options in pytest.ini:
+  artifact_mode: inline (default) or external
+  artifact_max_mb: max MB of screenshots stored in / next to the report, 0 for no limit. Default 50.
+  artifact_phash_distance: max bits different of perceptual hashes to treat screenshots as the
+      same, -1 to only dedupe identical ones. Default 0, i.e. the same perceptual hash.
+"""
+
+import base64
+import hashlib
+import io
+import os
+from html import escape
+from urllib.parse import quote
+
+from pytest_html import extras
+
+_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+def _pil_image():
+    # Pillow is slow to import, only load it when a screenshot is hashed, see framework/startup.py
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def perceptual_hash(png):
+    """64-bit difference hash of an image, None without Pillow."""
+    Image = _pil_image()
+    if Image is None:
+        return None
+    image = Image.open(io.BytesIO(png)).convert("L").resize((9, 8), Image.BILINEAR)
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            bits = (bits << 1) | (left > pixels[row * 9 + col + 1])
+    return bits
+
+
+class ArtifactStore:
+    def __init__(self, mode="inline", max_bytes=50 * 1024 * 1024, phash_distance=0):
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.phash_distance = phash_distance
+        self.report_dir = "."
+        # (page URL, sha256) -> (nodeid, location) of the stored screenshot
+        self._by_digest = {}
+        # page URL -> [(perceptual hash, nodeid, location)]
+        self._by_phash = {}
+        self.stored = 0
+        self.stored_bytes = 0
+        self.deduped = 0
+        self.deduped_bytes = 0
+        self.over_cap = 0
+
+    def _find(self, page, digest, phash):
+        if (page, digest) in self._by_digest:
+            return self._by_digest[page, digest]
+        if phash is not None and self.phash_distance >= 0:
+            for other, nodeid, location in self._by_phash.get(page, ()):
+                if bin(phash ^ other).count("1") <= self.phash_distance:
+                    return nodeid, location
+        return None
+
+    def screenshot_extra(self, shot, nodeid):
+        """pytest-html extra for a screenshot of a failed test."""
+        data_b64, mime_type, size = shot.encoded()
+        name = "Screenshot (%d KB, captured in %.2fs)" % (size // 1024, shot.capture_secs)
+        digest = hashlib.sha256(shot.png).hexdigest()
+        phash = perceptual_hash(shot.png)
+
+        page = getattr(shot, "page", None)
+        found = self._find(page, digest, phash)
+        if found is not None:
+            first_nodeid, location = found
+            self.deduped += 1
+            self.deduped_bytes += size
+            if self.mode == "external":
+                return extras.image(location, name=name + ", deduplicated")
+            # pytest-html gives the rows of a test the id of its nodeid
+            return extras.html(
+                '<p>Same screenshot as failed test <a href="#%s"><b>%s</b></a>, '
+                "embedded there once.</p>"
+                % (escape(quote(first_nodeid, safe="/:[]")), escape(first_nodeid))
+            )
+
+        if self.max_bytes and self.stored_bytes + size > self.max_bytes:
+            self.over_cap += 1
+            return extras.html(
+                "<p>Screenshot not embedded, the report reached its size cap of %d MB. "
+                "See screenshot file %s</p>"
+                % (self.max_bytes // (1024 * 1024), escape(str(shot.path)))
+            )
+
+        self.stored += 1
+        self.stored_bytes += size
+        if self.mode == "external":
+            location = self._write(digest, data_b64, mime_type)
+            extra = extras.image(location, name=name)
+        else:
+            location = None
+            extra = extras.image(data_b64, name=name, mime_type=mime_type)
+        self._by_digest[page, digest] = (nodeid, location)
+        if phash is not None:
+            self._by_phash.setdefault(page, []).append((phash, nodeid, location))
+        return extra
+
+    def _write(self, digest, data_b64, mime_type):
+        """Write a screenshot next to the report, return its path relative to the report."""
+        location = "artifacts/%s%s" % (digest[:16], _EXTENSIONS.get(mime_type, ".png"))
+        path = os.path.join(self.report_dir, location)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(base64.b64decode(data_b64))
+        return location
+
+
+store = ArtifactStore()
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "artifact_mode",
+        "inline: embed each unique screenshot once, external: write them next to the HTML report.",
+        default="inline",
+    )
+    parser.addini(
+        "artifact_max_mb",
+        "Max MB of screenshots stored in / next to the HTML report, 0 for no limit.",
+        default="50",
+    )
+    parser.addini(
+        "artifact_phash_distance",
+        "Max bits different of perceptual hashes of near-identical screenshots, -1 to disable.",
+        default="0",
+    )
+
+
+def pytest_configure(config):
+    mode = config.getini("artifact_mode").lower()
+    if mode not in ("inline", "external"):
+        raise ValueError("artifact_mode must be inline or external, got '%s'" % mode)
+    store.mode = mode
+    store.max_bytes = int(float(config.getini("artifact_max_mb")) * 1024 * 1024)
+    store.phash_distance = int(config.getini("artifact_phash_distance"))
+    html_path = getattr(config.option, "htmlpath", None)
+    if html_path:
+        store.report_dir = os.path.dirname(os.path.abspath(html_path))
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not (store.stored or store.deduped or store.over_cap):
+        return
+    terminalreporter.write_sep("-", "report artifacts")
+    terminalreporter.write_line(
+        "%d unique screenshots stored (%d KB), %d deduplicated (%d KB saved), "
+        "%d not stored over the size cap"
+        % (
+            store.stored,
+            store.stored_bytes // 1024,
+            store.deduped,
+            store.deduped_bytes // 1024,
+            store.over_cap,
+        )
+    )
@@ -0,0 +1,319 @@
+"""
+Memory and CPU of the browser processes behind each test's driver, and leaks over runs.
+
+While a test runs (its call phase), a background thread samples the process tree of its
+driver's service every browser_sample_ms (pytest.ini, default 250): chromedriver / geckodriver
+and all their children, i.e. the browser and its renderer, GPU, ... processes. Per test:
+  - peak RSS of the tree, and RSS at start and end of the test
+  - CPU time used by the tree during the test
+  - max number of child processes
+The figures are attached to the HTML report and added to the JSONL records of
+framework/timing.py as "browser_processes".
+
+Peak RSS per test is kept over runs in .browser_memory.json (browser_memory_history in
+pytest.ini), the last MAX_RUNS runs. A test whose peak RSS grew in each of its last LEAK_RUNS
+runs by LEAK_MIN_MB or more in total is flagged as a possible leak, in its report and the
+terminal summary.
+
+Needs psutil, without it nothing is sampled. Drivers are found via register_driver() of
+conftest.py, which the "wd" fixture calls. Remote drivers have no local processes to sample.
+"""
+
+import importlib.util
+import json
+import os
+import threading
+
+import pytest
+from pytest_html import extras
+
+from conftest import driver_key, log
+from framework.timing import add_record_fields
+
+DEFAULT_SAMPLE_MS = 250
+MAX_RUNS = 20
+LEAK_RUNS = 5
+LEAK_MIN_MB = 10.0
+MB = 1024 * 1024
+
+
+def service_pid(driver):
+    """pid of the driver's service process, e.g. chromedriver, None for remote drivers."""
+    driver = getattr(driver, "wrapped_driver", driver)
+    process = getattr(getattr(driver, "service", None), "process", None)
+    return getattr(process, "pid", None)
+
+
+class ProcessStats:
+    """Figures of a process tree over a test."""
+
+    def __init__(self, start_rss, peak_rss, end_rss, cpu_secs, max_children, samples):
+        self.start_rss = start_rss
+        self.peak_rss = peak_rss
+        self.end_rss = end_rss
+        self.cpu_secs = cpu_secs
+        self.max_children = max_children
+        self.samples = samples
+
+    def as_dict(self):
+        return {
+            "start_rss_mb": round(self.start_rss / MB, 1),
+            "peak_rss_mb": round(self.peak_rss / MB, 1),
+            "end_rss_mb": round(self.end_rss / MB, 1),
+            "cpu_secs": round(self.cpu_secs, 3),
+            "max_children": self.max_children,
+            "samples": self.samples,
+        }
+
+
+def _psutil():
+    # psutil is slow to import, only load it when a test is sampled, see framework/startup.py
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil
+
+
+class ProcessSampler:
+    """Sample RSS, CPU time and children of a process tree on a background thread."""
+
+    def __init__(self, root_pid, interval=DEFAULT_SAMPLE_MS / 1000):
+        psutil = _psutil()
+        self._error = psutil.Error
+        self.root = psutil.Process(root_pid)
+        self.interval = interval
+        # pid -> CPU secs at start of the test, 0 for processes started during it
+        self._cpu_first = {}
+        self._cpu_last = {}
+        self._rss = []
+        self._max_children = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self, first=False):
+        try:
+            processes = [self.root] + self.root.children(recursive=True)
+        except self._error:
+            return
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    rss += process.memory_info().rss
+                    cpu = process.cpu_times()
+            except self._error:
+                # ended since listing the tree
+                continue
+            self._cpu_first.setdefault(process.pid, (cpu.user + cpu.system) if first else 0.0)
+            self._cpu_last[process.pid] = cpu.user + cpu.system
+        self._rss.append(rss)
+        self._max_children = max(self._max_children, len(processes) - 1)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample(first=True)
+        self._thread = threading.Thread(target=self._run, name="process-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling, return the ProcessStats."""
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        cpu = sum(last - self._cpu_first.get(pid, 0.0) for pid, last in self._cpu_last.items())
+        rss = self._rss or [0]
+        return ProcessStats(rss[0], max(rss), rss[-1], cpu, self._max_children, len(self._rss))
+
+
+class MemoryHistory:
+    """Peak RSS MB of each test over runs, to find tests whose memory grows run after run."""
+
+    def __init__(self):
+        self.path = None
+        self.runs = {}
+        # nodeid -> peak MB of this run, saved / sent to the xdist controller at the end
+        self.new_runs = {}
+
+    def load(self, path):
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.runs = json.load(f)
+            except ValueError as e:
+                log.warning("Ignoring broken browser memory history %s: %s", path, e)
+
+    def add(self, nodeid, peak_mb):
+        self.new_runs[nodeid] = peak_mb
+
+    def history(self, nodeid):
+        """Peak MB of previous runs and of this run, oldest first."""
+        runs = list(self.runs.get(nodeid, []))
+        if nodeid in self.new_runs:
+            runs.append(self.new_runs[nodeid])
+        return runs[-MAX_RUNS:]
+
+    def leaking(self, nodeid):
+        """Whether peak RSS grew in each of the last LEAK_RUNS runs, by LEAK_MIN_MB in total."""
+        runs = self.history(nodeid)[-(LEAK_RUNS + 1):]
+        if len(runs) < LEAK_RUNS + 1:
+            return False
+        growing = all(later > earlier for earlier, later in zip(runs, runs[1:]))
+        return growing and runs[-1] - runs[0] >= LEAK_MIN_MB
+
+    def merge(self, new_runs):
+        for nodeid, peak_mb in new_runs.items():
+            self.runs[nodeid] = (self.runs.get(nodeid, []) + [peak_mb])[-MAX_RUNS:]
+
+    def save(self):
+        if not self.new_runs:
+            return
+        self.merge(self.new_runs)
+        with open(self.path, "w") as f:
+            json.dump(self.runs, f, indent=1, sort_keys=True)
+
+
+history = MemoryHistory()
+
+# nodeid -> ProcessStats of this run
+_records = {}
+# nodeids flagged as leaking in this run
+_leaks = []
+
+
+def _stats_table(stats, runs, leaking):
+    trend = " &rarr; ".join("%.0f" % mb for mb in runs[-(LEAK_RUNS + 1):])
+    return (
+        "<table><tr><th>Browser processes</th><th>Peak RSS (MB)</th><th>RSS start / end (MB)</th>"
+        "<th>CPU (s)</th><th>Children</th><th>Peak RSS of last runs (MB)</th></tr>"
+        "<tr><td>%s</td><td>%.1f</td><td>%.1f / %.1f</td><td>%.2f</td><td>%d</td><td>%s</td></tr>"
+        "</table>"
+        % (
+            "<b>possible leak</b>" if leaking else "%d samples" % stats.samples,
+            stats.peak_rss / MB,
+            stats.start_rss / MB,
+            stats.end_rss / MB,
+            stats.cpu_secs,
+            stats.max_children,
+            trend,
+        )
+    )
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "browser_sample_ms",
+        "Interval of sampling the browser processes of a test, 0 to disable.",
+        default=str(DEFAULT_SAMPLE_MS),
+    )
+    parser.addini(
+        "browser_memory_history",
+        "File of the peak RSS of browser processes per test over runs.",
+        default=".browser_memory.json",
+    )
+
+
+def _interval(config):
+    return float(config.getini("browser_sample_ms")) / 1000
+
+
+def pytest_configure(config):
+    if importlib.util.find_spec("psutil") is None:
+        if _interval(config):
+            log.warning("psutil is not installed, browser processes are not sampled.")
+        return
+    # xdist workers read the history too, to flag leaks, only the controller saves it
+    history.load(os.path.join(str(config.rootpath), config.getini("browser_memory_history")))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    sampler = None
+    interval = _interval(item.config)
+    driver = item.stash.get(driver_key, None)
+    pid = service_pid(driver) if driver is not None else None
+    psutil = _psutil() if interval and pid is not None else None
+    if psutil is not None:
+        try:
+            sampler = ProcessSampler(pid, interval).start()
+        except psutil.Error as e:
+            log.warning("Cannot sample browser processes of pid %s: %s", pid, e)
+    yield
+    if sampler is None:
+        return
+
+    stats = sampler.stop()
+    nodeid = item.nodeid
+    _records[nodeid] = stats
+    history.add(nodeid, round(stats.peak_rss / MB, 1))
+    fields = stats.as_dict()
+    if history.leaking(nodeid):
+        _leaks.append(nodeid)
+        fields["possible_leak"] = True
+        log.warning(
+            "Possible memory leak of %s, peak RSS of last runs: %s MB",
+            nodeid,
+            history.history(nodeid)[-(LEAK_RUNS + 1):],
+        )
+    add_record_fields(nodeid, browser_processes=fields)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when != "call":
+        return
+    stats = _records.get(item.nodeid)
+    if stats is None:
+        return
+    new_extras = getattr(report, "extras", [])
+    new_extras.append(
+        extras.html(
+            _stats_table(stats, history.history(item.nodeid), item.nodeid in _leaks)
+        )
+    )
+    report.extras = new_extras
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # pytest-xdist controller: workers send their figures, only the controller saves
+    output = getattr(node, "workeroutput", {})
+    history.new_runs.update(output.get("browser_memory", {}))
+    _leaks.extend(output.get("browser_leaks", []))
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if hasattr(config, "workerinput"):
+        config.workeroutput["browser_memory"] = history.new_runs
+        config.workeroutput["browser_leaks"] = _leaks
+        return
+    if history.path is None:
+        return
+    try:
+        history.save()
+    except OSError as e:
+        log.warning("Failed to save browser memory history: %s", e)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not (_records or _leaks):
+        return
+    terminalreporter.write_sep("-", "browser processes")
+    top = sorted(_records.items(), key=lambda entry: entry[1].peak_rss, reverse=True)[:5]
+    for nodeid, stats in top:
+        terminalreporter.write_line(
+            "%7.1f MB peak, %6.2fs CPU, %2d children  %s"
+            % (stats.peak_rss / MB, stats.cpu_secs, stats.max_children, nodeid)
+        )
+    for nodeid in _leaks:
+        terminalreporter.write_line(
+            "possible leak, peak RSS grew over the last %d runs: %s" % (LEAK_RUNS, nodeid)
+        )
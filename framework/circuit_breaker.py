@@ -0,0 +1,324 @@
+"""
+Failure-first ordering, and a circuit breaker for pages which fail the same way test after test.
+
+When python.org is down or redesigned, every test of it waits up to TIMEWAIT_PAGE_LOAD_GET and
+TIMEWAIT_PAGE_LOAD before failing the same way. Instead:
+
+1. Tests which failed in the last run run first, those of the same cause next to each other.
+   Failures and their causes are kept in .last_failures.json (failure_history in pytest.ini).
+   Switch it off with failures_first = false in pytest.ini.
+
+2. The cause of each failure is recorded:
+     - load: driver.get(url) raised, e.g. net::ERR_NAME_NOT_RESOLVED or a page load timeout
+     - page: a page object's wait timed out, e.g. PythonOrgHomepage "title is 'Welcome to Python.org'"
+       in is_page_matched()
+     - error: any other exception, by its type, its message and the URL the test loaded last
+   After circuit_breaker_threshold (pytest.ini, default 3, 0 disables) failures of the same
+   cause its circuit opens: a later driver.get() of that URL or wait of that page fails at once
+   with CircuitOpenError, instead of waiting for the timeouts again. Such tests fail with a one
+   line "circuit open" report, or are skipped with circuit_breaker_action = skip. They take no
+   screenshot, their report refers to the first failure of the cause, which has one.
+   Error causes have no such point to trip, they are only grouped.
+
+The terminal summary groups failures by cause. Drivers are guarded via track_page_loads() of
+framework/page_metrics.py, i.e. the "wd" drivers, and waits via framework/timeouts.py. Each
+pytest-xdist worker has its own breaker, the controller keeps the failure history.
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import pytest
+from pytest_html import extras
+
+from conftest import log
+from framework import page_metrics, timeouts
+from framework.timing import current_test
+
+DEFAULT_THRESHOLD = 3
+ACTIONS = ("fail", "skip")
+MAX_DETAIL = 160
+
+# kind: load, page or error; target: URL or page object class; detail: exception or wait label
+Cause = namedtuple("Cause", "kind target detail")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of loading a page or waiting for it when its circuit is open."""
+
+
+def normalize_url(url):
+    """URL without port, query and fragment, so URLs of the local replay server match over runs."""
+    parts = urlsplit(str(url))
+    return "%s://%s%s" % (parts.scheme, parts.hostname or "", parts.path or "/")
+
+
+def describe_error(error):
+    """'Type: first line of message', with addresses and session ids masked."""
+    message = getattr(error, "msg", None) or str(error)
+    first = message.strip().splitlines()[0] if message.strip() else ""
+    first = re.sub(r"0x[0-9a-fA-F]+|\b[0-9a-f]{16,}\b", "...", first)
+    return ("%s: %s" % (type(error).__name__, first))[:MAX_DETAIL]
+
+
+def cause_text(cause):
+    if cause.kind == "page":
+        return "%s: wait for %s failed" % (cause.target, cause.detail)
+    return "%s at %s" % (cause.detail, cause.target) if cause.target else cause.detail
+
+
+class CircuitBreaker:
+    """Failures per cause, and the guards failing tests of causes that failed too often."""
+
+    def __init__(self):
+        self.threshold = DEFAULT_THRESHOLD
+        self.action = "fail"
+        # Cause -> nodeids of tests which failed of it
+        self.failures = {}
+        # nodeid -> Cause of tests failed by an open circuit
+        self.tripped = {}
+        # nodeid -> what the running test did: last "url", "load_error", failed "waits"
+        self._tests = {}
+
+    def _test(self):
+        nodeid = current_test()
+        return self._tests.setdefault(nodeid, {"waits": []}) if nodeid else None
+
+    def is_open(self, cause):
+        return bool(self.threshold) and len(self.failures.get(cause, ())) >= self.threshold
+
+    def _trip(self, cause):
+        nodeid = current_test()
+        if nodeid:
+            self.tripped[nodeid] = cause
+        first = self.failures[cause][0]
+        raise CircuitOpenError(
+            "circuit open: %s in %d tests, first %s" % (cause_text(cause), len(self.failures[cause]), first)
+        )
+
+    def check_load(self, driver, url):
+        test = self._test()
+        if test is not None:
+            test["url"] = normalize_url(url)
+        for cause in self.failures:
+            if cause.kind == "load" and cause.target == normalize_url(url) and self.is_open(cause):
+                self._trip(cause)
+
+    def load_failed(self, driver, url, error):
+        test = self._test()
+        if test is not None and "load_error" not in test:
+            test["load_error"] = Cause("load", normalize_url(url), describe_error(error))
+
+    def check_wait(self, driver, page, label):
+        cause = Cause("page", page, label)
+        if self.is_open(cause):
+            self._trip(cause)
+
+    def wait_failed(self, driver, page, label):
+        test = self._test()
+        if test is not None:
+            test["waits"].append(Cause("page", page, label))
+
+    def cause_of(self, nodeid, error):
+        """Cause of the failure of a test, load errors and failed waits first."""
+        test = self._tests.get(nodeid, {"waits": []})
+        if "load_error" in test:
+            return test["load_error"]
+        if test["waits"]:
+            return test["waits"][0]
+        return Cause("error", test.get("url"), describe_error(error))
+
+    def failed(self, nodeid, cause):
+        nodeids = self.failures.setdefault(cause, [])
+        if nodeid not in nodeids:
+            nodeids.append(nodeid)
+        if len(nodeids) == self.threshold:
+            log.warning(
+                "Circuit open after %d failures: %s, later tests of it fail at once",
+                len(nodeids),
+                cause_text(cause),
+            )
+
+    def finished(self, nodeid):
+        self._tests.pop(nodeid, None)
+
+
+breaker = CircuitBreaker()
+
+
+class FailureHistory:
+    """Failed tests of the last run and the text of their causes, nodeid -> cause."""
+
+    def __init__(self):
+        # None until loaded, and in xdist workers
+        self.path = None
+        self.failures = {}
+        self._passed = set()
+        self._failed = {}
+
+    def load(self, path):
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.failures = json.load(f)
+            except ValueError as e:
+                log.warning("Ignoring broken failure history %s: %s", path, e)
+
+    def add(self, nodeid, cause):
+        self._failed.setdefault(nodeid, cause)
+
+    def passed(self, nodeid):
+        self._passed.add(nodeid)
+
+    def save(self):
+        # tests which didn't run keep their entries
+        failures = {n: c for n, c in self.failures.items() if n not in self._passed}
+        failures.update(self._failed)
+        with open(self.path, "w") as f:
+            json.dump(failures, f, indent=1, sort_keys=True)
+
+
+history = FailureHistory()
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "failures_first",
+        "Run the tests which failed in the last run first.",
+        type="bool",
+        default=True,
+    )
+    parser.addini(
+        "failure_history",
+        "File of the failed tests of the last run and their causes.",
+        default=".last_failures.json",
+    )
+    parser.addini(
+        "circuit_breaker_threshold",
+        "Failures of the same cause after which tests of it fail at once, 0 to disable.",
+        default=str(DEFAULT_THRESHOLD),
+    )
+    parser.addini(
+        "circuit_breaker_action",
+        "fail or skip the tests stopped by an open circuit.",
+        default="fail",
+    )
+    parser.addoption(
+        "--circuit-breaker-threshold",
+        type=int,
+        default=None,
+        help="Failures of the same cause after which tests of it fail at once, 0 to disable.",
+    )
+
+
+def pytest_configure(config):
+    threshold = config.getoption("circuit_breaker_threshold")
+    breaker.threshold = threshold if threshold is not None else int(config.getini("circuit_breaker_threshold"))
+    breaker.action = config.getini("circuit_breaker_action")
+    if breaker.action not in ACTIONS:
+        raise pytest.UsageError(
+            "circuit_breaker_action must be one of %s, not %s" % (", ".join(ACTIONS), breaker.action)
+        )
+    page_metrics.page_load_guards.append(breaker.check_load)
+    page_metrics.page_load_error_listeners.append(breaker.load_failed)
+    timeouts.wait_guards.append(breaker.check_wait)
+    timeouts.wait_failure_listeners.append(breaker.wait_failed)
+    # workers report failures to the controller, only it keeps the file
+    if not hasattr(config, "workerinput"):
+        history.load(os.path.join(str(config.rootpath), config.getini("failure_history")))
+
+
+def pytest_unconfigure(config):
+    for listeners, listener in (
+        (page_metrics.page_load_guards, breaker.check_load),
+        (page_metrics.page_load_error_listeners, breaker.load_failed),
+        (timeouts.wait_guards, breaker.check_wait),
+        (timeouts.wait_failure_listeners, breaker.wait_failed),
+    ):
+        if listener in listeners:
+            listeners.remove(listener)
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getini("failures_first") or not history.failures:
+        return
+    failures = history.failures
+    # same causes next to each other, so their circuit opens early
+    causes = {cause: i for i, cause in enumerate(sorted(set(failures.values())))}
+    failed = [item for item in items if item.nodeid in failures]
+    failed.sort(key=lambda item: causes[failures[item.nodeid]])
+    if failed:
+        items[:] = failed + [item for item in items if item.nodeid not in failures]
+        log.info("Running %d tests which failed in the last run first", len(failed))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    nodeid = item.nodeid
+    if report.failed and call.excinfo is not None:
+        cause = breaker.tripped.get(nodeid)
+        if cause is not None:
+            first = breaker.failures[cause][0]
+            message = "circuit open: %s in %d tests" % (cause_text(cause), len(breaker.failures[cause]))
+            if breaker.action == "skip":
+                report.outcome = "skipped"
+                report.longrepr = (str(item.path), item.location[1] or 0, "Skipped: " + message)
+            else:
+                report.longrepr = message
+            new_extras = getattr(report, "extras", [])
+            new_extras.append(extras.html("<p>%s, see %s for the screenshot</p>" % (message, first)))
+            report.extras = new_extras
+        else:
+            cause = breaker.cause_of(nodeid, call.excinfo.value)
+            breaker.failed(nodeid, cause)
+        report.user_properties.append(("failure_cause", cause_text(cause)))
+    if report.when == "teardown":
+        breaker.finished(nodeid)
+
+
+def pytest_runtest_logreport(report):
+    # runs in the controller for reports of workers too
+    if history.path is None:
+        return
+    if report.failed:
+        causes = [value for name, value in report.user_properties if name == "failure_cause"]
+        history.add(report.nodeid, causes[0] if causes else "failed")
+    elif report.when == "call" and report.passed:
+        history.passed(report.nodeid)
+
+
+def pytest_sessionfinish(session):
+    if history.path is None:
+        return
+    try:
+        history.save()
+    except OSError as e:
+        log.warning("Failed to save failure history: %s", e)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not breaker.failures:
+        return
+    terminalreporter.write_sep("-", "failures by cause")
+    groups = sorted(breaker.failures.items(), key=lambda entry: len(entry[1]), reverse=True)
+    for cause, nodeids in groups:
+        tripped = [nodeid for nodeid, c in breaker.tripped.items() if c == cause]
+        terminalreporter.write_line(
+            "%3d failed%s  %s: %s"
+            % (
+                len(nodeids),
+                ", %d stopped by open circuit" % len(tripped) if tripped else "",
+                cause.kind,
+                cause_text(cause),
+            )
+        )
+        for nodeid in nodeids[:3]:
+            terminalreporter.write_line("      %s" % nodeid)
+        if len(nodeids) > 3:
+            terminalreporter.write_line("      ... %d more" % (len(nodeids) - 3))
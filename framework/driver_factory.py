@@ -0,0 +1,217 @@
+"""
+Build Chrome / Firefox drivers from a named profile.
+
+Profiles:
+  - default: browser defaults, same as webdriver.Chrome() / webdriver.Firefox()
+  - headless: default without UI
+  - fast: fastest startup and page loads for CI, i.e.
+      headless, no GPU, no extensions, eager page load strategy (driver.get returns
+      on DOMContentLoaded, not after all images etc. are loaded), and a user data dir
+      copied from a pre-seeded template so first-run work is not repeated per launch.
+
+Choose the profile for tests by --driver-profile or driver_profile in pytest.ini.
+
+Seeded user data dirs are kept in .driver_profiles/<browser>-<profile>. Delete the dir to re-seed,
+e.g. after a browser upgrade.
+
+Startup benchmark, p50/p95 of cold (empty user data dir) and warm (seeded user data dir) startup:
+    python -m framework.driver_factory --browser Chrome --runs 10
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from selenium import webdriver
+
+from conftest import log
+
+DEFAULT_BROWSER = "Chrome"
+DEFAULT_PROFILE = "default"
+
+PROFILES = {
+    "default": {},
+    "headless": {"headless": True},
+    "fast": {
+        "headless": True,
+        "disable_gpu": True,
+        "disable_extensions": True,
+        "page_load_strategy": "eager",
+        "seeded_user_data_dir": True,
+    },
+}
+
+# templates of seeded user data dirs
+SEEDED_PROFILES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".driver_profiles"
+)
+# caches are not worth copying per launch
+_SEED_IGNORE = shutil.ignore_patterns(
+    "Cache", "Code Cache", "GPUCache", "GrShaderCache", "ShaderCache", "cache2"
+)
+_seed_lock = threading.Lock()
+
+
+def chrome_options(settings, user_data_dir=None, proxy=None):
+    options = webdriver.ChromeOptions()
+    if proxy:
+        options.add_argument("--proxy-server=http://%s" % proxy)
+        # let the local site server of framework/site_replay.py bypass the proxy
+        options.add_argument("--proxy-bypass-list=<-loopback>")
+    if settings.get("headless"):
+        options.add_argument("--headless=new")
+    if settings.get("disable_gpu"):
+        options.add_argument("--disable-gpu")
+    if settings.get("disable_extensions"):
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-component-extensions-with-background-pages")
+    if settings.get("page_load_strategy"):
+        options.page_load_strategy = settings["page_load_strategy"]
+    if user_data_dir:
+        options.add_argument("--user-data-dir=%s" % user_data_dir)
+        options.add_argument("--no-first-run")
+        options.add_argument("--no-default-browser-check")
+    return options
+
+
+def firefox_options(settings, user_data_dir=None, proxy=None):
+    options = webdriver.FirefoxOptions()
+    if proxy:
+        host, port = proxy.rsplit(":", 1)
+        options.set_preference("network.proxy.type", 1)
+        for scheme in ("http", "ssl"):
+            options.set_preference("network.proxy.%s" % scheme, host)
+            options.set_preference("network.proxy.%s_port" % scheme, int(port))
+    if settings.get("headless"):
+        options.add_argument("-headless")
+    if settings.get("disable_gpu"):
+        options.set_preference("layers.acceleration.disabled", True)
+    if settings.get("disable_extensions"):
+        # don't load extensions from any install location
+        options.set_preference("extensions.enabledScopes", 0)
+        options.set_preference("extensions.autoDisableScopes", 15)
+    if settings.get("page_load_strategy"):
+        options.page_load_strategy = settings["page_load_strategy"]
+    if user_data_dir:
+        options.add_argument("-profile")
+        options.add_argument(user_data_dir)
+        options.set_preference("browser.shell.checkDefaultBrowser", False)
+        options.set_preference("datareporting.policy.dataSubmissionEnabled", False)
+    return options
+
+
+def _launch(browser, settings, user_data_dir=None, proxy=None):
+    if str(browser).lower() == "firefox":
+        return webdriver.Firefox(options=firefox_options(settings, user_data_dir, proxy))
+    return webdriver.Chrome(options=chrome_options(settings, user_data_dir, proxy))
+
+
+def seeded_user_data_dir(browser, profile):
+    """Return the template user data dir of browser and profile, seeding it by a first launch if missing."""
+    template = os.path.join(SEEDED_PROFILES_DIR, "%s-%s" % (str(browser).lower(), profile))
+    with _seed_lock:
+        if not os.path.isdir(template):
+            log.info("Seeding %s user data dir %s...", browser, template)
+            os.makedirs(template)
+            try:
+                driver = _launch(browser, PROFILES[profile], template)
+                driver.get("about:blank")
+                driver.quit()
+            except Exception:
+                shutil.rmtree(template, ignore_errors=True)
+                raise
+    return template
+
+
+def create_driver(
+    browser=DEFAULT_BROWSER, profile=DEFAULT_PROFILE, user_data_dir=None, proxy=None
+):
+    """Create a Chrome or Firefox driver with the options of a named profile.
+
+    user_data_dir overrides the seeded user data dir of profiles using one.
+    proxy: "host:port" of an HTTP proxy for all requests.
+    """
+    try:
+        settings = PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            "Unknown driver profile '%s', choose from %s" % (profile, sorted(PROFILES))
+        )
+
+    tmp_dir = None
+    if user_data_dir is None and settings.get("seeded_user_data_dir"):
+        template = seeded_user_data_dir(browser, profile)
+        # each driver gets its own copy as browsers lock their user data dir
+        tmp_dir = tempfile.TemporaryDirectory(prefix="driver-profile-")
+        user_data_dir = os.path.join(tmp_dir.name, "profile")
+        shutil.copytree(template, user_data_dir, ignore=_SEED_IGNORE)
+
+    driver = _launch(browser, settings, user_data_dir, proxy)
+    if tmp_dir is not None:
+        # removed once the driver is garbage collected
+        driver._user_data_dir = tmp_dir
+    return driver
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values, pct in 0..100."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def benchmark_startup(browser=DEFAULT_BROWSER, profile=DEFAULT_PROFILE, runs=5):
+    """Time create_driver() + quit() runs, cold with an empty user data dir and warm from the seeded one.
+
+    Return {"cold": [secs], "warm": [secs]}.
+    """
+    settings = PROFILES[profile]
+    timings = {"cold": [], "warm": []}
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="driver-cold-") as cold_dir:
+            start = time.perf_counter()
+            driver = _launch(browser, settings, cold_dir)
+            timings["cold"].append(time.perf_counter() - start)
+            driver.quit()
+
+    template = seeded_user_data_dir(browser, profile)
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory(prefix="driver-warm-") as warm_dir:
+            start = time.perf_counter()
+            user_data_dir = os.path.join(warm_dir, "profile")
+            shutil.copytree(template, user_data_dir, ignore=_SEED_IGNORE)
+            driver = _launch(browser, settings, user_data_dir)
+            timings["warm"].append(time.perf_counter() - start)
+            driver.quit()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark driver startup per profile.")
+    parser.add_argument("--browser", default=DEFAULT_BROWSER)
+    parser.add_argument(
+        "--profile", action="append", choices=sorted(PROFILES), help="default: all"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print("%-10s %-5s %8s %8s" % ("profile", "start", "p50(s)", "p95(s)"))
+    for profile in args.profile or sorted(PROFILES):
+        timings = benchmark_startup(args.browser, profile, args.runs)
+        for kind in ("cold", "warm"):
+            print(
+                "%-10s %-5s %8.2f %8.2f"
+                % (
+                    profile,
+                    kind,
+                    percentile(timings[kind], 50),
+                    percentile(timings[kind], 95),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
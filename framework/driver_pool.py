@@ -0,0 +1,470 @@
+"""
+Session-scoped pool of warm WebDriver instances.
+
+Launching a browser is the largest fixed cost of a test, so instead of
+webdriver.Chrome() / driver.quit() per test, drivers are kept open for the
+whole session and handed out again after their state is reset:
+  - the test's windows are closed and replaced by a new blank tab, which has no
+    sessionStorage or history
+  - cookies and localStorage of every origin the test visited are cleared, i.e. the
+    origins of its driver.get() URLs and of the pages its windows were left on
+  - timeouts are restored to the WebDriver defaults
+  - the window gets the size and position it had when the driver was launched
+
+Drivers are built by framework/driver_factory.py and keyed by browser type and
+launch options, e.g. ("chrome", (("profile", "fast"),)).
+
+A driver is recycled, i.e. quit and replaced by a new one on next acquire, when:
+  - it has served `driver_max_uses` tests (ini option or --driver-max-uses, 0 means never)
+  - the test using it failed, so the next test doesn't inherit a broken browser
+  - the reset fails, e.g. the browser crashed
+
+Pre-warming (opt-in, --prewarm-drivers or driver_prewarm in pytest.ini):
+While a test runs, the driver needed by the next collected test is launched on a
+background thread if the pool won't have one idle for it, e.g. the next test is
+parametrized with another browser, or the current driver is about to be recycled
+or its test failed. Setup wait time and pre-warmed launches which were never used
+are shown in the terminal summary.
+
+Usage:
+    def test_xxx(wd):
+        wd.get("https://www.python.org/")
+
+    @pytest.mark.parametrize("browser", browser_list)
+    def test_yyy(browser, wd):  # wd is a driver of the parametrized browser
+        ...
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pytest
+
+from conftest import driver_key, log, register_driver
+from framework.driver_factory import (
+    DEFAULT_BROWSER,
+    DEFAULT_PROFILE,
+    PROFILES,
+    create_driver,
+)
+from framework import page_metrics
+from framework.page_metrics import track_page_loads
+from framework.timing import instrument
+
+# recycle drivers after this many tests to limit memory growth of long living browsers
+DEFAULT_MAX_USES = 50
+# WebDriver default page load timeout, restored on reset as tests may change it.
+DEFAULT_PAGE_LOAD_TIMEOUT = 300
+
+# key to keep the reports of all phases of a test, so fixtures know if the test failed on teardown.
+phase_report_key = pytest.StashKey[dict]()
+# session DriverPool, for hooks
+pool_key = pytest.StashKey["DriverPool"]()
+# browsers of collected tests using the "wd" fixture, in run order: (nodeids, browsers)
+browser_order_key = pytest.StashKey[tuple]()
+# create_driver() options set by other plugins for all drivers, e.g. {"proxy": "127.0.0.1:8080"}
+launch_options_key = pytest.StashKey[dict]()
+
+
+CLEAR_STORAGE_JS = "try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}"
+
+
+def _origin(url):
+    """Origin of an http(s) URL, None for others like about:blank or data: URLs."""
+    parts = urlsplit(str(url))
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    return "%s://%s" % (parts.scheme, parts.netloc)
+
+
+def remember_origin(driver, url):
+    """Page load guard: note the origin of each page a driver loads, reset_driver() clears it."""
+    origin = _origin(url)
+    if origin:
+        driver.__dict__.setdefault("_visited_origins", set()).add(origin)
+
+
+def clear_browser_data(driver, origins):
+    """Clear cookies and storage of origins, e.g. {"https://www.python.org"}."""
+    # Chromium clears all cookies, and storage of any origin, via DevTools.
+    if hasattr(driver, "execute_cdp_cmd"):
+        try:
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            for origin in sorted(origins):
+                driver.execute_cdp_cmd(
+                    "Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"}
+                )
+            return
+        except Exception as e:
+            log.warning("Failed to clear browser data via CDP, clearing each origin instead: %s", e)
+
+    # WebDriver only reaches the cookies and storage of the current document's origin,
+    # so visit each origin. The class' get(), as the "wd" driver's get() records page metrics.
+    for origin in sorted(origins):
+        try:
+            type(driver).get(driver, origin + "/robots.txt")
+            driver.execute_script(CLEAR_STORAGE_JS)
+            driver.delete_all_cookies()
+        except Exception as e:
+            log.warning("Failed to clear cookies and storage of %s: %s", origin, e)
+
+
+def reset_driver(driver, window_rect=None):
+    """Reset browser state so the driver can be reused by the next test.
+
+    window_rect: dict of x, y, width and height to restore, e.g. of get_window_rect() at launch.
+    Raise an exception if the browser is not usable any more.
+    """
+    origins = driver.__dict__.pop("_visited_origins", set())
+    handles = driver.window_handles
+    for handle in handles:
+        driver.switch_to.window(handle)
+        origins.add(_origin(driver.current_url))
+    origins.discard(None)
+
+    # sessionStorage and history belong to a tab, so replace the test's tabs by a new one
+    driver.switch_to.new_window("tab")
+    blank = driver.current_window_handle
+    for handle in handles:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(blank)
+
+    clear_browser_data(driver, origins)
+
+    driver.implicitly_wait(0)
+    driver.set_page_load_timeout(DEFAULT_PAGE_LOAD_TIMEOUT)
+    driver.get("about:blank")
+    if window_rect:
+        # also leaves the maximized or fullscreen state
+        driver.set_window_rect(**window_rect)
+
+    # drop per-test data attached to the driver, e.g. by ScreenshotListener
+    driver.__dict__.pop("_last_screenshot", None)
+
+
+class DriverPool:
+    """Keep idle drivers per (browser, options) key and hand them out on acquire."""
+
+    def __init__(self, launcher=create_driver, max_uses=DEFAULT_MAX_USES):
+        self.launcher = launcher
+        self.max_uses = max_uses
+        # key -> list of idle drivers
+        self._idle = {}
+        # key -> list of futures of drivers being launched in background
+        self._warming = {}
+        # driver -> [key, uses, window rect at launch]
+        self._info = {}
+        self._executor = None
+        self.launched = 0
+        self.reused = 0
+        self.recycled = 0
+        self.prewarmed = 0
+        self.prewarmed_unused = 0
+        # total secs tests waited in acquire for a driver, and number of acquires
+        self.wait_time = 0.0
+        self.acquired = 0
+
+    @staticmethod
+    def make_key(browser, options):
+        return (str(browser).lower(), tuple(sorted(options.items())))
+
+    def acquire(self, browser=DEFAULT_BROWSER, **options):
+        """Return a warm driver for browser and options, launching one if none is idle."""
+        start = time.perf_counter()
+        try:
+            return self._acquire(browser, options)
+        finally:
+            self.wait_time += time.perf_counter() - start
+            self.acquired += 1
+
+    def _acquire(self, browser, options):
+        key = self.make_key(browser, options)
+        idle = self._idle.get(key)
+        if idle:
+            self.reused += 1
+            return idle.pop()
+
+        warming = self._warming.get(key)
+        while warming:
+            try:
+                driver = warming.pop(0).result()
+            except Exception as e:
+                log.warning("Pre-warmed %s driver failed to launch: %s", browser, e)
+                continue
+            self._register(driver, key)
+            return driver
+
+        log.info("Launching new %s driver...", browser)
+        start = time.perf_counter()
+        driver = self.launcher(browser, **options)
+        log.info("Launched %s driver in %.2fs", browser, time.perf_counter() - start)
+        self.launched += 1
+        self._register(driver, key)
+        return driver
+
+    def _register(self, driver, key):
+        try:
+            rect = driver.get_window_rect()
+        except Exception as e:
+            log.warning("Failed to get window size of new driver, it won't be restored: %s", e)
+            rect = None
+        self._info[driver] = [key, 0, rect]
+
+    def available(self, browser=DEFAULT_BROWSER, **options):
+        """Number of drivers idle or being launched for browser and options."""
+        key = self.make_key(browser, options)
+        return len(self._idle.get(key, ())) + len(self._warming.get(key, ()))
+
+    def will_return(self, driver):
+        """Whether driver is expected back in the pool after its current test passes."""
+        info = self._info.get(driver)
+        return info is not None and not (self.max_uses and info[1] + 1 >= self.max_uses)
+
+    def key_of(self, driver):
+        info = self._info.get(driver)
+        return info[0] if info else None
+
+    def prewarm(self, browser=DEFAULT_BROWSER, **options):
+        """Launch a driver on a background thread, it is handed out by a later acquire."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="driver-prewarm"
+            )
+        key = self.make_key(browser, options)
+        log.info("Pre-warming %s driver in background...", browser)
+        future = self._executor.submit(self._launch_in_background, browser, options)
+        self._warming.setdefault(key, []).append(future)
+        self.prewarmed += 1
+        self.launched += 1
+
+    def _launch_in_background(self, browser, options):
+        start = time.perf_counter()
+        driver = self.launcher(browser, **options)
+        log.info(
+            "Pre-warmed %s driver in %.2fs", browser, time.perf_counter() - start
+        )
+        return driver
+
+    def release(self, driver, failed=False):
+        """Return a driver to the pool after a test, or recycle it."""
+        info = self._info.get(driver)
+        if info is None:
+            driver.quit()
+            return
+        info[1] += 1
+
+        if failed:
+            reason = "test failed"
+        elif self.max_uses and info[1] >= self.max_uses:
+            reason = "served %d tests" % info[1]
+        else:
+            try:
+                reset_driver(driver, window_rect=info[2])
+            except Exception as e:
+                reason = "reset failed: %s" % e
+            else:
+                self._idle.setdefault(info[0], []).append(driver)
+                return
+
+        log.info("Recycling %s driver, %s", info[0][0], reason)
+        self.recycled += 1
+        self.discard(driver)
+
+    def discard(self, driver):
+        """Quit a driver and forget it."""
+        self._info.pop(driver, None)
+        try:
+            driver.quit()
+        except Exception as e:
+            log.warning("Failed to quit driver: %s", e)
+
+    def close(self):
+        """Quit all drivers, idle, in use or still being launched."""
+        for futures in self._warming.values():
+            for future in futures:
+                self.prewarmed_unused += 1
+                try:
+                    future.result().quit()
+                except Exception as e:
+                    log.warning("Failed to quit pre-warmed driver: %s", e)
+        self._warming.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        for driver in list(self._info):
+            self.discard(driver)
+        self._idle.clear()
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "driver_max_uses",
+        "Recycle a pooled driver after it served this many tests, 0 means never.",
+        default=str(DEFAULT_MAX_USES),
+    )
+    parser.addoption(
+        "--driver-max-uses",
+        type=int,
+        default=None,
+        help="Recycle a pooled driver after it served this many tests, 0 means never. "
+        "Overrides driver_max_uses in pytest.ini. Use 1 to launch a new browser per test.",
+    )
+    parser.addini(
+        "driver_prewarm",
+        "Launch the driver needed by the next test in background.",
+        type="bool",
+        default=False,
+    )
+    parser.addoption(
+        "--prewarm-drivers",
+        action="store_true",
+        default=None,
+        help="Launch the driver needed by the next test in background while the current test runs.",
+    )
+    parser.addini(
+        "driver_profile",
+        "Driver profile of framework/driver_factory.py, e.g. default or fast.",
+        default=DEFAULT_PROFILE,
+    )
+    parser.addoption(
+        "--driver-profile",
+        choices=sorted(PROFILES),
+        default=None,
+        help="Driver profile, e.g. 'fast' for headless and fast startup. "
+        "Overrides driver_profile in pytest.ini.",
+    )
+
+
+def pytest_configure(config):
+    page_metrics.page_load_guards.append(remember_origin)
+
+
+def pytest_unconfigure(config):
+    if remember_origin in page_metrics.page_load_guards:
+        page_metrics.page_load_guards.remove(remember_origin)
+
+
+def _item_browser(item):
+    """Browser of a test, from its "browser" parameter if parametrized."""
+    callspec = getattr(item, "callspec", None)
+    if callspec is not None:
+        return callspec.params.get("browser", DEFAULT_BROWSER)
+    return DEFAULT_BROWSER
+
+
+def driver_options(config):
+    """create_driver() options of the "wd" drivers, except the browser."""
+    options = {
+        "profile": config.getoption("driver_profile") or config.getini("driver_profile")
+    }
+    options.update(config.stash.get(launch_options_key, {}))
+    return options
+
+
+def _prewarm_enabled(config):
+    enabled = config.getoption("prewarm_drivers")
+    if enabled is None:
+        enabled = config.getini("driver_prewarm")
+    return enabled
+
+
+def pytest_collection_finish(session):
+    items = [item for item in session.items if "wd" in getattr(item, "fixturenames", ())]
+    session.config.stash[browser_order_key] = (
+        {item.nodeid: i for i, item in enumerate(items)},
+        [_item_browser(item) for item in items],
+    )
+
+
+def _prewarm_next(item, driver, failed=False):
+    """Pre-warm the driver for the test after item, unless one will be available anyway."""
+    config = item.config
+    pool = config.stash.get(pool_key, None)
+    if pool is None or not _prewarm_enabled(config):
+        return
+    positions, browsers = config.stash.get(browser_order_key, ({}, []))
+    position = positions.get(item.nodeid)
+    if position is None or position + 1 >= len(browsers):
+        return
+
+    next_browser = browsers[position + 1]
+    options = driver_options(config)
+    available = pool.available(next_browser, **options)
+    if (
+        not failed
+        and pool.will_return(driver)
+        and pool.key_of(driver) == pool.make_key(next_browser, options)
+    ):
+        # current driver goes back to the pool for the next test
+        available += 1
+    if available == 0:
+        pool.prewarm(next_browser, **options)
+
+
+@pytest.hookimpl(hookwrapper=True, tryfirst=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    item.stash.setdefault(phase_report_key, {})[report.when] = report
+
+    # the driver of a failed test is recycled, start its replacement right away
+    if report.failed and report.when == "call":
+        driver = item.stash.get(driver_key, None)
+        if driver is not None:
+            _prewarm_next(item, driver, failed=True)
+
+
+@pytest.fixture(scope="session")
+def driver_pool(pytestconfig):
+    max_uses = pytestconfig.getoption("driver_max_uses")
+    if max_uses is None:
+        max_uses = int(pytestconfig.getini("driver_max_uses"))
+    pool = DriverPool(max_uses=max_uses)
+    pytestconfig.stash[pool_key] = pool
+    yield pool
+    log.info(
+        "Driver pool: launched %d, reused %d, recycled %d",
+        pool.launched,
+        pool.reused,
+        pool.recycled,
+    )
+    pool.close()
+
+
+@pytest.fixture
+def wd(request, driver_pool):
+    """A warm driver from the pool, for the "browser" parameter of the test if any."""
+    browser = _item_browser(request.node)
+    driver = driver_pool.acquire(browser, **driver_options(request.config))
+    # so conftest can find the driver for failure screenshots
+    register_driver(request.node, driver)
+    instrument(driver)
+    track_page_loads(driver)
+    _prewarm_next(request.node, driver)
+    yield driver
+
+    reports = request.node.stash.get(phase_report_key, {})
+    failed = any(report.failed for report in reports.values())
+    driver_pool.release(driver, failed=failed)
+
+
+def pytest_terminal_summary(terminalreporter):
+    pool = terminalreporter.config.stash.get(pool_key, None)
+    if pool is None:
+        return
+    terminalreporter.write_sep("-", "driver pool")
+    terminalreporter.write_line(
+        "launched %d (pre-warmed %d), reused %d, recycled %d"
+        % (pool.launched, pool.prewarmed, pool.reused, pool.recycled)
+    )
+    terminalreporter.write_line(
+        "setup waited %.2fs for drivers over %d tests"
+        % (pool.wait_time, pool.acquired)
+    )
+    if pool.prewarmed:
+        terminalreporter.write_line(
+            "pre-warmed launches never used: %d" % pool.prewarmed_unused
+        )
@@ -0,0 +1,134 @@
+"""
+Element presence checks with their own wait budget.
+
+driver.find_element() waits up to the implicit wait (TIMEWAIT_ELEMENT_LOAD, 15s in the page model tests)
+before raising NoSuchElementException, so checking that an element is absent always costs the full
+implicit wait. The helpers here switch the implicit wait off for the call and poll within their own
+timeout instead, 0 by default, i.e. check once.
+
+elements_present() checks a batch of locators in a single execute_script round trip,
+and element_texts() reads the text of all elements matching a locator in one round trip.
+
+Usage:
+    is_element_present(wd, By.NAME, "q")
+    is_element_absent(wd, By.ID, "spinner", timeout=5)
+    elements_present(wd, [(By.NAME, "q"), (By.ID, "search")])  # {(By.NAME, "q"): True, ...}
+    element_texts(wd, By.CSS_SELECTOR, "ul li")  # ["text of 1st li", ...]
+"""
+
+import time
+from contextlib import contextmanager
+
+from selenium.webdriver.common.by import By
+
+POLL_INTERVAL = 0.1
+
+# Resolve a selenium locator (By.X, value) in the page to an array of elements.
+_LOCATE_ALL_JS = """
+function locateAll(by, value) {
+  switch (by) {
+    case "id": return Array.from(document.querySelectorAll("[id='" + CSS.escape(value) + "']"));
+    case "name": return Array.from(document.getElementsByName(value));
+    case "class name": return Array.from(document.getElementsByClassName(value));
+    case "tag name": return Array.from(document.getElementsByTagName(value));
+    case "css selector": return Array.from(document.querySelectorAll(value));
+    case "xpath":
+      var found = document.evaluate(value, document, null,
+        XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+      var nodes = [];
+      for (var i = 0; i < found.snapshotLength; i++) nodes.push(found.snapshotItem(i));
+      return nodes;
+    case "link text":
+    case "partial link text":
+      return Array.from(document.getElementsByTagName("a")).filter(function (link) {
+        var text = link.innerText.trim();
+        return by === "link text" ? text === value : text.indexOf(value) !== -1;
+      });
+  }
+  throw new Error("Unsupported locator: " + by);
+}
+"""
+
+# arguments[0] is [[by, value], ...], return [present, ...]
+_BATCH_PRESENCE_JS = (
+    _LOCATE_ALL_JS
+    + """
+return arguments[0].map(function (locator) {
+  return locateAll(locator[0], locator[1]).length > 0;
+});
+"""
+)
+
+# arguments[0], arguments[1] are by, value, return [text, ...]
+_TEXTS_JS = (
+    _LOCATE_ALL_JS
+    + """
+return locateAll(arguments[0], arguments[1]).map(function (elem) {
+  return elem.innerText.trim();
+});
+"""
+)
+
+
+@contextmanager
+def implicit_wait_off(driver):
+    """Switch the implicit wait off inside the block and restore it after."""
+    try:
+        implicit_wait = driver.timeouts.implicit_wait
+    except Exception:
+        implicit_wait = 0
+    driver.implicitly_wait(0)
+    try:
+        yield
+    finally:
+        driver.implicitly_wait(implicit_wait)
+
+
+def _poll(check, timeout):
+    """Call check() until it returns True or timeout secs passed, at least once."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        if check():
+            return True
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return False
+        time.sleep(min(POLL_INTERVAL, remaining))
+
+
+def is_element_present(driver, by, value, timeout=0):
+    """Whether an element is found within timeout secs, without waiting for the implicit wait."""
+    with implicit_wait_off(driver):
+        return _poll(lambda: len(driver.find_elements(by, value)) > 0, timeout)
+
+
+def is_element_present_by_xpath(driver, xpath, timeout=0):
+    return is_element_present(driver, By.XPATH, xpath, timeout)
+
+
+def is_element_absent(driver, by, value, timeout=0):
+    """Whether no element is found within timeout secs, e.g. a spinner went away."""
+    with implicit_wait_off(driver):
+        return _poll(lambda: len(driver.find_elements(by, value)) == 0, timeout)
+
+
+def elements_present(driver, locators, timeout=0):
+    """Check a list of (by, value) locators in one round trip per poll.
+
+    Poll until all are present or timeout secs passed, and return {locator: present}.
+    """
+    locators = [tuple(locator) for locator in locators]
+    result = {}
+
+    def check():
+        found = driver.execute_script(_BATCH_PRESENCE_JS, [list(l) for l in locators])
+        result.update(zip(locators, found))
+        return all(found)
+
+    _poll(check, timeout)
+    return result
+
+
+def element_texts(driver, by, value):
+    """Texts of all elements matching a locator, in one round trip instead of one per element."""
+    return driver.execute_script(_TEXTS_JS, by, value)
@@ -0,0 +1,429 @@
+"""
+Change-impact test selection: run only the tests which use code or sites that changed.
+
+1. Record which page object code and URLs each test uses, with a full run:
+       pytest --impact-trace
+   Calls into the impact_sources files (pytest.ini, default pages.py framework/page.py
+   framework/elements.py) and into the test files are traced during setup, call and teardown of
+   each test, e.g. PyPiSearchResultPage.getSearchResultText or is_element_present, and so are
+   the URLs the test loads. The map is saved to .impact_map.json (impact_map in pytest.ini),
+   only by runs of all tests.
+
+2. Later runs select or reorder the tests affected by changes since the map was recorded:
+       pytest --impact select        # deselect unaffected tests
+       pytest --impact prioritise    # run affected tests first, then the rest
+       pytest --impact select --impact-urls pypi.org   # also tests which loaded matching URLs
+
+Changes are found by file hashes, so uncommitted edits count too and git isn't needed. Traced
+files are compared function by function: the AST of each function and method, of each class
+body without its methods, and of the module body without classes and functions. A test is
+affected when a unit it used changed, i.e. its own test function, a page object method it
+called, the class of such a method (e.g. its locators) or the module of any unit it used.
+Tests which aren't in the map, e.g. new ones, and tests which didn't pass when it was recorded
+always run.
+
+Everything runs when the map is missing, older than impact_max_age_days (default 7) or was
+recorded by another map version, or when any other watched file changed (conftest.py,
+framework plugins, pytest.ini, smoke tables, ...), as their effect on tests isn't traced.
+"""
+
+import ast
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+import pytest
+
+from conftest import log
+from framework import page_metrics
+from framework.timing import current_test
+
+MAP_VERSION = 1
+DEFAULT_SOURCES = "pages.py framework/page.py framework/elements.py"
+DEFAULT_MAX_AGE_DAYS = 7
+MODES = ("off", "select", "prioritise")
+# files whose changes are checked, relative to the rootdir
+WATCHED = ("*.py", "*.ini", "*.cfg", "*.toml", "*.csv", "requirements*.txt")
+NORECURSE = (".*", "__pycache__", "venv", "build", "dist", "*.egg-info", "timings", "artifacts")
+MODULE_UNIT = "<module>"
+
+
+def _digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def watched_files(root):
+    """{relative path: sha1} of the watched files under root."""
+    hashes = {}
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not any(fnmatch.fnmatch(d, p) for p in NORECURSE))
+        for name in files:
+            if any(fnmatch.fnmatch(name, p) for p in WATCHED):
+                path = os.path.join(directory, name)
+                with open(path, "rb") as f:
+                    hashes[os.path.relpath(path, root).replace(os.sep, "/")] = _digest(f.read())
+    return hashes
+
+
+def unit_hashes(path, relpath):
+    """{"<relpath>::<unit>": hash} of the functions, methods, class bodies and module body."""
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read(), filename=path)
+    units = {}
+
+    def add(name, node):
+        # ast.dump() leaves out line numbers, moving code around doesn't change a unit
+        units["%s::%s" % (relpath, name)] = _digest(ast.dump(node).encode())
+
+    rest = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            add(node.name, node)
+        elif isinstance(node, ast.ClassDef):
+            body = []
+            for stmt in node.body:
+                if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    add("%s.%s" % (node.name, stmt.name), stmt)
+                else:
+                    body.append(stmt)
+            add(node.name, ast.ClassDef(node.name, node.bases, node.keywords, body, node.decorator_list))
+        else:
+            rest.append(node)
+    add(MODULE_UNIT, ast.Module(rest, []))
+    return units
+
+
+def _unit_of(qualname):
+    """Unit of a code object's qualified name: its outermost function, or method."""
+    return qualname.split(".<locals>", 1)[0]
+
+
+class Tracer:
+    """Units of the traced files called by each test, and URLs it loaded."""
+
+    def __init__(self, root, sources):
+        self.root = root
+        # absolute path -> relative path of traced files
+        self.sources = {os.path.join(root, s): s for s in sources}
+        # nodeid -> set of units
+        self.units = {}
+        # nodeid -> set of URLs
+        self.urls = {}
+        # nodeids of tests which failed or errored
+        self.failed = set()
+        # code object -> unit, or None for code outside the traced files
+        self._code_units = {}
+        self._current = None
+
+    def add_source(self, path):
+        self.sources.setdefault(path, os.path.relpath(path, self.root).replace(os.sep, "/"))
+
+    def _profile(self, frame, event, arg):
+        if event != "call":
+            return
+        code = frame.f_code
+        unit = self._code_units.get(code, False)
+        if unit is False:
+            relpath = self.sources.get(code.co_filename)
+            unit = "%s::%s" % (relpath, _unit_of(code.co_qualname)) if relpath else None
+            self._code_units[code] = unit
+        if unit is not None and self._current is not None:
+            self._current.add(unit)
+
+    def start(self, nodeid):
+        self._current = self.units.setdefault(nodeid, set())
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        sys.setprofile(None)
+        self._current = None
+
+    def page_loaded(self, driver, metrics):
+        nodeid = current_test()
+        if nodeid:
+            parts = urlsplit(metrics["url"])
+            self.urls.setdefault(nodeid, set()).add("%s://%s%s" % (parts.scheme, parts.netloc, parts.path))
+
+    def merge(self, units, urls, failed):
+        """Add the traces of an xdist worker."""
+        for nodeid, names in units.items():
+            self.units.setdefault(nodeid, set()).update(names)
+        for nodeid, names in urls.items():
+            self.urls.setdefault(nodeid, set()).update(names)
+        self.failed.update(failed)
+
+    def dependencies(self, nodeid):
+        """Units a test used, with the classes of its methods and the modules of all of them."""
+        units = set(self.units.get(nodeid, ()))
+        for unit in list(units):
+            relpath, name = unit.split("::", 1)
+            units.add("%s::%s" % (relpath, MODULE_UNIT))
+            if "." in name:
+                units.add("%s::%s" % (relpath, name.split(".", 1)[0]))
+        return units
+
+    def build_map(self, nodeids):
+        sources = sorted(set(self.sources.values()))
+        units = {}
+        for path, relpath in self.sources.items():
+            if os.path.exists(path):
+                units.update(unit_hashes(path, relpath))
+        return {
+            "version": MAP_VERSION,
+            "created": time.time(),
+            "files": watched_files(self.root),
+            "sources": sources,
+            "units": units,
+            "tests": {
+                nodeid: {
+                    "units": sorted(self.dependencies(nodeid)),
+                    "urls": sorted(self.urls.get(nodeid, ())),
+                    "failed": nodeid in self.failed,
+                }
+                for nodeid in nodeids
+            },
+        }
+
+
+def affected_tests(impact_map, root, test_files=(), url_patterns=(), max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """(nodeids affected by changes since impact_map, reason) or (None, reason) to run all.
+
+    test_files: relative paths of collected test files, their new tests aren't in the map.
+    """
+    if impact_map is None:
+        return None, "no impact map, record one with --impact-trace"
+    if impact_map.get("version") != MAP_VERSION:
+        return None, "impact map of another version"
+    age_days = (time.time() - impact_map.get("created", 0)) / 86400
+    if max_age_days and age_days > max_age_days:
+        return None, "impact map is %.0f days old" % age_days
+
+    files = watched_files(root)
+    recorded = impact_map["files"]
+    changed = sorted(f for f in set(files) | set(recorded) if files.get(f) != recorded.get(f))
+    sources = set(impact_map["sources"]) | set(test_files)
+    untraced = [f for f in changed if f not in sources]
+    if untraced:
+        return None, "untraced files changed: %s" % ", ".join(untraced)
+
+    changed_units = set()
+    for relpath in changed:
+        path = os.path.join(root, relpath)
+        current = unit_hashes(path, relpath) if os.path.exists(path) else {}
+        prefix = relpath + "::"
+        previous = {u: h for u, h in impact_map["units"].items() if u.startswith(prefix)}
+        changed_units.update(u for u in set(current) | set(previous) if current.get(u) != previous.get(u))
+
+    affected = set()
+    for nodeid, entry in impact_map["tests"].items():
+        if entry["failed"] or changed_units.intersection(entry["units"]):
+            affected.add(nodeid)
+        elif any(pattern in url for pattern in url_patterns for url in entry["urls"]):
+            affected.add(nodeid)
+    reason = "changed: %s" % (", ".join(sorted(changed_units)) or "nothing")
+    if url_patterns:
+        reason += "; URLs matching %s" % ", ".join(url_patterns)
+    return affected, reason
+
+
+def load_map(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def pytest_addoption(parser):
+    parser.addini("impact_map", "File of the tests' page object and URL usage.", default=".impact_map.json")
+    parser.addini(
+        "impact_sources",
+        "Files whose calls are traced for change-impact selection, besides test files.",
+        default=DEFAULT_SOURCES,
+    )
+    parser.addini(
+        "impact_max_age_days",
+        "Run all tests if the impact map is older, 0 for no limit.",
+        default=str(DEFAULT_MAX_AGE_DAYS),
+    )
+    parser.addoption(
+        "--impact-trace",
+        action="store_true",
+        default=False,
+        help="Record the page object code and URLs each test uses, for --impact.",
+    )
+    parser.addoption(
+        "--impact",
+        choices=MODES,
+        default="off",
+        help="select: run only tests affected by changes since --impact-trace, "
+        "prioritise: run them first.",
+    )
+    parser.addoption(
+        "--impact-urls",
+        default="",
+        help="With --impact: also tests which loaded URLs containing any of these, comma separated.",
+    )
+
+
+tracer_key = pytest.StashKey[Tracer]()
+# (affected nodeids or None, reason, number selected)
+outcome_key = pytest.StashKey[tuple]()
+# why xdist workers didn't run all tests
+_partial = []
+
+
+def _map_path(config):
+    return os.path.join(str(config.rootpath), config.getini("impact_map"))
+
+
+def pytest_configure(config):
+    if not config.getoption("impact_trace"):
+        return
+    tracer = Tracer(str(config.rootpath), config.getini("impact_sources").split())
+    config.stash[tracer_key] = tracer
+    page_metrics.page_load_listeners.append(tracer.page_loaded)
+
+
+def _test_files(config, items):
+    return sorted({os.path.relpath(str(item.path), str(config.rootpath)).replace(os.sep, "/") for item in items})
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(session, config, items):
+    tracer = config.stash.get(tracer_key, None)
+    if tracer is not None:
+        for item in items:
+            tracer.add_source(str(item.path))
+
+    mode = config.getoption("impact")
+    if mode == "off":
+        return
+    patterns = [p.strip() for p in config.getoption("impact_urls").split(",") if p.strip()]
+    impact_map = load_map(_map_path(config))
+    affected, reason = affected_tests(
+        impact_map,
+        str(config.rootpath),
+        _test_files(config, items),
+        patterns,
+        float(config.getini("impact_max_age_days")),
+    )
+    if affected is None:
+        log.info("Impact selection: running all tests, %s", reason)
+        config.stash[outcome_key] = (None, reason, len(items))
+        return
+
+    known = impact_map["tests"]
+    hit, rest = [], []
+    for item in items:
+        (hit if item.nodeid in affected or item.nodeid not in known else rest).append(item)
+    if mode == "select":
+        if rest:
+            config.hook.pytest_deselected(items=rest)
+        items[:] = hit
+    else:
+        items[:] = hit + rest
+    config.stash[outcome_key] = (affected, reason, len(hit))
+    log.info("Impact selection: %d affected tests, %s", len(hit), reason)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_setup(item):
+    yield from _traced(item)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    yield from _traced(item)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_teardown(item):
+    yield from _traced(item)
+
+
+def _traced(item):
+    tracer = item.config.stash.get(tracer_key, None)
+    if tracer is not None:
+        tracer.start(item.nodeid)
+    try:
+        yield
+    finally:
+        if tracer is not None:
+            tracer.stop()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    tracer = item.config.stash.get(tracer_key, None)
+    if tracer is not None and outcome.get_result().failed:
+        tracer.failed.add(item.nodeid)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # pytest-xdist controller: workers send their traces, only the controller saves the map
+    output = getattr(node, "workeroutput", {})
+    tracer = node.config.stash.get(tracer_key, None)
+    if tracer is not None and "impact_units" in output:
+        tracer.merge(output["impact_units"], output["impact_urls"], output["impact_failed"])
+        _partial.extend(output["impact_partial"])
+
+
+def _partial_reason(session):
+    """Why this run didn't run all tests, None if it did."""
+    config = session.config
+    if config.getoption("impact") == "select":
+        return "--impact select"
+    if config.args_source == pytest.Config.ArgsSource.ARGS:
+        return "test paths given"
+    if config.option.collectonly:
+        return "--collect-only"
+    if session.testscollected != len(session.items):
+        return "tests deselected"
+    if session.shouldstop or session.shouldfail:
+        return "run stopped early"
+    return None
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    tracer = config.stash.get(tracer_key, None)
+    if tracer is None:
+        return
+    page_metrics.page_load_listeners.remove(tracer.page_loaded)
+    if hasattr(config, "workerinput"):
+        config.workeroutput["impact_units"] = {n: sorted(u) for n, u in tracer.units.items()}
+        config.workeroutput["impact_urls"] = {n: sorted(u) for n, u in tracer.urls.items()}
+        config.workeroutput["impact_failed"] = sorted(tracer.failed)
+        reason = _partial_reason(session)
+        config.workeroutput["impact_partial"] = [reason] if reason else []
+        return
+    # a map of part of the tests would hide changes from the others
+    reasons = _partial + [reason for reason in [_partial_reason(session)] if reason]
+    if not reasons and not tracer.units:
+        reasons = ["no test traced"]
+    if reasons:
+        log.warning("Impact map not saved, only runs of all tests record it: %s", reasons[0])
+        return
+    impact_map = tracer.build_map(sorted(tracer.units))
+    with open(_map_path(config), "w") as f:
+        json.dump(impact_map, f, indent=1, sort_keys=True)
+    log.info("Saved impact map of %d tests to %s", len(impact_map["tests"]), _map_path(config))
+
+
+def pytest_terminal_summary(terminalreporter):
+    outcome = terminalreporter.config.stash.get(outcome_key, None)
+    if outcome is None:
+        return
+    affected, reason, selected = outcome
+    terminalreporter.write_sep("-", "change impact")
+    if affected is None:
+        terminalreporter.write_line("all tests run: %s" % reason)
+    else:
+        terminalreporter.write_line("%d affected or new tests, %s" % (selected, reason))
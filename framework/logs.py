@@ -0,0 +1,245 @@
+"""
+Non-blocking logging for tests: loggers put records on a queue, a background thread writes them.
+
+setup_logger(log_file, level, name) returns a logger whose only handler is a QueueHandler, so a
+log.info() call formats its message and returns, and a QueueListener thread does the file I/O.
+  - one file per pytest-xdist worker: debug.log becomes debug_gw0.log etc.
+  - calling setup_logger() again for the same file returns the logger as is, no duplicate handlers
+  - records carry the nodeid and phase (setup, call, teardown) of the running test, and
+    log_test_start() writes a header line per test, so the log is split into one segment per test
+  - add_jsonl(logger, path) also writes JSONL records with time, level, nodeid, phase and message
+    (--log-jsonl or log_jsonl in pytest.ini for the conftest logger)
+Pending records are written at exit.
+
+Per-call overhead of a synchronous FileHandler vs the queue, --fsync to simulate a slow disk:
+    python -m framework.logs --calls 100000 [--fsync]
+"""
+
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# !!!!! don't directly call logging.basicConfig as it will also change selenium logging outputs. Set level DEBUG for debugging selenium !!!!!
+# %(levelname)7s to align 7 bytes to right, %(levelname)-7s to left.
+common_formatter = logging.Formatter(
+    "%(asctime)s [%(levelname)-7s][%(lineno)-3d]: %(message)s",
+    datefmt="%Y-%m-%d %I:%M:%S",
+)
+
+# log file -> its QueueListener
+_listeners = {}
+_lock = threading.Lock()
+
+# (nodeid, phase) of the test running in this context, set by the runtest hooks of conftest.py.
+# Unlike PYTEST_CURRENT_TEST, which is one per process, threads don't see the test the main thread
+# runs: work done for a test in background is submitted via contextvars.copy_context().run.
+_current_test = contextvars.ContextVar("current_test", default=(None, None))
+
+
+def set_current_test(nodeid, phase=None):
+    """Set the test running in this context, None when it finished."""
+    _current_test.set((nodeid, phase))
+
+
+def current_test_phase():
+    """(nodeid, phase) of the test running in this context, (None, None) outside tests."""
+    return _current_test.get()
+
+
+class TestContextFilter(logging.Filter):
+    """Add nodeid and phase of the running test to records, None outside tests."""
+
+    def filter(self, record):
+        record.nodeid, record.phase = _current_test.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "nodeid": getattr(record, "nodeid", None),
+            "phase": getattr(record, "phase", None),
+            "file": record.filename,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        return json.dumps(entry)
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler doing as little as possible in the calling thread."""
+
+    def prepare(self, record):
+        # Merge the args now as they may change later, leave formatting incl. exc_info to the
+        # listener thread. The record isn't copied, it's not used by the caller afterwards.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def worker_log_file(log_file):
+    """log_file of this pytest-xdist worker, e.g. debug_gw0.log for debug.log in worker gw0."""
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if not worker:
+        return log_file
+    root, ext = os.path.splitext(log_file)
+    return "%s_%s%s" % (root, worker, ext)
+
+
+def _queue_handler(logger):
+    for handler in logger.handlers:
+        if isinstance(handler, _QueueHandler):
+            return handler
+    return None
+
+
+# Note: To create multiple log files, must use different logger name.
+def setup_logger(log_file, level=logging.INFO, name="", formatter=common_formatter):
+    """Function setup as many loggers as you want."""
+    log_file = worker_log_file(log_file)
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    with _lock:
+        if _queue_handler(logger) is not None:
+            return logger
+        handler = logging.FileHandler(log_file, mode="w")  # default mode is append
+        handler.setFormatter(formatter)
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, handler, respect_handler_level=True)
+        listener.start()
+        _listeners[log_file] = listener
+
+        queue_handler = _QueueHandler(records)
+        # filters run in the calling thread, where the running test is known
+        queue_handler.addFilter(TestContextFilter())
+        queue_handler.log_file = log_file
+        logger.addHandler(queue_handler)
+    return logger
+
+
+def add_jsonl(logger, path):
+    """Also write the records of logger as JSONL to path, on its listener thread."""
+    queue_handler = _queue_handler(logger)
+    if queue_handler is None:
+        raise ValueError("Logger %s was not set up by setup_logger()" % logger.name)
+    path = worker_log_file(path)
+    listener = _listeners[queue_handler.log_file]
+    if any(getattr(h, "baseFilename", None) == os.path.abspath(path) for h in listener.handlers):
+        return
+    handler = logging.FileHandler(path, mode="w")
+    handler.setFormatter(JsonFormatter())
+    # the listener thread reads the tuple on every record, replace it as a whole
+    listener.handlers = listener.handlers + (handler,)
+
+
+def log_test_start(logger, nodeid):
+    """Header line starting the log segment of a test."""
+    logger.info("========== %s ==========", nodeid)
+
+
+@atexit.register
+def flush_all():
+    """Write pending records and stop the listener threads."""
+    with _lock:
+        for listener in _listeners.values():
+            if listener._thread is not None:
+                listener.stop()
+            for handler in listener.handlers:
+                handler.flush()
+
+
+def _time_calls(logger, calls):
+    """Sorted secs of each log.info() call."""
+    timings = []
+    clock = time.perf_counter
+    for i in range(calls):
+        start = clock()
+        logger.info("Benchmark record %d of %s", i, "page")
+        timings.append(clock() - start)
+    return sorted(timings)
+
+
+def benchmark(calls=100000, sync_io=False):
+    """Per-call secs, sorted, of a synchronous FileHandler and of setup_logger(), and drain time.
+
+    sync_io: fsync every record, like a slow or network disk.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="log-bench-") as tmp:
+        sync_logger = logging.getLogger("bench.sync")
+        sync_logger.propagate = False
+        sync_logger.setLevel(logging.INFO)
+        handler = logging.FileHandler(os.path.join(tmp, "sync.log"), mode="w")
+        handler.setFormatter(common_formatter)
+        sync_logger.addHandler(handler)
+        if sync_io:
+            _fsync_on_flush(handler)
+        results["sync"] = _time_calls(sync_logger, calls)
+        handler.close()
+
+        queued_logger = setup_logger(os.path.join(tmp, "queued.log"), name="bench.queued")
+        queued_logger.propagate = False
+        if sync_io:
+            for h in _listeners[_queue_handler(queued_logger).log_file].handlers:
+                _fsync_on_flush(h)
+        results["queued"] = _time_calls(queued_logger, calls)
+        start = time.perf_counter()
+        flush_all()
+        results["drain"] = time.perf_counter() - start
+        for listener in _listeners.values():
+            for h in listener.handlers:
+                h.close()
+        _listeners.clear()
+    return results
+
+
+def _fsync_on_flush(handler):
+    flush = handler.flush
+
+    def flush_and_sync():
+        flush()
+        if handler.stream is not None:
+            os.fsync(handler.stream.fileno())
+
+    handler.flush = flush_and_sync
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call logging overhead.")
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--fsync", action="store_true", help="fsync every record, like a slow disk")
+    args = parser.parse_args()
+
+    results = benchmark(args.calls, args.fsync)
+    print("%-8s %10s %10s %10s %10s" % ("handler", "mean(us)", "p50(us)", "p99(us)", "max(us)"))
+    for kind in ("sync", "queued"):
+        timings = results[kind]
+        print(
+            "%-8s %10.2f %10.2f %10.2f %10.2f"
+            % (
+                kind,
+                sum(timings) / len(timings) * 1e6,
+                timings[len(timings) // 2] * 1e6,
+                timings[int(len(timings) * 0.99)] * 1e6,
+                timings[-1] * 1e6,
+            )
+        )
+    print("queued records written %.2fs after the last call" % results["drain"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Base class of page objects, with locators declared once and a per-page element cache.
+
+Every find_element() is an HTTP round trip to the driver, so a page object finds each
+element once and reuses it. Act on cached elements through with_element(), which finds them
+again if the page re-rendered. The cache is cleared on navigation: get(), with_element(...,
+navigates=True) for an action which loads another page, or clear_cache().
+
+Usage:
+    class LoginPage(BasePage):
+        locators = {
+            "username": (By.NAME, "username"),
+            "rows": (By.CSS_SELECTOR, "ul.results li"),
+        }
+
+        def login(self, name):
+            self.with_element("username", lambda e: e.send_keys(name, Keys.ENTER), navigates=True)
+
+        def row_texts(self):
+            return self.texts("rows")  # all rows in one round trip
+
+        def is_page_matched(self):
+            return self.wait_until(EC.title_is("Login"), label="title is 'Login'")
+"""
+
+from selenium.common.exceptions import StaleElementReferenceException
+
+from framework.elements import element_texts
+from framework.page_metrics import record_page_metrics
+from framework.timeouts import wait_until
+from framework.waits import TIMEWAIT_PAGE_LOAD
+
+
+class BasePage:
+    # name -> (By.X, value)
+    locators = {}
+
+    def __init__(self, webdrive):
+        self.wd = webdrive
+        self._elements = {}
+
+    def get(self, url):
+        """Load url in this page object's driver."""
+        self.clear_cache()
+        self.wd.get(url)
+
+    def clear_cache(self):
+        self._elements.clear()
+
+    def element(self, name):
+        """The element of a declared locator, found once per page."""
+        elem = self._elements.get(name)
+        if elem is None:
+            elem = self._elements[name] = self.wd.find_element(*self.locators[name])
+        return elem
+
+    def with_element(self, name, action, navigates=False):
+        """Return action(element), finding the element again once if the cached one went stale.
+
+        navigates: the action loads another page, clear the cache after it.
+        """
+        try:
+            result = action(self.element(name))
+        except StaleElementReferenceException:
+            # the page re-rendered or was left, the other cached elements are stale too
+            self.clear_cache()
+            result = action(self.element(name))
+        if navigates:
+            self.clear_cache()
+        return result
+
+    def wait_until(self, condition, label=None, upper_bound=TIMEWAIT_PAGE_LOAD):
+        """Wait for condition with the timeout learned for this page, see framework/timeouts.py."""
+        return wait_until(self.wd, condition, type(self).__name__, label, upper_bound)
+
+    def record_metrics(self):
+        """Record Navigation Timing / Web Vitals of this page, call it once the page matched."""
+        return record_page_metrics(self.wd, page=type(self).__name__)
+
+    def texts(self, name):
+        """Texts of all elements matching a declared locator, in one round trip."""
+        return element_texts(self.wd, *self.locators[name])
@@ -0,0 +1,224 @@
+"""
+Navigation Timing / Web Vitals of every page load, with per-test budgets.
+
+Metrics of a page load, collected in one async script round trip:
+  - ttfb, dom_content_loaded, load_event: ms since navigation start (Navigation Timing)
+  - transfer_kb: size of the document
+  - resource_count, resource_kb: number and transfer size of sub-resources (Resource Timing)
+  - lcp: largest contentful paint in ms, cls: cumulative layout shift, when the browser supports them
+
+They are recorded after every driver.get() of the "wd" drivers, see track_page_loads(), and when a
+page object matched its page, see BasePage.record_metrics(). The metrics of each test are
+attached to the HTML report.
+
+Budgets:
+    @pytest.mark.perf_budget(ttfb=800, load_event=5000)  # all pages of the test
+    @pytest.mark.perf_budget(page="PyPiHomepage", lcp=2500)  # only pages recorded as PyPiHomepage
+fail the test after its call if a recorded page load exceeded a budget, with the exceeded metrics.
+Metrics not reported by the browser are not checked.
+"""
+
+from html import escape
+
+import pytest
+from pytest_html import extras
+
+from conftest import log
+from framework.timing import current_test
+
+METRICS = (
+    "ttfb",
+    "dom_content_loaded",
+    "load_event",
+    "lcp",
+    "cls",
+    "transfer_kb",
+    "resource_count",
+    "resource_kb",
+)
+
+# executed by execute_async_script, the last argument is the callback
+_METRICS_JS = """
+var done = arguments[arguments.length - 1];
+var result = {url: location.href, lcp: null, cls: null};
+var nav = performance.getEntriesByType("navigation")[0];
+if (nav) {
+  result.ttfb = nav.responseStart;
+  result.dom_content_loaded = nav.domContentLoadedEventEnd || null;
+  result.load_event = nav.loadEventEnd || null;
+  result.transfer_kb = nav.transferSize / 1024;
+}
+var resources = performance.getEntriesByType("resource");
+result.resource_count = resources.length;
+result.resource_kb = resources.reduce(function (sum, r) { return sum + (r.transferSize || 0); }, 0) / 1024;
+var types = (window.PerformanceObserver && PerformanceObserver.supportedEntryTypes) || [];
+if (types.indexOf("largest-contentful-paint") !== -1) {
+  new PerformanceObserver(function (list) {
+    var entries = list.getEntries();
+    result.lcp = entries[entries.length - 1].startTime;
+  }).observe({type: "largest-contentful-paint", buffered: true});
+}
+if (types.indexOf("layout-shift") !== -1) {
+  result.cls = 0;
+  new PerformanceObserver(function (list) {
+    list.getEntries().forEach(function (e) { if (!e.hadRecentInput) result.cls += e.value; });
+  }).observe({type: "layout-shift", buffered: true});
+}
+// buffered entries are delivered to observers asynchronously
+setTimeout(function () { done(result); }, 50);
+"""
+
+# nodeid -> list of metrics dicts, with "page" and "url"
+_records = {}
+# functions called with (driver, metrics) after a page load is recorded, e.g. by site recording
+page_load_listeners = []
+# functions called with (driver, url) before a driver.get(), may raise to fail it at once
+page_load_guards = []
+# functions called with (driver, url, exception) when a driver.get() raised
+page_load_error_listeners = []
+
+
+def collect_page_metrics(driver):
+    """Metrics of the current page, see METRICS. None for about:blank etc."""
+    metrics = driver.execute_async_script(_METRICS_JS)
+    if not metrics or not str(metrics.get("url", "")).startswith("http"):
+        return None
+    for name in METRICS:
+        value = metrics.get(name)
+        if value is not None:
+            metrics[name] = round(value, 3) if name == "cls" else round(value)
+    return metrics
+
+
+def record_page_metrics(driver, page=None):
+    """Collect the metrics of the current page for the running test."""
+    try:
+        metrics = collect_page_metrics(driver)
+    except Exception as e:
+        log.warning("Failed to collect page metrics: %s", e)
+        return None
+    if metrics is None:
+        return None
+    metrics["page"] = page or metrics["url"]
+    log.info("Page metrics of %s: %s", metrics["page"], metrics)
+    nodeid = current_test()
+    if nodeid:
+        records = _records.setdefault(nodeid, [])
+        # a page object matched the page just loaded by driver.get(), name that record
+        if records and records[-1]["url"] == metrics["url"] == records[-1]["page"]:
+            records.pop()
+        records.append(metrics)
+    for listener in page_load_listeners:
+        listener(driver, metrics)
+    return metrics
+
+
+def track_page_loads(driver):
+    """Record page metrics after every driver.get(), once per driver."""
+    # unwrap EventFiringWebDriver, it calls get() of the real driver
+    driver = getattr(driver, "wrapped_driver", driver)
+    if "get" in driver.__dict__:
+        return driver
+    get = driver.get
+
+    def get_and_record(url):
+        for guard in page_load_guards:
+            guard(driver, url)
+        try:
+            get(url)
+        except Exception as e:
+            for listener in page_load_error_listeners:
+                listener(driver, url, e)
+            raise
+        if str(url).startswith("http"):
+            record_page_metrics(driver)
+
+    driver.get = get_and_record
+    return driver
+
+
+def records_of(nodeid):
+    """Page metrics recorded so far for a test."""
+    return list(_records.get(nodeid, []))
+
+
+def budget_violations(records, budgets):
+    """Messages of metrics over budget. budgets: list of (page or None, {metric: limit})."""
+    violations = []
+    for metrics in records:
+        for page, limits in budgets:
+            if page is not None and page != metrics["page"]:
+                continue
+            for name, limit in limits.items():
+                value = metrics.get(name)
+                if value is not None and value > limit:
+                    violations.append(
+                        "%s (%s): %s %s > budget %s (+%s)"
+                        % (
+                            metrics["page"],
+                            metrics["url"],
+                            name,
+                            value,
+                            limit,
+                            round(value - limit, 3),
+                        )
+                    )
+    return violations
+
+
+def _budgets(item):
+    budgets = []
+    for marker in item.iter_markers("perf_budget"):
+        limits = dict(marker.kwargs)
+        page = limits.pop("page", None)
+        unknown = set(limits) - set(METRICS)
+        if unknown:
+            raise ValueError(
+                "Unknown perf_budget metrics %s, choose from %s"
+                % (sorted(unknown), METRICS)
+            )
+        budgets.append((page, limits))
+    return budgets
+
+
+def _metrics_table(records):
+    header = "".join("<th>%s</th>" % name for name in ("page",) + METRICS)
+    rows = "".join(
+        "<tr><td>%s</td>%s</tr>"
+        % (
+            escape(str(metrics["page"])),
+            "".join("<td>%s</td>" % metrics.get(name, "") for name in METRICS),
+        )
+        for metrics in records
+    )
+    return "<table><tr>%s</tr>%s</table>" % (header, rows)
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "perf_budget(page=None, **limits): fail if a page load exceeds limits, e.g. ttfb=800 (ms)",
+    )
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    result = yield
+    violations = budget_violations(_records.get(item.nodeid, []), _budgets(item))
+    if violations:
+        pytest.fail(
+            "Performance budget exceeded:\n  " + "\n  ".join(violations), pytrace=False
+        )
+    return result
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when == "call" and _records.get(item.nodeid):
+        new_extras = getattr(report, "extras", [])
+        new_extras.append(extras.html(_metrics_table(_records[item.nodeid])))
+        report.extras = new_extras
+    elif report.when == "teardown":
+        _records.pop(item.nodeid, None)
@@ -0,0 +1,479 @@
+"""
+Per-test blocking of sub-resources the test doesn't need, e.g. images, fonts and analytics.
+
+driver.get() waits for every sub-resource of the page, and most of that time goes to
+third-party analytics, fonts and images which assertions never look at. Declare what to block:
+    @pytest.mark.block_resources(types=["image", "font", "analytics"])
+    @pytest.mark.block_resources("*.svg*", "*://ads.example.com/*")  # URL patterns, * is a wildcard
+    def test_xxx(wd):
+        ...
+
+Types: see TYPE_PATTERNS.
+
+How rules are applied to the test's "wd" driver:
+  - Chromium: DevTools Network.setBlockedURLs, cleared after the test.
+  - Firefox (and Chromium too, if enabled): a local blocking proxy, started by --blocking-proxy
+    or resource_blocking_proxy in pytest.ini, which all drivers use. HTTPS requests pass the proxy
+    as tunnels, so for HTTPS only patterns matching the host are applied, e.g. analytics,
+    "*://ads.example.com/*", but not "*.png*".
+Without the proxy the rules are not applied on Firefox, with a warning.
+
+Report: the requests, KB and load time of the test's page loads (see framework/page_metrics.py)
+compared with an unblocked run of the test. Record the unblocked run by
+    pytest --no-resource-blocking
+which runs the tests without applying their rules and saves their page metrics as baseline
+(resource_baseline in pytest.ini, default .resource_baseline.json).
+"""
+
+import json
+import os
+import select
+import socket
+import threading
+from fnmatch import fnmatchcase
+from html import escape
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+from pytest_html import extras
+from selenium.common.exceptions import WebDriverException
+
+from conftest import log
+from framework.driver_pool import launch_options_key
+from framework.page_metrics import records_of
+
+TYPE_PATTERNS = {
+    "image": ("*.png*", "*.jpg*", "*.jpeg*", "*.gif*", "*.webp*", "*.avif*", "*.svg*", "*.ico*"),
+    "font": (
+        "*.woff*",
+        "*.ttf*",
+        "*.otf*",
+        "*.eot*",
+        "*://fonts.googleapis.com/*",
+        "*://fonts.gstatic.com/*",
+        "*://use.typekit.net/*",
+    ),
+    "media": ("*.mp4*", "*.webm*", "*.mp3*", "*.ogg*", "*.m3u8*"),
+    "stylesheet": ("*.css*",),
+    "analytics": (
+        "*://www.google-analytics.com/*",
+        "*://ssl.google-analytics.com/*",
+        "*://www.googletagmanager.com/*",
+        "*://stats.g.doubleclick.net/*",
+        "*://*.doubleclick.net/*",
+        "*://static.hotjar.com/*",
+        "*://script.hotjar.com/*",
+        "*://connect.facebook.net/*",
+        "*://cdn.segment.com/*",
+        "*://plausible.io/*",
+        "*://*.newrelic.com/*",
+        "*://*.nr-data.net/*",
+        "*://js-agent.newrelic.com/*",
+        "*://*.optimizely.com/*",
+        "*://*.quantserve.com/*",
+        "*://*.scorecardresearch.com/*",
+        "*://*.mouseflow.com/*",
+        "*://*.clarity.ms/*",
+    ),
+}
+
+# metrics compared with the unblocked run
+_COMPARED = ("resource_count", "resource_kb", "load_event")
+TUNNEL_BUFFER = 64 * 1024
+PROXY_TIMEOUT = 60
+
+# nodeid -> blocked requests counted by the proxy
+_proxy_blocked = {}
+# nodeid -> comparison rows of the report, see _compare()
+_comparisons = {}
+
+
+class BlockRules:
+    """URL patterns to block, from patterns and resource types."""
+
+    def __init__(self, patterns=(), types=()):
+        unknown = set(types) - set(TYPE_PATTERNS)
+        if unknown:
+            raise ValueError(
+                "Unknown block_resources types %s, choose from %s"
+                % (sorted(unknown), sorted(TYPE_PATTERNS))
+            )
+        self.patterns = list(patterns)
+        for resource_type in types:
+            self.patterns.extend(TYPE_PATTERNS[resource_type])
+        # patterns a proxy can match against "scheme://host/" of HTTPS tunnels
+        self._host_patterns = [p for p in self.patterns if p.endswith("/*") and "://" in p]
+
+    @classmethod
+    def of(cls, item):
+        """Rules of all block_resources markers of a test, None if it has none."""
+        markers = list(item.iter_markers("block_resources"))
+        if not markers:
+            return None
+        patterns, types = [], []
+        for marker in markers:
+            patterns.extend(marker.args)
+            types.extend(marker.kwargs.get("types", ()))
+        return cls(patterns, types)
+
+    def blocks(self, url):
+        return any(fnmatchcase(url, pattern) for pattern in self.patterns)
+
+    def blocks_host(self, host):
+        url = "https://%s/" % host
+        return any(fnmatchcase(url, pattern) for pattern in self._host_patterns)
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        log.debug("blocking proxy: " + format, *args)
+
+    def _blocked(self, blocked):
+        if blocked:
+            self.server.count_blocked()
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.send_header("Connection", "close")
+            self.end_headers()
+        return blocked
+
+    def do_CONNECT(self):
+        host, _, port = self.path.rpartition(":")
+        rules = self.server.rules
+        if self._blocked(rules is not None and rules.blocks_host(host)):
+            return
+        try:
+            upstream = socket.create_connection((host, int(port)), timeout=PROXY_TIMEOUT)
+        except OSError as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(200, "Connection established")
+        self.end_headers()
+        self._tunnel(self.connection, upstream)
+
+    def _tunnel(self, client, upstream):
+        sockets = [client, upstream]
+        try:
+            while True:
+                readable, _, errors = select.select(sockets, [], sockets, PROXY_TIMEOUT)
+                if errors or not readable:
+                    break
+                for sock in readable:
+                    data = sock.recv(TUNNEL_BUFFER)
+                    if not data:
+                        return
+                    (upstream if sock is client else client).sendall(data)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+            self.close_connection = True
+
+    def _forward(self):
+        rules = self.server.rules
+        if self._blocked(rules is not None and rules.blocks(self.path)):
+            return
+        url = urlsplit(self.path)
+        body = None
+        if "Content-Length" in self.headers:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+        headers = {
+            name: value
+            for name, value in self.headers.items()
+            if name.lower() not in ("proxy-connection", "connection", "keep-alive")
+        }
+        try:
+            conn = HTTPConnection(url.hostname, url.port or 80, timeout=PROXY_TIMEOUT)
+            conn.request(
+                self.command,
+                url.path + ("?" + url.query if url.query else "") or "/",
+                body,
+                headers,
+            )
+            response = conn.getresponse()
+            payload = response.read()
+        except OSError as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(response.status, response.reason)
+        for name, value in response.getheaders():
+            if name.lower() not in ("transfer-encoding", "connection", "content-length"):
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        conn.close()
+
+    do_GET = do_POST = do_HEAD = do_PUT = do_DELETE = do_OPTIONS = _forward
+
+
+class BlockingProxy(ThreadingHTTPServer):
+    """Local HTTP proxy which rejects requests matching the current rules."""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1"):
+        super().__init__((host, 0), _ProxyHandler)
+        self.address = "%s:%d" % self.server_address[:2]
+        # BlockRules of the running test, None to pass everything
+        self.rules = None
+        self.blocked = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count_blocked(self):
+        with self._lock:
+            self.blocked += 1
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="blocking-proxy", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+proxy_key = pytest.StashKey[BlockingProxy]()
+# nodeid -> {page: {metric: value}} of unblocked runs
+baseline_key = pytest.StashKey[dict]()
+
+
+def _set_blocked_urls(driver, patterns):
+    """Block URL patterns via DevTools, return False if the driver has no DevTools."""
+    # unwrap EventFiringWebDriver
+    driver = getattr(driver, "wrapped_driver", driver)
+    if not hasattr(driver, "execute_cdp_cmd"):
+        return False
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except WebDriverException as e:
+        log.warning("Failed to set blocked URLs: %s", e)
+        return False
+    return True
+
+
+def _load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _baseline_path(config):
+    return os.path.join(str(config.rootpath), config.getini("resource_baseline"))
+
+
+def _compare(records, baseline):
+    """Rows (page, {metric: (value, baseline value or None)}) of the test's page loads."""
+    rows = []
+    for metrics in records:
+        unblocked = baseline.get(metrics["page"], {})
+        rows.append(
+            (
+                metrics["page"],
+                {name: (metrics.get(name), unblocked.get(name)) for name in _COMPARED},
+            )
+        )
+    return rows
+
+
+def _difference(value, baseline_value):
+    if value is None or baseline_value is None:
+        return None
+    return baseline_value - value
+
+
+def _comparison_table(rows, proxy_blocked):
+    header = "<th>Page</th>" + "".join(
+        "<th>%s</th><th>unblocked</th><th>avoided</th>" % name for name in _COMPARED
+    )
+    body = ""
+    for page, values in rows:
+        cells = ""
+        for name in _COMPARED:
+            value, baseline_value = values[name]
+            avoided = _difference(value, baseline_value)
+            cells += "<td>%s</td><td>%s</td><td>%s</td>" % (
+                "" if value is None else value,
+                "" if baseline_value is None else baseline_value,
+                "" if avoided is None else avoided,
+            )
+        body += "<tr><td>%s</td>%s</tr>" % (escape(str(page)), cells)
+    caption = "Resource blocking"
+    if proxy_blocked is not None:
+        caption += ", %d requests blocked by the proxy" % proxy_blocked
+    return "<table><caption>%s</caption><tr>%s</tr>%s</table>" % (caption, header, body)
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "resource_blocking_proxy",
+        "Route all drivers through a local proxy applying block_resources rules, for Firefox.",
+        type="bool",
+        default=False,
+    )
+    parser.addini(
+        "resource_baseline",
+        "File of page metrics of unblocked runs, to compare blocked runs with.",
+        default=".resource_baseline.json",
+    )
+    parser.addoption(
+        "--blocking-proxy",
+        action="store_true",
+        default=None,
+        help="Route all drivers through a local proxy applying block_resources rules.",
+    )
+    parser.addoption(
+        "--no-resource-blocking",
+        action="store_true",
+        default=False,
+        help="Don't apply block_resources rules, save page metrics of those tests as baseline.",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "block_resources(*patterns, types=[...]): block matching sub-resources during the test, "
+        "types: %s" % ", ".join(sorted(TYPE_PATTERNS)),
+    )
+    enabled = config.getoption("blocking_proxy")
+    if enabled is None:
+        enabled = config.getini("resource_blocking_proxy")
+    if enabled and not config.getoption("no_resource_blocking"):
+        proxy = BlockingProxy().start()
+        config.stash[proxy_key] = proxy
+        config.stash.setdefault(launch_options_key, {})["proxy"] = proxy.address
+        log.info("Blocking proxy at %s", proxy.address)
+
+
+def pytest_unconfigure(config):
+    proxy = config.stash.get(proxy_key, None)
+    if proxy is not None:
+        proxy.stop()
+        del config.stash[proxy_key]
+
+
+@pytest.fixture(autouse=True)
+def _block_resources(request):
+    rules = BlockRules.of(request.node)
+    config = request.config
+    if rules is None or config.getoption("no_resource_blocking"):
+        yield
+        return
+    if "wd" not in request.fixturenames:
+        log.warning("block_resources of %s ignored, it doesn't use wd", request.node.nodeid)
+        yield
+        return
+
+    driver = request.getfixturevalue("wd")
+    proxy = config.stash.get(proxy_key, None)
+    blocked_before = 0
+    if proxy is not None:
+        blocked_before = proxy.blocked
+        proxy.rules = rules
+    cdp = _set_blocked_urls(driver, rules.patterns)
+    if not cdp and proxy is None:
+        log.warning(
+            "block_resources of %s not applied, use --blocking-proxy for browsers "
+            "without DevTools",
+            request.node.nodeid,
+        )
+    yield
+
+    if cdp:
+        _set_blocked_urls(driver, [])
+    if proxy is not None:
+        proxy.rules = None
+        _proxy_blocked[request.node.nodeid] = proxy.blocked - blocked_before
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    # page metrics are dropped on teardown, look at them after the call
+    if report.when != "call" or item.get_closest_marker("block_resources") is None:
+        return
+    records = records_of(item.nodeid)
+    if not records:
+        return
+    config = item.config
+    if config.getoption("no_resource_blocking"):
+        baseline = config.stash.setdefault(baseline_key, {})
+        baseline[item.nodeid] = {
+            metrics["page"]: {name: metrics.get(name) for name in _COMPARED}
+            for metrics in records
+        }
+        return
+
+    if baseline_key not in config.stash:
+        config.stash[baseline_key] = _load_baseline(_baseline_path(config))
+    rows = _compare(records, config.stash[baseline_key].get(item.nodeid, {}))
+    _comparisons[item.nodeid] = rows
+    new_extras = getattr(report, "extras", [])
+    new_extras.append(
+        extras.html(_comparison_table(rows, _proxy_blocked.get(item.nodeid)))
+    )
+    report.extras = new_extras
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # pytest-xdist controller: merge the baselines of workers, so only it writes the file
+    unblocked = getattr(node, "workeroutput", {}).get("resource_baseline")
+    if unblocked:
+        node.config.stash.setdefault(baseline_key, {}).update(unblocked)
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if not config.getoption("no_resource_blocking") or not config.stash.get(baseline_key, None):
+        return
+    if hasattr(config, "workerinput"):
+        config.workeroutput["resource_baseline"] = config.stash[baseline_key]
+        return
+    path = _baseline_path(config)
+    baseline = _load_baseline(path)
+    baseline.update(config.stash[baseline_key])
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+    log.info("Saved unblocked page metrics of %d tests to %s", len(config.stash[baseline_key]), path)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _comparisons and not _proxy_blocked:
+        return
+    avoided = {name: 0 for name in _COMPARED}
+    compared = 0
+    for rows in _comparisons.values():
+        for _, values in rows:
+            differences = [_difference(*values[name]) for name in _COMPARED]
+            if None in differences:
+                continue
+            compared += 1
+            for name, difference in zip(_COMPARED, differences):
+                avoided[name] += difference
+    terminalreporter.write_sep("-", "resource blocking")
+    terminalreporter.write_line(
+        "%d tests blocked resources, %d requests blocked by the proxy"
+        % (len(_comparisons), sum(_proxy_blocked.values()))
+    )
+    if compared:
+        terminalreporter.write_line(
+            "vs unblocked run, %d page loads: %d requests, %d KB and %d ms load time avoided"
+            % (compared, avoided["resource_count"], avoided["resource_kb"], avoided["load_event"])
+        )
+    else:
+        terminalreporter.write_line(
+            "no unblocked run to compare with, record one by --no-resource-blocking"
+        )
@@ -0,0 +1,306 @@
+"""
+Duration-aware scheduling of tests over pytest-xdist workers, with browser affinity.
+
+    pytest -n 4 --duration-scheduling   # or duration_scheduling = true in pytest.ini
+
+Durations (setup + call + teardown) of every run are kept in .test_durations.json (durations_file
+in pytest.ini), smoothed over runs. Tests are then sent to workers one at a time:
+  - longest first, so the run doesn't end waiting for one long test started last
+    (tests without a known duration count as the average)
+  - a worker keeps getting tests of the browser it already runs, i.e. its pooled driver is
+    reused, and only switches when no test of its browser is left. It then takes the browser
+    with the most remaining time per worker running it.
+
+The browser of a test is its "browser" parameter, e.g. test_x[Firefox], DEFAULT_BROWSER otherwise.
+
+Without -n the durations are still recorded if enabled, and tests run in collection order.
+"""
+
+import json
+import os
+import re
+
+import pytest
+
+from conftest import log
+from framework.driver_factory import DEFAULT_BROWSER
+
+# weight of the latest run in the stored duration of a test
+SMOOTHING = 0.5
+DEFAULT_DURATION = 1.0
+# tests queued on each worker: a worker only runs a test once it knows the next one
+QUEUED_PER_WORKER = 2
+# browsers create_driver() can launch, to find them in parametrized test ids
+KNOWN_BROWSERS = ("chrome", "firefox")
+
+_PARAMS_RE = re.compile(r"\[(.*)\]$")
+
+
+def browser_of(nodeid):
+    """Browser of a test from its parametrized id, e.g. "Firefox" of "test_x[Firefox]"."""
+    match = _PARAMS_RE.search(nodeid)
+    if match:
+        for param in match.group(1).split("-"):
+            if param.lower() in KNOWN_BROWSERS:
+                return param
+    return DEFAULT_BROWSER
+
+
+class DurationStore:
+    """Durations of previous runs, nodeid -> secs."""
+
+    def __init__(self):
+        # None until loaded, and in xdist workers
+        self.path = None
+        self.durations = {}
+        # nodeid -> secs of this run
+        self._current = {}
+
+    def load(self, path):
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.durations = json.load(f)
+            except ValueError as e:
+                log.warning("Ignoring broken durations file %s: %s", path, e)
+
+    def get(self, nodeid, default=None):
+        return self.durations.get(nodeid, default)
+
+    def add(self, nodeid, secs):
+        self._current[nodeid] = self._current.get(nodeid, 0.0) + secs
+
+    def save(self):
+        """Merge the durations of this run into the file, return False if nothing changed."""
+        changed = False
+        for nodeid, secs in self._current.items():
+            previous = self.durations.get(nodeid)
+            if previous is not None:
+                secs = SMOOTHING * secs + (1 - SMOOTHING) * previous
+            secs = round(secs, 3)
+            if secs != previous:
+                self.durations[nodeid] = secs
+                changed = True
+        self._current = {}
+        if not changed:
+            return False
+        with open(self.path, "w") as f:
+            json.dump(self.durations, f, indent=1, sort_keys=True)
+        return True
+
+
+class DurationScheduling:
+    """pytest-xdist scheduler: longest tests first, tests of a browser to the same workers.
+
+    Implements the scheduler interface of xdist.scheduler, see LoadScheduling there.
+    """
+
+    def __init__(self, config, durations, log=None):
+        self.config = config
+        self.durations = durations
+        self.log = log
+        self.numnodes = len(_worker_specs(config))
+        self.node2collection = {}
+        self.node2pending = {}
+        # browser of the last test sent to each node
+        self.node2browser = {}
+        self.collection = None
+        # browser -> pending test indexes, longest first
+        self.pending = {}
+        self._default_duration = DEFAULT_DURATION
+
+    @property
+    def nodes(self):
+        return list(self.node2pending)
+
+    @property
+    def collection_is_completed(self):
+        return len(self.node2collection) >= self.numnodes
+
+    @property
+    def tests_finished(self):
+        if not self.collection_is_completed or self.has_pending_unsent:
+            return False
+        return all(len(pending) < QUEUED_PER_WORKER for pending in self.node2pending.values())
+
+    @property
+    def has_pending_unsent(self):
+        return any(self.pending.values())
+
+    @property
+    def has_pending(self):
+        return self.has_pending_unsent or any(self.node2pending.values())
+
+    def add_node(self, node):
+        assert node not in self.node2pending
+        self.node2pending[node] = []
+
+    def add_node_collection(self, node, collection):
+        assert node in self.node2pending
+        self.node2collection[node] = list(collection)
+
+    def mark_test_complete(self, node, item_index, duration=0):
+        self.node2pending[node].remove(item_index)
+        self._fill(node)
+
+    def mark_test_pending(self, item):
+        index = self.collection.index(item)
+        self._add_pending([index])
+        for node in self.nodes:
+            self._fill(node)
+
+    def remove_pending_tests_from_node(self, node, indices):
+        pending = self.node2pending[node]
+        removed = [index for index in indices if index in pending]
+        for index in removed:
+            pending.remove(index)
+        self._add_pending(removed)
+
+    def remove_node(self, node):
+        """Requeue the tests of a node which went down, return the one it crashed on."""
+        pending = self.node2pending.pop(node)
+        self.node2browser.pop(node, None)
+        if not pending:
+            return None
+        crashitem = self.collection[pending.pop(0)]
+        self._add_pending(pending)
+        for other in self.nodes:
+            self._fill(other)
+        return crashitem
+
+    def schedule(self):
+        assert self.collection_is_completed
+        if self.collection is not None:
+            for node in self.nodes:
+                self._fill(node)
+            return
+
+        collections = list(self.node2collection.values())
+        if any(collection != collections[0] for collection in collections[1:]):
+            if self.log:
+                self.log("**Different tests collected, aborting run**")
+            return
+        self.collection = collections[0]
+        self._add_pending(range(len(self.collection)))
+        if not self.collection:
+            return
+        for node in self.nodes:
+            self._fill(node)
+
+    def _duration(self, index):
+        return self.durations.get(self.collection[index], self._default_duration)
+
+    def _add_pending(self, indexes):
+        known = [self.durations.get(nodeid) for nodeid in self.collection]
+        known = [secs for secs in known if secs is not None]
+        self._default_duration = sum(known) / len(known) if known else DEFAULT_DURATION
+        for index in indexes:
+            self.pending.setdefault(browser_of(self.collection[index]), []).append(index)
+        for pending in self.pending.values():
+            pending.sort(key=self._duration, reverse=True)
+
+    def _next_browser(self, node):
+        """Browser of the next test for node: its own while any is left, else the busiest."""
+        browser = self.node2browser.get(node)
+        if self.pending.get(browser):
+            return browser
+        workers = {}
+        for other, other_browser in self.node2browser.items():
+            if other is not node:
+                workers[other_browser] = workers.get(other_browser, 0) + 1
+
+        def remaining_per_worker(candidate):
+            remaining = sum(self._duration(index) for index in self.pending[candidate])
+            return remaining / (workers.get(candidate, 0) + 1)
+
+        candidates = [candidate for candidate, pending in self.pending.items() if pending]
+        return max(candidates, key=remaining_per_worker) if candidates else None
+
+    def _fill(self, node):
+        if node.shutting_down:
+            return
+        queued = self.node2pending[node]
+        indexes = []
+        while len(queued) + len(indexes) < QUEUED_PER_WORKER:
+            browser = self._next_browser(node)
+            if browser is None:
+                break
+            indexes.append(self.pending[browser].pop(0))
+            self.node2browser[node] = browser
+        if indexes:
+            queued.extend(indexes)
+            node.send_runtest_some(indexes)
+        elif not self.has_pending_unsent:
+            node.shutdown()
+
+
+def _worker_specs(config):
+    # the -n / --tx option parsing of pytest-xdist, lazy as pytest-xdist is optional
+    try:
+        from xdist.workermanage import parse_tx_spec_config
+    except ImportError:
+        # pytest-xdist < 3.6
+        from xdist.workermanage import parse_spec_config as parse_tx_spec_config
+
+    return parse_tx_spec_config(config)
+
+
+def _enabled(config):
+    enabled = config.getoption("duration_scheduling")
+    if enabled is None:
+        enabled = config.getini("duration_scheduling")
+    return enabled
+
+
+durations = DurationStore()
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "duration_scheduling",
+        "Schedule tests over pytest-xdist workers by duration and browser.",
+        type="bool",
+        default=False,
+    )
+    parser.addini(
+        "durations_file",
+        "File of test durations of previous runs.",
+        default=".test_durations.json",
+    )
+    parser.addoption(
+        "--duration-scheduling",
+        action="store_true",
+        default=None,
+        help="With -n: send the longest tests first and tests of a browser to the same workers.",
+    )
+
+
+def pytest_configure(config):
+    # workers report durations to the controller, only it keeps the file, and only
+    # when the durations are used, so serial runs leave it alone
+    if _enabled(config) and not hasattr(config, "workerinput"):
+        path = os.path.join(str(config.rootpath), config.getini("durations_file"))
+        durations.load(path)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    if not _enabled(config):
+        return None
+    return DurationScheduling(config, durations, log)
+
+
+def pytest_runtest_logreport(report):
+    # runs in the controller for reports of workers too
+    if durations.path is not None:
+        durations.add(report.nodeid, report.duration)
+
+
+def pytest_sessionfinish(session):
+    if durations.path is None:
+        return
+    try:
+        durations.save()
+    except OSError as e:
+        log.warning("Failed to save test durations: %s", e)
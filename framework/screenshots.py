@@ -0,0 +1,223 @@
+"""
+Single-capture screenshot pipeline.
+
+A failure takes one screenshot, capture(driver, name), which is reused for both the
+file on disk and the image embedded in the HTML report. The capture itself blocks
+the test thread, but encoding (optional downscaling and JPEG / WebP conversion via
+Pillow) and the disk write run on a bounded worker pool:
+  - the report hook waits only for the encoded image, not for the file write
+  - submitting blocks when too many screenshots are pending, to bound memory
+  - pending writes are flushed at the end of the session
+
+Options in pytest.ini:
+  screenshot_format: png (default), jpeg or webp. jpeg / webp need Pillow, else png is kept.
+  screenshot_max_width: downscale wider screenshots to this width, 0 (default) keeps the size.
+
+Byte size and capture time are shown with each screenshot in the report and in the terminal summary.
+"""
+
+import base64
+import contextvars
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from conftest import log
+from framework.timing import current_worker
+
+
+WORKERS = 2
+# max screenshots being encoded / written at once
+MAX_PENDING = 8
+JPEG_QUALITY = 75
+
+_FORMATS = {
+    "png": ("PNG", ".png", "image/png"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "webp": ("WEBP", ".webp", "image/webp"),
+}
+
+
+class Screenshot:
+    """A captured screenshot, encoded and saved on the worker pool."""
+
+    def __init__(self, png, name, capture_secs, page=None):
+        self.png = png
+        self.name = name
+        self.capture_secs = capture_secs
+        # URL of the page shown, None if unknown
+        self.page = page
+        # -> (base64 str, mime type, size in bytes)
+        self._encoded = Future()
+        # -> file path
+        self.saved = None
+        # absolute path of the file, set before the encoded image is available
+        self.path = None
+
+    def encoded(self, timeout=None):
+        """(base64 str, mime type, size in bytes) of the encoded image, waiting for the encoder."""
+        return self._encoded.result(timeout)
+
+
+def _pil_image():
+    # Pillow is slow to import, only load it when a screenshot is converted, see framework/startup.py
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _encode(png, image_format, max_width):
+    """Return (image bytes, file extension, mime type)."""
+    if image_format == "png" and not max_width:
+        return png, ".png", "image/png"
+    Image = _pil_image()
+    if Image is None:
+        log.warning("Pillow is not installed, keep screenshots as PNG.")
+        return png, ".png", "image/png"
+
+    pil_format, ext, mime = _FORMATS[image_format]
+    image = Image.open(io.BytesIO(png))
+    if max_width and image.width > max_width:
+        height = round(image.height * max_width / image.width)
+        image = image.resize((max_width, height), Image.LANCZOS)
+    if pil_format == "JPEG":
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    image.save(out, pil_format, quality=JPEG_QUALITY)
+    return out.getvalue(), ext, mime
+
+
+def _log_failure(future):
+    """Done callback of a screenshot's encode and save, nobody else waits for the file."""
+    error = future.exception()
+    if error is not None:
+        log.warning("Failed to encode or save screenshot: %s", error)
+
+
+class ScreenshotPipeline:
+    def __init__(self, image_format="png", max_width=0):
+        self.image_format = image_format
+        self.max_width = max_width
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(MAX_PENDING)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.capture_secs = 0.0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+
+    def submit(self, shot):
+        """Encode and save a screenshot in background."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=WORKERS, thread_name_prefix="screenshot"
+            )
+        self._slots.acquire()
+        # logs of the encoder carry the test which took the screenshot
+        shot.saved = self._executor.submit(contextvars.copy_context().run, self._process, shot)
+        shot.saved.add_done_callback(_log_failure)
+        return shot
+
+    def _process(self, shot):
+        try:
+            try:
+                data, ext, mime = _encode(shot.png, self.image_format, self.max_width)
+            except Exception as e:
+                shot._encoded.set_exception(e)
+                raise
+            shot.path = path = os.path.abspath(shot.name + ext)
+            shot._encoded.set_result(
+                (base64.b64encode(data).decode("ascii"), mime, len(data))
+            )
+            with self._lock:
+                self.count += 1
+                self.capture_secs += shot.capture_secs
+                self.raw_bytes += len(shot.png)
+                self.encoded_bytes += len(data)
+
+            with open(path, "wb") as f:
+                f.write(data)
+            log.info("Screenshot saved as '%s'", path)
+            return path
+        finally:
+            self._slots.release()
+
+    def flush(self):
+        """Wait for all pending screenshots."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+pipeline = ScreenshotPipeline()
+
+
+def capture(driver, name):
+    """Take one screenshot of driver, saved as name + extension in background.
+
+    The screenshot is also kept as driver._last_screenshot for the report hook.
+    """
+    # keep it on the real driver, not on an EventFiringWebDriver wrapper
+    driver = getattr(driver, "wrapped_driver", driver)
+    if current_worker():
+        # xdist workers may fail tests of the same name at the same second
+        name = "%s_%s" % (name, current_worker())
+    start = time.perf_counter()
+    png = driver.get_screenshot_as_png()
+    capture_secs = time.perf_counter() - start
+    try:
+        page = driver.current_url
+    except Exception as e:
+        log.debug("Failed to get URL of screenshot %s: %s", name, e)
+        page = None
+    shot = Screenshot(png, name, capture_secs, page)
+    driver._last_screenshot = shot
+    return pipeline.submit(shot)
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "screenshot_format",
+        "Format of failure screenshots: png, jpeg or webp (needs Pillow).",
+        default="png",
+    )
+    parser.addini(
+        "screenshot_max_width",
+        "Downscale failure screenshots wider than this, 0 keeps the size.",
+        default="0",
+    )
+
+
+def pytest_configure(config):
+    image_format = config.getini("screenshot_format").lower()
+    if image_format not in _FORMATS:
+        raise ValueError(
+            "screenshot_format must be one of %s, got '%s'"
+            % (sorted(_FORMATS), image_format)
+        )
+    pipeline.image_format = image_format
+    pipeline.max_width = int(config.getini("screenshot_max_width"))
+
+
+def pytest_sessionfinish(session):
+    pipeline.flush()
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not pipeline.count:
+        return
+    terminalreporter.write_sep("-", "screenshots")
+    terminalreporter.write_line(
+        "%d screenshots, captured in %.2fs, %d KB encoded as %s from %d KB PNG"
+        % (
+            pipeline.count,
+            pipeline.capture_secs,
+            pipeline.encoded_bytes // 1024,
+            pipeline.image_format,
+            pipeline.raw_bytes // 1024,
+        )
+    )
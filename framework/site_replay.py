@@ -0,0 +1,378 @@
+"""
+Record / replay of the sites tests load, so browser tests run without internet latency.
+
+Modes, chosen by --site-replay (or site_replay in pytest.ini):
+  - off (default): tests load the live sites.
+  - record: tests load the live sites, and the page and sub-resource URLs of every page load
+    (see framework/page_metrics.py) are fetched and saved to the archive directory
+    (site_archive in pytest.ini, default site_archive/).
+  - replay: tests load the sites from the archive, served by a local threaded HTTP server.
+    --replay-latency-ms and --replay-bandwidth-kbps simulate a slow network.
+
+The "site" fixture (session scoped) is the server, in every mode:
+    wd.get(site.url("https://www.python.org/"))  # local URL in replay mode, the URL itself otherwise
+    wd.get(site.local_url("/login.html"))  # pages registered by site.add_page(), e.g. test HTML
+
+Replayed sites are served under http://127.0.0.1:<port>/<scheme>/<host>/<path>. Absolute URLs of
+archived sites in HTML / CSS / JS are rewritten to that form, and root-relative requests like
+/static/x.css are redirected using the origin of their referer.
+
+Recording does not capture the browser's traffic: it lists the URLs the page loaded (Performance
+API) and GETs them again with urllib, sending the browser's user agent and the cookies WebDriver
+sees for the current page. So the archive can differ from what the browser got:
+  - other request headers (Accept, Authorization, Referer, ...) are not sent, and cookies of
+    other domains, e.g. of a CDN or an iframe, are missing
+  - XHR / fetch POSTs and other non-GET requests are fetched as GET, without their body
+  - responses keep only their status, content type and body, not their other headers
+  - pages that differ per request (tokens, timestamps) are archived as of the re-fetch
+Pages that rely on these are better tested against the live site.
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+from conftest import log
+from framework import page_metrics
+
+MODES = ("off", "record", "replay")
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 30
+CHUNK_SIZE = 16 * 1024
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)"
+
+_TEXT_TYPES = ("text/html", "text/css", "javascript", "application/json")
+
+# browser's user agent, current document URL and the resources it loaded
+_PAGE_URLS_JS = """
+return {
+  userAgent: navigator.userAgent,
+  urls: [location.href].concat(performance.getEntriesByType("resource").map(function (e) {
+    return e.name;
+  }))
+};
+"""
+
+
+class SiteArchive:
+    """Responses stored on disk: index.json maps URLs to status, content type and body file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        index_file = os.path.join(path, "index.json")
+        if os.path.exists(index_file):
+            with open(index_file) as f:
+                self._index = json.load(f)
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def origins(self):
+        """Set of "scheme://host" of archived URLs."""
+        return {"%s://%s" % urlsplit(url)[:2] for url in self._index}
+
+    def get(self, url):
+        """(status, content type, body bytes) of url, or None if not archived."""
+        entry = self._index.get(url)
+        if entry is None:
+            return None
+        with open(os.path.join(self.path, "bodies", entry["body"]), "rb") as f:
+            return entry["status"], entry["content_type"], f.read()
+
+    def add(self, url, status, content_type, body):
+        digest = hashlib.sha1(body).hexdigest()
+        body_file = os.path.join(self.path, "bodies", digest)
+        os.makedirs(os.path.dirname(body_file), exist_ok=True)
+        if not os.path.exists(body_file):
+            with open(body_file, "wb") as f:
+                f.write(body)
+        with self._lock:
+            self._index[url] = {
+                "status": status,
+                "content_type": content_type,
+                "body": digest,
+            }
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            with open(os.path.join(self.path, "index.json"), "w") as f:
+                json.dump(self._index, f, indent=1, sort_keys=True)
+
+
+def cookie_header(cookies, url):
+    """Cookie header of the WebDriver cookies (driver.get_cookies()) sent with url, or None."""
+    scheme, host, path = urlsplit(url)[:3]
+    host = host.split(":", 1)[0]
+    pairs = []
+    for cookie in cookies:
+        domain = cookie.get("domain", host).lstrip(".")
+        if host != domain and not host.endswith("." + domain):
+            continue
+        if not (path or "/").startswith(cookie.get("path", "/")):
+            continue
+        if cookie.get("secure") and scheme != "https":
+            continue
+        pairs.append("%s=%s" % (cookie["name"], cookie["value"]))
+    return "; ".join(pairs) or None
+
+
+def fetch(url, headers=None):
+    """(status, content type, body bytes) of url from the network."""
+    headers = dict({"User-Agent": USER_AGENT}, **(headers or {}))
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            return response.status, response.headers.get_content_type(), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get_content_type(), e.read()
+
+
+class Recorder:
+    """Fetch URLs loaded by tests into an archive in background."""
+
+    def __init__(self, archive, skip_prefix=None):
+        self.archive = archive
+        # e.g. URLs of the local server itself
+        self.skip_prefix = skip_prefix
+        self._seen = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=FETCH_WORKERS, thread_name_prefix="site-record"
+        )
+
+    def page_loaded(self, driver, metrics):
+        """page_metrics listener: record the current page and its sub-resources."""
+        try:
+            page = driver.execute_script(_PAGE_URLS_JS)
+            cookies = driver.get_cookies()
+        except Exception as e:
+            log.warning("Failed to list page resources: %s", e)
+            return
+        for url in page["urls"]:
+            url = url.split("#", 1)[0]
+            if self.skip_prefix and url.startswith(self.skip_prefix):
+                continue
+            if url.startswith("http") and url not in self._seen:
+                self._seen.add(url)
+                headers = {"User-Agent": page["userAgent"]}
+                cookie = cookie_header(cookies, url)
+                if cookie:
+                    headers["Cookie"] = cookie
+                self._executor.submit(contextvars.copy_context().run, self._record, url, headers)
+
+    def _record(self, url, headers=None):
+        try:
+            status, content_type, body = fetch(url, headers)
+        except Exception as e:
+            log.warning("Failed to record %s: %s", url, e)
+            return
+        self.archive.add(url, status, content_type, body)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.archive.save()
+        log.info("Recorded %d URLs to %s", len(self._seen), self.archive.path)
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "SiteReplay/1.0"
+
+    def log_message(self, format, *args):
+        log.debug("replay: " + format, *args)
+
+    def do_GET(self):
+        server = self.server
+        if self.path in server.pages:
+            self._send(200, "text/html", server.pages[self.path].encode("utf-8"))
+            return
+
+        match = re.match(r"^/(https?)/([^/]+)(/.*)?$", self.path)
+        if match is None:
+            # root-relative URL of a replayed page, e.g. /static/x.css
+            referer = self.headers.get("Referer", "")
+            origin = re.match(r"^https?://[^/]+(/https?/[^/]+)", referer)
+            prefix = origin.group(1) if origin else server.last_origin
+            if prefix:
+                self.send_response(307)
+                self.send_header("Location", prefix + self.path)
+                self.end_headers()
+            else:
+                self._send(404, "text/plain", b"Not found")
+            return
+
+        scheme, host, path = match.group(1), match.group(2), match.group(3) or "/"
+        url = "%s://%s%s" % (scheme, host, path)
+        entry = server.archive.get(url) if server.archive else None
+        if entry is None:
+            log.info("replay: not archived: %s", url)
+            self._send(404, "text/plain", b"Not archived: " + url.encode("utf-8"))
+            return
+        status, content_type, body = entry
+        if content_type == "text/html":
+            server.last_origin = "/%s/%s" % (scheme, host)
+        if any(text_type in content_type for text_type in _TEXT_TYPES):
+            body = server.rewrite(body)
+        self._send(status, content_type, body)
+
+    def _send(self, status, content_type, body):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if not server.bandwidth:
+            self.wfile.write(body)
+            return
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start : start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / server.bandwidth)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Local HTTP server of archived sites and registered pages."""
+
+    daemon_threads = True
+
+    def __init__(self, archive=None, latency=0.0, bandwidth=0, host="127.0.0.1"):
+        super().__init__((host, 0), _ReplayHandler)
+        self.archive = archive
+        # secs before each response, and bytes per sec, 0 is unlimited
+        self.latency = latency
+        self.bandwidth = bandwidth
+        # path -> html
+        self.pages = {}
+        self.last_origin = None
+        self.base = "http://%s:%d" % self.server_address[:2]
+        self._origin_re = None
+        if archive is not None:
+            origins = sorted(archive.origins(), key=len, reverse=True)
+            if origins:
+                hosts = "|".join(re.escape(urlsplit(o).netloc) for o in origins)
+                self._origin_re = re.compile(
+                    r"(https?:)?//(%s)(?=[/\"'\s)?#]|$)" % hosts
+                )
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="site-replay", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def add_page(self, path, html):
+        self.pages[path] = html
+
+    def local_url(self, path):
+        return self.base + path
+
+    def replay_url(self, url):
+        """Local URL of an archived URL."""
+        scheme, netloc, path, query, _ = urlsplit(url)
+        return "%s/%s/%s%s%s" % (
+            self.base,
+            scheme,
+            netloc,
+            path or "/",
+            "?" + query if query else "",
+        )
+
+    def rewrite(self, body):
+        """Point absolute URLs of archived sites in a text body to this server."""
+        if self._origin_re is None:
+            return body
+        text = body.decode("utf-8", errors="surrogateescape")
+
+        def local(match):
+            scheme = (match.group(1) or "https:").rstrip(":")
+            return "%s/%s/%s" % (self.base, scheme, match.group(2))
+
+        return self._origin_re.sub(local, text).encode("utf-8", errors="surrogateescape")
+
+
+class Site:
+    """What tests use via the "site" fixture, see module doc."""
+
+    def __init__(self, mode, server):
+        self.mode = mode
+        self.server = server
+
+    def url(self, url):
+        if self.mode == "replay":
+            return self.server.replay_url(url)
+        return url
+
+    def local_url(self, path):
+        return self.server.local_url(path)
+
+    def add_page(self, path, html):
+        self.server.add_page(path, html)
+
+
+def pytest_addoption(parser):
+    parser.addini("site_replay", "Site record / replay mode: off, record or replay.", default="off")
+    parser.addini("site_archive", "Directory of recorded sites.", default="site_archive")
+    parser.addoption(
+        "--site-replay",
+        choices=MODES,
+        default=None,
+        help="record: save sites loaded by tests, replay: serve them from a local server.",
+    )
+    parser.addoption(
+        "--replay-latency-ms",
+        type=float,
+        default=0,
+        help="Delay each replayed response by this many ms.",
+    )
+    parser.addoption(
+        "--replay-bandwidth-kbps",
+        type=float,
+        default=0,
+        help="Limit the bandwidth of each replayed response, in KB/s.",
+    )
+
+
+@pytest.fixture(scope="session")
+def site(pytestconfig):
+    mode = pytestconfig.getoption("site_replay") or pytestconfig.getini("site_replay")
+    if mode not in MODES:
+        raise ValueError("site_replay must be one of %s, got '%s'" % (MODES, mode))
+    archive_dir = os.path.join(str(pytestconfig.rootpath), pytestconfig.getini("site_archive"))
+
+    server = ReplayServer(
+        SiteArchive(archive_dir) if mode == "replay" else None,
+        latency=pytestconfig.getoption("replay_latency_ms") / 1000,
+        bandwidth=pytestconfig.getoption("replay_bandwidth_kbps") * 1024,
+    ).start()
+    recorder = None
+    if mode == "record":
+        recorder = Recorder(SiteArchive(archive_dir), skip_prefix=server.base)
+        page_metrics.page_load_listeners.append(recorder.page_loaded)
+    log.info("Site server in %s mode at %s", mode, server.base)
+    yield Site(mode, server)
+
+    server.stop()
+    if recorder is not None:
+        page_metrics.page_load_listeners.remove(recorder.page_loaded)
+        recorder.close()
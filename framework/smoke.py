@@ -0,0 +1,362 @@
+"""
+Smoke checks of many URLs, run concurrently: load the URL, match the title, find some elements.
+
+Checks are rows of a CSV table, smoke_sites.csv by default (smoke_tables in pytest.ini, several
+files separated by spaces):
+
+    id,url,title,title_contains,locators,browser
+    python.org,https://www.python.org/,Welcome to Python.org,,name=q; id=top,
+    selenium.dev,https://www.selenium.dev/,,Selenium,,Firefox
+
+  - title: exact title, title_contains: part of the title, either or both may be empty
+  - locators: "by=value" separated by ";", by is one of LOCATOR_TYPES, e.g. css=#search
+  - browser: DEFAULT_BROWSER if empty; id: the URL without scheme if empty
+  - rows whose id or url starts with # are skipped
+
+Every test with a "smoke_row" argument is parametrized with the rows, so each row is its own
+pytest result, and fetches the result of its row from the "smoke" fixture:
+
+    def test_smoke(smoke_row, smoke):
+        result = smoke.result(smoke_row)
+        assert result.ok, result.message
+
+On first use the fixture starts checking all selected rows on a thread pool of smoke_workers
+threads (--smoke-workers, default 4), each with its own browser per browser type, reset between
+rows like pooled drivers. So the test of a row usually just picks up a finished result. Drivers
+wear ScreenshotListener, and a failed row's screenshot is attached to its report. In a
+pytest-xdist worker rows are only checked when their test runs, xdist runs them in parallel.
+"""
+
+import contextvars
+import csv
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+
+from conftest import log
+from framework.artifacts import store as artifact_store
+from framework.driver_factory import DEFAULT_BROWSER, create_driver
+from framework.driver_pool import driver_options, reset_driver
+from framework.elements import elements_present
+from framework.logs import set_current_test
+from framework.screenshots import capture
+from framework.timing import current_test
+from framework.waits import TIMEWAIT_PAGE_LOAD, TIMEWAIT_PAGE_LOAD_GET
+
+DEFAULT_WORKERS = 4
+
+LOCATOR_TYPES = {
+    "id": By.ID,
+    "name": By.NAME,
+    "css": By.CSS_SELECTOR,
+    "xpath": By.XPATH,
+    "link": By.LINK_TEXT,
+    "class": By.CLASS_NAME,
+    "tag": By.TAG_NAME,
+}
+
+SmokeRow = namedtuple("SmokeRow", "id url title title_contains locators browser")
+
+
+class SmokeResult:
+    """Outcome of the checks of a row."""
+
+    def __init__(self, row, errors, secs, screenshot=None):
+        self.row = row
+        self.errors = errors
+        self.secs = secs
+        self.screenshot = screenshot
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def message(self):
+        return "%s: %s" % (self.row.url, "; ".join(self.errors))
+
+
+def parse_locators(text):
+    """((by, value), ...) of "by=value; by=value"."""
+    locators = []
+    for part in (text or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        kind, _, value = part.partition("=")
+        if kind.strip() not in LOCATOR_TYPES or not value.strip():
+            raise ValueError(
+                "Bad locator '%s', expected by=value with by in %s" % (part, sorted(LOCATOR_TYPES))
+            )
+        locators.append((LOCATOR_TYPES[kind.strip()], value.strip()))
+    return tuple(locators)
+
+
+def load_rows(path):
+    """SmokeRows of a CSV table, see module doc."""
+    rows = []
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for line in reader:
+            url = (line.get("url") or "").strip()
+            row_id = (line.get("id") or "").strip() or url.split("://", 1)[-1]
+            if not url or url.startswith("#") or row_id.startswith("#"):
+                continue
+            try:
+                locators = parse_locators(line.get("locators"))
+            except ValueError as e:
+                raise ValueError("%s line %d: %s" % (path, reader.line_num, e))
+            rows.append(
+                SmokeRow(
+                    row_id,
+                    url,
+                    (line.get("title") or "").strip() or None,
+                    (line.get("title_contains") or "").strip() or None,
+                    locators,
+                    (line.get("browser") or "").strip() or DEFAULT_BROWSER,
+                )
+            )
+    return rows
+
+
+def _title_matches(driver, row):
+    title = driver.title
+    if row.title is not None and title != row.title:
+        return False
+    return row.title_contains is None or row.title_contains in title
+
+
+class SmokeRunner:
+    """Check rows on a pool of threads, each thread with its own drivers."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, launch_options=None, site=None):
+        self.workers = workers
+        self.launch_options = launch_options or {}
+        self.site = site
+        self.results = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # all drivers of all threads, to quit them on close
+        self._drivers = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smoke")
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def submit(self, row, nodeid=None):
+        """Start checking row unless it was already, return the future of its SmokeResult.
+
+        nodeid is the test of the row, the running test by default: logs, timings, circuit breaker
+        etc. of the check are the test's, though it runs on a thread of the pool and maybe earlier.
+        """
+        with self._lock:
+            future = self._futures.get(row)
+            if future is None:
+                nodeid = nodeid or current_test()
+                context = contextvars.Context()
+                if nodeid:
+                    context.run(set_current_test, nodeid, "call")
+                future = self._futures[row] = self._executor.submit(context.run, self._check, row)
+            return future
+
+    def result(self, row):
+        """SmokeResult of row, waiting for its checks."""
+        result = self.submit(row).result()
+        self.results[row] = result
+        self.finished = time.perf_counter()
+        return result
+
+    def _driver(self, browser):
+        drivers = getattr(self._local, "drivers", None)
+        if drivers is None:
+            drivers = self._local.drivers = {}
+        driver = drivers.get(browser)
+        if driver is None:
+            from pages import with_screenshots
+
+            log.info("Launching %s driver for smoke checks...", browser)
+            raw = create_driver(browser, **self.launch_options)
+            raw.set_page_load_timeout(TIMEWAIT_PAGE_LOAD_GET)
+            with self._lock:
+                self._drivers.append(raw)
+            driver = drivers[browser] = with_screenshots(raw)
+        return driver
+
+    def _check(self, row):
+        start = time.perf_counter()
+        errors = []
+        driver = None
+        try:
+            driver = self._driver(row.browser)
+            driver.get(self.site.url(row.url) if self.site is not None else row.url)
+            if not self._wait_title(driver, row):
+                errors.append(
+                    "title '%s' doesn't match %s"
+                    % (driver.title, "'%s'" % row.title if row.title else "'*%s*'" % row.title_contains)
+                )
+            if row.locators:
+                present = elements_present(driver, row.locators, timeout=TIMEWAIT_PAGE_LOAD)
+                errors.extend(
+                    "%s=%s not found" % locator for locator, found in present.items() if not found
+                )
+        except WebDriverException as e:
+            errors.append("%s: %s" % (type(e).__name__, (e.msg or "").strip()))
+        except Exception as e:
+            # e.g. the driver failed to launch, still a failure of this row only
+            errors.append("%s: %s" % (type(e).__name__, e))
+
+        screenshot = None
+        if driver is not None:
+            raw = driver.wrapped_driver
+            screenshot = raw.__dict__.pop("_last_screenshot", None)
+            if errors and screenshot is None:
+                now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                try:
+                    screenshot = capture(raw, "smoke_failure_%s_%s" % (_file_name(row.id), now))
+                except Exception as e:
+                    log.warning("Failed to take smoke screenshot of %s: %s", row.url, e)
+                raw.__dict__.pop("_last_screenshot", None)
+            self._reset(raw, row.browser)
+
+        secs = time.perf_counter() - start
+        if errors:
+            log.warning("Smoke check of %s failed in %.2fs: %s", row.url, secs, "; ".join(errors))
+        else:
+            log.info("Smoke check of %s passed in %.2fs", row.url, secs)
+        return SmokeResult(row, errors, secs, screenshot)
+
+    def _wait_title(self, driver, row):
+        from selenium.webdriver.support.wait import WebDriverWait
+
+        try:
+            return WebDriverWait(driver, TIMEWAIT_PAGE_LOAD).until(lambda d: _title_matches(d, row))
+        except TimeoutException:
+            return False
+
+    def _reset(self, raw, browser):
+        try:
+            reset_driver(raw)
+        except Exception as e:
+            log.info("Replacing %s smoke driver, reset failed: %s", browser, e)
+            self._local.drivers.pop(browser, None)
+            with self._lock:
+                self._drivers.remove(raw)
+            try:
+                raw.quit()
+            except Exception as e:
+                log.warning("Failed to quit %s smoke driver: %s", browser, e)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for driver in self._drivers:
+            try:
+                driver.quit()
+            except Exception as e:
+                log.warning("Failed to quit smoke driver: %s", e)
+        self._drivers = []
+
+
+def _file_name(text):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in text)
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "smoke_tables",
+        "CSV tables of smoke checks, separated by spaces.",
+        default="smoke_sites.csv",
+    )
+    parser.addini(
+        "smoke_workers",
+        "Concurrent threads (browsers) for smoke checks.",
+        default=str(DEFAULT_WORKERS),
+    )
+    parser.addoption(
+        "--smoke-workers",
+        type=int,
+        default=None,
+        help="Concurrent threads, each with its own browser, for smoke checks.",
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if "smoke_row" not in metafunc.fixturenames:
+        return
+    config = metafunc.config
+    rows = []
+    for name in config.getini("smoke_tables").split():
+        path = os.path.join(str(config.rootpath), name)
+        if os.path.exists(path):
+            rows.extend(load_rows(path))
+        else:
+            log.warning("Smoke table %s not found", path)
+    metafunc.parametrize("smoke_row", rows, ids=[row.id for row in rows])
+
+
+smoke_key = pytest.StashKey[SmokeRunner]()
+
+
+def _row_of(item):
+    callspec = getattr(item, "callspec", None)
+    return callspec.params.get("smoke_row") if callspec is not None else None
+
+
+@pytest.fixture(scope="session")
+def smoke(request, site):
+    config = request.config
+    workers = config.getoption("smoke_workers") or int(config.getini("smoke_workers"))
+    runner = SmokeRunner(workers, driver_options(config), site)
+    config.stash[smoke_key] = runner
+    # xdist workers only know the tests they got so far, check rows as their tests run
+    if not hasattr(config, "workerinput"):
+        for item in request.session.items:
+            row = _row_of(item)
+            if row is not None:
+                runner.submit(row, item.nodeid)
+    yield runner
+    runner.close()
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when != "call" or not report.failed:
+        return
+    runner = item.config.stash.get(smoke_key, None)
+    row = _row_of(item)
+    result = runner.results.get(row) if runner is not None and row is not None else None
+    if result is None or result.screenshot is None:
+        return
+    try:
+        new_extras = getattr(report, "extras", [])
+        new_extras.append(artifact_store.screenshot_extra(result.screenshot, item.nodeid))
+        report.extras = new_extras
+    except Exception as e:
+        log.warning("Failed to attach smoke screenshot to report: %s", e)
+
+
+def pytest_terminal_summary(terminalreporter):
+    runner = terminalreporter.config.stash.get(smoke_key, None)
+    if runner is None or not runner.results:
+        return
+    results = list(runner.results.values())
+    failed = sum(1 for result in results if not result.ok)
+    terminalreporter.write_sep("-", "smoke checks")
+    terminalreporter.write_line(
+        "%d rows (%d failed) on %d workers in %.2fs, %.2fs if run one by one"
+        % (
+            len(results),
+            failed,
+            runner.workers,
+            (runner.finished or runner.started) - runner.started,
+            sum(result.secs for result in results),
+        )
+    )
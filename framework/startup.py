@@ -0,0 +1,93 @@
+"""
+Budget of the startup cost of a test run: importing conftest, its plugins and the test modules,
+and collecting the tests, i.e. most of what 'pytest --collect-only' does.
+
+    [pytest]
+    collect_budget_ms = 1000
+
+The terminal summary shows the time and whether it was over budget. Only runs with --collect-only
+or --check-collect-budget fail then, as the time of a full run varies with the machine's load:
+
+    pytest --collect-only -q --check-collect-budget
+
+pytest-xdist workers don't check it, the controller does.
+Typical cause is a module level import of selenium's remote WebDriver, e.g. WebDriverWait or
+EventFiringWebDriver: import it inside the test or page object module instead, see pages.py.
+Find slow imports by
+    python -X importtime -m pytest --collect-only -q -s 2> imports.txt
+"""
+
+import sys
+import time
+
+import pytest
+
+from conftest import import_started, log
+
+# modules which are slow to import and only needed when tests run
+HEAVY_MODULES = ("selenium.webdriver.remote.webdriver", "numpy", "PIL", "psutil")
+
+startup_key = pytest.StashKey[float]()
+# message of a startup over budget
+overrun_key = pytest.StashKey[str]()
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "collect_budget_ms",
+        "Fail if importing conftest, plugins, test modules and collecting takes longer, 0 is no limit.",
+        default="0",
+    )
+    parser.addoption(
+        "--check-collect-budget",
+        action="store_true",
+        default=False,
+        help="Fail the run if startup took longer than collect_budget_ms, always on with --collect-only.",
+    )
+
+
+def _enforced(config):
+    return config.getoption("check_collect_budget") or config.option.collectonly
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_finish(session):
+    config = session.config
+    # workers start later than the controller and collect in parallel, their time says little
+    if hasattr(config, "workerinput"):
+        return
+    elapsed = time.perf_counter() - import_started
+    config.stash[startup_key] = elapsed
+    log.info("Startup (imports and collection) took %.0fms", elapsed * 1000)
+    budget = float(config.getini("collect_budget_ms"))
+    if budget and elapsed * 1000 > budget:
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        message = "Startup took %.0fms, over collect_budget_ms %.0fms%s" % (
+            elapsed * 1000,
+            budget,
+            "; imported during collection: %s" % ", ".join(loaded) if loaded else "",
+        )
+        config.stash[overrun_key] = message
+        log.warning(message)
+
+
+def pytest_sessionfinish(session):
+    if overrun_key in session.config.stash and _enforced(session.config):
+        if session.exitstatus == pytest.ExitCode.OK:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter):
+    elapsed = terminalreporter.config.stash.get(startup_key, None)
+    if elapsed is None:
+        return
+    budget = float(terminalreporter.config.getini("collect_budget_ms"))
+    terminalreporter.write_sep("-", "startup")
+    terminalreporter.write_line(
+        "imports and collection took %.0fms%s"
+        % (elapsed * 1000, ", budget %.0fms" % budget if budget else "")
+    )
+    overrun = terminalreporter.config.stash.get(overrun_key, None)
+    if overrun:
+        markup = {"red": True} if _enforced(terminalreporter.config) else {"yellow": True}
+        terminalreporter.write_line(overrun, **markup)
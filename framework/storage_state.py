@@ -0,0 +1,295 @@
+"""
+Snapshots of browser storage state, so a setup flow runs once and later tests start where it ended.
+
+A state is the current URL, the cookies, and localStorage / sessionStorage of the current origin.
+The "storage_states" fixture (session scoped) runs a setup flow on first use and saves the state
+under a name, later tests restore it into their driver instead of replaying the flow:
+
+    def test_pypi_search(wd, site, storage_states):
+        from pages import PythonOrgHomepage
+
+        def open_pypi(driver):
+            driver.get(site.url("https://www.python.org/"))
+            PythonOrgHomepage(driver).click_pypi()
+
+        storage_states.ensure(
+            "pypi", wd, open_pypi,
+            depends_on=[PythonOrgHomepage],
+            context=site.url("https://www.python.org/"),
+        )
+        # wd is on pypi.org now, with the cookies and storage of the flow
+
+States are kept in .storage_states/<name>.json (storage_state_dir in pytest.ini) and reused by
+later runs until they are older than storage_state_max_age secs (default 3600), or until the
+source of the setup function or of depends_on (page object classes incl. their base classes,
+or functions) changed, or context changed: anything else the state depends on, e.g. the replayed
+URL of the start page, whose port differs per run.
+
+Restoring costs one page load: on Chromium cookies of all domains are set via DevTools and the
+storage is set by a script which runs before the page's own scripts. Other browsers first load
+the origin to set cookies and storage, then the URL.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from conftest import log
+
+DEFAULT_MAX_AGE = 3600
+
+_READ_STORAGE_JS = """
+function entries(storage) {
+  var result = {};
+  try {
+    for (var i = 0; i < storage.length; i++) {
+      var key = storage.key(i);
+      result[key] = storage.getItem(key);
+    }
+  } catch (e) {}
+  return result;
+}
+return [entries(window.localStorage), entries(window.sessionStorage)];
+"""
+
+# arguments: origin, localStorage entries, sessionStorage entries
+_WRITE_STORAGE_JS = """
+(function (origin, local, session) {
+  if (location.origin !== origin) return;
+  try {
+    Object.keys(local).forEach(function (k) { localStorage.setItem(k, local[k]); });
+    Object.keys(session).forEach(function (k) { sessionStorage.setItem(k, session[k]); });
+  } catch (e) {}
+})(%s, %s, %s);
+"""
+
+# WebDriver add_cookie() keys
+_COOKIE_KEYS = ("name", "value", "path", "domain", "secure", "httpOnly", "expiry", "sameSite")
+
+
+def _raw(driver):
+    # unwrap EventFiringWebDriver
+    return getattr(driver, "wrapped_driver", driver)
+
+
+def _has_cdp(driver):
+    return hasattr(_raw(driver), "execute_cdp_cmd")
+
+
+def fingerprint(*objects, context=None):
+    """Hash of the source of functions and classes, incl. the base classes of classes."""
+    digest = hashlib.sha1(repr(context).encode("utf-8"))
+    for obj in objects:
+        parts = [c for c in obj.__mro__ if c is not object] if inspect.isclass(obj) else [obj]
+        for part in parts:
+            try:
+                source = inspect.getsource(part)
+            except (OSError, TypeError):
+                code = getattr(part, "__code__", None)
+                source = repr(code.co_code if code else part)
+            digest.update(source.encode("utf-8", errors="replace"))
+    return digest.hexdigest()
+
+
+def capture_state(driver):
+    """Storage state of driver: {"url", "cookies", "local", "session"}."""
+    raw = _raw(driver)
+    if _has_cdp(raw):
+        # cookies of all domains, not only of the current one
+        cookies = [
+            {
+                "name": c["name"],
+                "value": c["value"],
+                "domain": c["domain"],
+                "path": c["path"],
+                "secure": c["secure"],
+                "httpOnly": c["httpOnly"],
+                "sameSite": c.get("sameSite"),
+                "expiry": int(c["expires"]) if c.get("expires", -1) > 0 else None,
+            }
+            for c in raw.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+        ]
+    else:
+        cookies = raw.get_cookies()
+    local, session = raw.execute_script(_READ_STORAGE_JS)
+    return {
+        "url": raw.current_url,
+        "cookies": cookies,
+        "local": local,
+        "session": session,
+    }
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return "%s://%s" % (parts.scheme, parts.netloc)
+
+
+def _write_storage_js(state):
+    return _WRITE_STORAGE_JS % (
+        json.dumps(_origin(state["url"])),
+        json.dumps(state["local"]),
+        json.dumps(state["session"]),
+    )
+
+
+def _restore_cdp(raw, state):
+    params = []
+    for cookie in state["cookies"]:
+        param = {k: cookie[k] for k in ("name", "value", "domain", "path") if cookie.get(k)}
+        param["secure"] = bool(cookie.get("secure"))
+        param["httpOnly"] = bool(cookie.get("httpOnly"))
+        if cookie.get("sameSite"):
+            param["sameSite"] = cookie["sameSite"]
+        if cookie.get("expiry"):
+            param["expires"] = cookie["expiry"]
+        params.append(param)
+    raw.execute_cdp_cmd("Network.enable", {})
+    raw.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+    script = raw.execute_cdp_cmd(
+        "Page.addScriptToEvaluateOnNewDocument", {"source": _write_storage_js(state)}
+    )
+    try:
+        raw.get(state["url"])
+    finally:
+        raw.execute_cdp_cmd(
+            "Page.removeScriptToEvaluateOnNewDocument", {"identifier": script["identifier"]}
+        )
+
+
+def _restore_webdriver(raw, state):
+    # cookies and storage can only be set for the current document's origin
+    raw.get(_origin(state["url"]) + "/")
+    host = urlsplit(state["url"]).hostname or ""
+    for cookie in state["cookies"]:
+        domain = (cookie.get("domain") or host).lstrip(".")
+        if not (host == domain or host.endswith("." + domain)):
+            log.debug("Cookie %s of %s not restored from %s", cookie["name"], domain, host)
+            continue
+        raw.add_cookie({k: cookie[k] for k in _COOKIE_KEYS if cookie.get(k) is not None})
+    raw.execute_script(_write_storage_js(state))
+    raw.get(state["url"])
+
+
+def restore_state(driver, state):
+    """Load a state captured by capture_state() into driver."""
+    raw = _raw(driver)
+    if _has_cdp(raw):
+        _restore_cdp(raw, state)
+    else:
+        _restore_webdriver(raw, state)
+
+
+class StateStore:
+    """Named storage states on disk, see module doc."""
+
+    def __init__(self, directory, max_age=DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self.created = 0
+        self.restored = 0
+        # secs the setup flows took when they ran, by name
+        self.setup_secs = {}
+        self.restore_secs = 0.0
+
+    def _path(self, name):
+        return os.path.join(self.directory, "%s.json" % name)
+
+    def load(self, name, code_fingerprint):
+        """The saved state of name, None if missing, expired or made by other code."""
+        try:
+            with open(self._path(name)) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("fingerprint") != code_fingerprint:
+            log.info("Storage state '%s' is outdated, its setup code or context changed", name)
+            return None
+        if time.time() - saved.get("saved_at", 0) > self.max_age:
+            log.info("Storage state '%s' expired", name)
+            return None
+        return saved
+
+    def save(self, name, state, code_fingerprint, setup_secs):
+        saved = dict(state, fingerprint=code_fingerprint, saved_at=time.time(), setup_secs=setup_secs)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(name) + ".%d.tmp" % os.getpid()
+        with open(tmp, "w") as f:
+            json.dump(saved, f)
+        # atomic, other xdist workers may read it
+        os.replace(tmp, self._path(name))
+
+    def ensure(self, name, driver, setup, depends_on=(), context=None):
+        """Restore state name into driver, or run setup(driver) and save the state it ends in.
+
+        Return True if the state was restored.
+        """
+        code_fingerprint = fingerprint(setup, *depends_on, context=context)
+        saved = self.load(name, code_fingerprint)
+        if saved is not None:
+            start = time.perf_counter()
+            try:
+                restore_state(driver, saved)
+            except WebDriverException as e:
+                log.warning("Failed to restore storage state '%s', running its setup: %s", name, e)
+            else:
+                self.restored += 1
+                self.restore_secs += time.perf_counter() - start
+                self.setup_secs.setdefault(name, saved.get("setup_secs", 0.0))
+                log.info("Restored storage state '%s' at %s", name, saved["url"])
+                return True
+
+        start = time.perf_counter()
+        setup(driver)
+        setup_secs = time.perf_counter() - start
+        self.save(name, capture_state(driver), code_fingerprint, setup_secs)
+        self.created += 1
+        self.setup_secs[name] = setup_secs
+        log.info("Saved storage state '%s' after %.2fs of setup", name, setup_secs)
+        return False
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "storage_state_dir", "Directory of saved browser storage states.", default=".storage_states"
+    )
+    parser.addini(
+        "storage_state_max_age",
+        "Secs a saved storage state is reused, e.g. until its session cookies expire.",
+        default=str(DEFAULT_MAX_AGE),
+    )
+
+
+storage_states_key = pytest.StashKey[StateStore]()
+
+
+@pytest.fixture(scope="session")
+def storage_states(pytestconfig):
+    store = StateStore(
+        os.path.join(str(pytestconfig.rootpath), pytestconfig.getini("storage_state_dir")),
+        float(pytestconfig.getini("storage_state_max_age")),
+    )
+    pytestconfig.stash[storage_states_key] = store
+    return store
+
+
+def pytest_terminal_summary(terminalreporter):
+    store = terminalreporter.config.stash.get(storage_states_key, None)
+    if store is None or not (store.created or store.restored):
+        return
+    terminalreporter.write_sep("-", "storage states")
+    terminalreporter.write_line(
+        "%d setup flows ran (%.2fs), %d states restored (%.2fs)"
+        % (
+            store.created,
+            sum(store.setup_secs.values()) if store.created else 0.0,
+            store.restored,
+            store.restore_secs,
+        )
+    )
@@ -0,0 +1,262 @@
+"""
+Wait timeouts learned from how long the waits of page objects took in previous runs.
+
+BasePage.wait_until(condition) waits with the timeout learned for its page and browser:
+    timeout = percentile of the recorded waits * factor + MIN_MARGIN
+clamped between MIN_TIMEOUT and the upper bound, TIMEWAIT_PAGE_LOAD by default. Until a page
+has MIN_SAMPLES recorded waits on a browser the upper bound is used. So a page which never
+matches, e.g. its title changed, fails after a few seconds instead of the full 15s.
+
+A wait which times out below its upper bound is recorded as a sample of its timeout, as it took
+at least that long. If a page is just slower now, its timeouts reach the percentile after a few
+runs and the learned timeout grows by the factor with each further timeout, up to the upper bound.
+
+Waits are kept in .wait_history.json (wait_history in pytest.ini), the last MAX_SAMPLES per page
+and browser. Options in pytest.ini:
+  - wait_timeout_percentile: default 95
+  - wait_timeout_factor: default 1.5
+  - --fixed-timeouts: always wait up to the upper bound, waits are still recorded
+
+The learned timeouts are shown in the summary of the HTML report and in the terminal summary.
+Waits which timed out below their upper bound are listed too.
+"""
+
+import json
+import os
+import threading
+import time
+from html import escape
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from conftest import log
+from framework import timing
+from framework.driver_factory import percentile
+from framework.timing import current_test
+from framework.waits import TIMEWAIT_PAGE_LOAD
+
+DEFAULT_PERCENTILE = 95
+DEFAULT_FACTOR = 1.5
+# secs added on top of percentile * factor, so fast pages don't get a sub-second timeout
+MIN_MARGIN = 1.0
+MIN_TIMEOUT = 2.0
+MIN_SAMPLES = 5
+MAX_SAMPLES = 50
+
+
+def browser_of(driver):
+    """Browser name of a driver, e.g. "chrome", without a WebDriver round trip."""
+    try:
+        return str(driver.capabilities.get("browserName", "unknown")).lower()
+    except Exception:
+        return "unknown"
+
+
+class WaitHistory:
+    """Durations of waits per "page|browser", and the timeouts derived from them."""
+
+    def __init__(self):
+        self.path = None
+        self.samples = {}
+        self.pct = DEFAULT_PERCENTILE
+        self.factor = DEFAULT_FACTOR
+        self.adaptive = True
+        # samples of this run, saved / sent to the xdist controller at the end
+        self.new_samples = {}
+        # key -> (timeout, upper bound) used by this run
+        self.used = {}
+        # (nodeid, key, timeout, upper bound) of waits which timed out below the upper bound
+        self.fast_failures = []
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.samples = json.load(f)
+            except ValueError as e:
+                log.warning("Ignoring broken wait history %s: %s", path, e)
+
+    @staticmethod
+    def key(page, browser):
+        return "%s|%s" % (page, browser)
+
+    def timeout(self, page, browser, upper_bound=TIMEWAIT_PAGE_LOAD):
+        """Timeout of a wait of page on browser."""
+        key = self.key(page, browser)
+        samples = self.samples.get(key, [])
+        if not self.adaptive or len(samples) < MIN_SAMPLES:
+            timeout = upper_bound
+        else:
+            learned = percentile(samples, self.pct) * self.factor + MIN_MARGIN
+            timeout = min(upper_bound, max(MIN_TIMEOUT, learned))
+        with self._lock:
+            self.used[key] = (timeout, upper_bound)
+        return timeout
+
+    def add(self, page, browser, secs):
+        key = self.key(page, browser)
+        with self._lock:
+            self.new_samples.setdefault(key, []).append(round(secs, 3))
+
+    def timed_out(self, nodeid, page, browser, timeout, upper_bound):
+        if timeout < upper_bound:
+            # censored sample: the wait took at least timeout
+            self.add(page, browser, timeout)
+            with self._lock:
+                self.fast_failures.append((nodeid, self.key(page, browser), timeout, upper_bound))
+
+    def merge(self, new_samples):
+        for key, secs in new_samples.items():
+            self.samples[key] = (self.samples.get(key, []) + secs)[-MAX_SAMPLES:]
+
+    def save(self):
+        if not self.new_samples:
+            return
+        self.merge(self.new_samples)
+        with open(self.path, "w") as f:
+            json.dump(self.samples, f, indent=1, sort_keys=True)
+
+    def rows(self):
+        """(page|browser, samples, percentile secs or None, timeout, upper bound) of this run."""
+        rows = []
+        for key, (timeout, upper_bound) in sorted(self.used.items()):
+            samples = self.samples.get(key, [])
+            pct = percentile(samples, self.pct) if samples else None
+            rows.append((key, len(samples), pct, timeout, upper_bound))
+        return rows
+
+
+history = WaitHistory()
+
+# functions called with (driver, page, label) before a wait, may raise to fail it at once
+wait_guards = []
+# functions called with (driver, page, label) when a wait timed out or failed
+wait_failure_listeners = []
+
+
+def wait_until(driver, condition, page, label=None, upper_bound=TIMEWAIT_PAGE_LOAD):
+    """TimedWebDriverWait(driver, learned timeout).until(condition), recording the time it took."""
+    for guard in wait_guards:
+        guard(driver, page, label)
+    browser = browser_of(driver)
+    timeout = history.timeout(page, browser, upper_bound)
+    start = time.perf_counter()
+    try:
+        result = timing.TimedWebDriverWait(driver, timeout, label=label).until(condition)
+    except Exception as e:
+        if isinstance(e, TimeoutException) and timeout < upper_bound:
+            log.warning(
+                "%s on %s: '%s' timed out after learned %.1fs (upper bound %ss)",
+                page,
+                browser,
+                label,
+                timeout,
+                upper_bound,
+            )
+            history.timed_out(current_test(), page, browser, timeout, upper_bound)
+        for listener in wait_failure_listeners:
+            listener(driver, page, label)
+        raise
+    history.add(page, browser, time.perf_counter() - start)
+    return result
+
+
+def _timeouts_table(rows):
+    body = "".join(
+        "<tr><td>%s</td><td>%s</td><td>%d</td><td>%s</td><td>%.1f</td><td>%s</td></tr>"
+        % (
+            escape(key.split("|")[0]),
+            escape(key.split("|")[1]),
+            samples,
+            "" if pct is None else "%.2f" % pct,
+            timeout,
+            upper_bound,
+        )
+        for key, samples, pct, timeout, upper_bound in rows
+    )
+    return (
+        "<h2>Learned wait timeouts</h2><table><tr><th>Page</th><th>Browser</th><th>Samples</th>"
+        "<th>p%d (s)</th><th>Timeout (s)</th><th>Upper bound (s)</th></tr>%s</table>"
+        % (history.pct, body)
+    )
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "wait_history", "File of wait durations of page objects.", default=".wait_history.json"
+    )
+    parser.addini(
+        "wait_timeout_percentile",
+        "Percentile of previous wait durations a learned timeout is based on.",
+        default=str(DEFAULT_PERCENTILE),
+    )
+    parser.addini(
+        "wait_timeout_factor",
+        "Learned timeout = percentile * factor + %ss." % MIN_MARGIN,
+        default=str(DEFAULT_FACTOR),
+    )
+    parser.addoption(
+        "--fixed-timeouts",
+        action="store_true",
+        default=False,
+        help="Wait up to the fixed upper bounds instead of learned timeouts.",
+    )
+
+
+def pytest_configure(config):
+    history.load(os.path.join(str(config.rootpath), config.getini("wait_history")))
+    history.pct = float(config.getini("wait_timeout_percentile"))
+    history.factor = float(config.getini("wait_timeout_factor"))
+    history.adaptive = not config.getoption("fixed_timeouts")
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    # pytest-xdist controller: workers send their samples, only the controller saves
+    for key, secs in getattr(node, "workeroutput", {}).get("wait_samples", {}).items():
+        history.new_samples.setdefault(key, []).extend(secs)
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if hasattr(config, "workerinput"):
+        config.workeroutput["wait_samples"] = history.new_samples
+        return
+    try:
+        history.save()
+    except OSError as e:
+        log.warning("Failed to save wait history: %s", e)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_html_results_summary(prefix, summary, postfix, session):
+    rows = history.rows()
+    if rows:
+        postfix.append(_timeouts_table(rows))
+
+
+def pytest_terminal_summary(terminalreporter):
+    rows = history.rows()
+    if not rows:
+        return
+    terminalreporter.write_sep("-", "learned wait timeouts")
+    for key, samples, pct, timeout, upper_bound in rows:
+        terminalreporter.write_line(
+            "%-40s %3d samples, p%d %s, timeout %.1fs of %ss"
+            % (
+                key,
+                samples,
+                history.pct,
+                "-" if pct is None else "%.2fs" % pct,
+                timeout,
+                upper_bound,
+            )
+        )
+    for nodeid, key, timeout, upper_bound in history.fast_failures:
+        terminalreporter.write_line(
+            "%s: %s timed out after learned %.1fs (upper bound %ss)"
+            % (nodeid, key, timeout, upper_bound)
+        )
@@ -0,0 +1,213 @@
+"""
+Per-command WebDriver latency of each test.
+
+instrument(driver) wraps driver.execute(), which every WebDriver command goes through,
+including element commands like click or text, so the wall time of every command is
+recorded for the running test. The "wd" fixture instruments its drivers.
+
+TimedWebDriverWait is a WebDriverWait which also records the number of polls and the
+total time of each until(), e.g. in is_page_matched() of page objects.
+
+Results:
+  - HTML report: a table of the slowest commands of each test, by total time
+  - <timing_dir>/<run start time>.jsonl: one JSON record per test with all commands and waits,
+    <run start time>_<worker>.jsonl per pytest-xdist worker. Other plugins add fields to the
+    record of a test by add_record_fields(), e.g. browser process metrics.
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from html import escape
+
+import pytest
+from pytest_html import extras
+
+from conftest import log
+from framework.logs import current_test_phase
+
+# number of commands in the report table of each test
+SLOWEST_COMMANDS = 10
+
+# path of the JSONL file of this run
+timing_file_key = pytest.StashKey[str]()
+
+# nodeid -> list of (command, secs)
+_commands = defaultdict(list)
+# nodeid -> list of (label, secs, polls, succeeded)
+_waits = defaultdict(list)
+# nodeid -> extra fields of its JSONL record
+_fields = defaultdict(dict)
+
+
+def current_test():
+    """nodeid of the test running in this context, or None outside tests, see framework/logs.py."""
+    return current_test_phase()[0]
+
+
+def current_worker():
+    """pytest-xdist worker id, e.g. "gw0", or None if not running in a worker."""
+    return os.environ.get("PYTEST_XDIST_WORKER")
+
+
+def add_record_fields(nodeid, **fields):
+    """Add fields to the JSONL record of a test, written after its teardown."""
+    _fields[nodeid].update(fields)
+
+
+def instrument(driver):
+    """Record the wall time of every command of driver, once per driver."""
+    # unwrap EventFiringWebDriver, commands are executed by the real driver
+    driver = getattr(driver, "wrapped_driver", driver)
+    if "execute" in driver.__dict__:
+        return driver
+    execute = driver.execute
+
+    def timed_execute(driver_command, params=None):
+        start = time.perf_counter()
+        try:
+            return execute(driver_command, params)
+        finally:
+            nodeid = current_test()
+            if nodeid:
+                _commands[nodeid].append((driver_command, time.perf_counter() - start))
+
+    driver.execute = timed_execute
+    return driver
+
+
+def _timed_wait_class():
+    # selenium's WebDriverWait imports all of its remote WebDriver, which collection doesn't
+    # need, so the class is defined on first use, see __getattr__ below.
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    class TimedWebDriverWait(WebDriverWait):
+        """WebDriverWait recording the time and number of polls of each until()."""
+
+        def __init__(self, driver, timeout, label=None, **kwargs):
+            super().__init__(driver, timeout, **kwargs)
+            self.label = label
+
+        def until(self, method, message=""):
+            polls = 0
+
+            def counted(driver):
+                nonlocal polls
+                polls += 1
+                return method(driver)
+
+            label = self.label or getattr(method, "__qualname__", repr(method))
+            succeeded = False
+            start = time.perf_counter()
+            try:
+                result = super().until(counted, message)
+                succeeded = True
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                log.info("wait '%s' took %.2fs, %d polls", label, elapsed, polls)
+                nodeid = current_test()
+                if nodeid:
+                    _waits[nodeid].append((label, elapsed, polls, succeeded))
+
+    TimedWebDriverWait.__qualname__ = "TimedWebDriverWait"
+    return TimedWebDriverWait
+
+
+def __getattr__(name):
+    if name == "TimedWebDriverWait":
+        cls = globals()[name] = _timed_wait_class()
+        return cls
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def summarize(commands):
+    """[(command, calls, total secs, max secs)] sorted by total secs, slowest first."""
+    stats = {}
+    for command, secs in commands:
+        calls, total, slowest = stats.get(command, (0, 0.0, 0.0))
+        stats[command] = (calls + 1, total + secs, max(slowest, secs))
+    return sorted(
+        ((command,) + stat for command, stat in stats.items()),
+        key=lambda row: row[2],
+        reverse=True,
+    )
+
+
+def _report_table(nodeid):
+    rows = "".join(
+        "<tr><td>%s</td><td>%d</td><td>%.3f</td><td>%.3f</td></tr>"
+        % (escape(command), calls, total, slowest)
+        for command, calls, total, slowest in summarize(_commands[nodeid])[
+            :SLOWEST_COMMANDS
+        ]
+    )
+    rows += "".join(
+        "<tr><td>wait: %s</td><td>%d polls</td><td>%.3f</td><td>%s</td></tr>"
+        % (escape(label), polls, secs, "ok" if succeeded else "timeout")
+        for label, secs, polls, succeeded in _waits[nodeid]
+    )
+    return (
+        "<table><tr><th>Slowest WebDriver commands</th><th>Calls</th>"
+        "<th>Total (s)</th><th>Max (s)</th></tr>%s</table>" % rows
+    )
+
+
+def pytest_addoption(parser):
+    parser.addini(
+        "timing_dir",
+        "Directory of the per run JSONL files of WebDriver command timings.",
+        default="timings",
+    )
+
+
+def pytest_configure(config):
+    timing_dir = os.path.join(str(config.rootpath), config.getini("timing_dir"))
+    name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    if current_worker():
+        # one file per xdist worker
+        name += "_" + current_worker()
+    config.stash[timing_file_key] = os.path.join(timing_dir, "%s.jsonl" % name)
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    nodeid = item.nodeid
+
+    if report.when == "call" and (_commands[nodeid] or _waits[nodeid]):
+        new_extras = getattr(report, "extras", [])
+        new_extras.append(extras.html(_report_table(nodeid)))
+        report.extras = new_extras
+
+    if report.when == "teardown":
+        commands = _commands.pop(nodeid, [])
+        waits = _waits.pop(nodeid, [])
+        fields = _fields.pop(nodeid, {})
+        if commands or waits or fields:
+            _write_record(item.config, nodeid, commands, waits, fields)
+
+
+def _write_record(config, nodeid, commands, waits, fields=None):
+    record = {
+        "nodeid": nodeid,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commands": [
+            {"command": command, "secs": round(secs, 4)} for command, secs in commands
+        ],
+        "waits": [
+            {"label": label, "secs": round(secs, 4), "polls": polls, "ok": succeeded}
+            for label, secs, polls, succeeded in waits
+        ],
+    }
+    record.update(fields or {})
+    timing_file = config.stash[timing_file_key]
+    try:
+        os.makedirs(os.path.dirname(timing_file), exist_ok=True)
+        with open(timing_file, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        log.warning("Failed to write timing record: %s", e)
@@ -0,0 +1,526 @@
+"""
+Visual regression checks: compare the page, or the region of an element, with a stored baseline.
+
+    from framework.visual import assert_visual_match
+
+    assert_visual_match(wd, "python_home")  # the viewport
+    assert_visual_match(wd, "python_nav", element=(By.ID, "mainnav"), ignore=[(By.ID, "ticker")])
+
+Baselines are PNGs in visual_baselines/<name>-<browser>.png (visual_baseline_dir in pytest.ini).
+A missing baseline is saved from the current screenshot and the check passes, pytest
+--update-visual-baselines replaces all checked baselines.
+
+The comparison runs on NumPy arrays, tile by tile (visual_tile px, default 40 which divides
+1920x1080):
+  1. tiles which are byte for byte the same are skipped, compared 8 bytes at a time
+  2. the other tiles get a perceptual signature: the mean grey levels of an 8x8 grid of blocks,
+     and the 64 bits of which blocks are brighter than the tile's mean (average hash). Tiles
+     whose bits are equal and whose block means are within SKIP_TOLERANCE are skipped too, they
+     only differ by rendering noise
+  3. the pixels of the remaining tiles are compared, a pixel differs when a channel differs by
+     more than visual_pixel_threshold (default 16 of 255)
+The check fails when more than visual_max_diff_ratio of the pixels differ (default 0.001) or
+the sizes differ. ignore takes (by, value) locators, all matching elements are ignored, and
+(x, y, width, height) rects in CSS pixels of the viewport.
+
+Mismatches attach a diff image to the HTML report: the current screenshot faded, differing
+pixels red, ignored regions blue. Needs numpy and Pillow, the check is skipped without them.
+
+Timing of full HD comparisons vs a plain diff of all pixels:
+    python -m framework.visual --runs 20
+"""
+
+import argparse
+import base64
+import io
+import os
+import time
+from html import escape
+
+import pytest
+from pytest_html import extras
+
+from conftest import log
+from framework.timeouts import browser_of
+from framework.timing import current_test
+
+DEFAULT_TILE = 40
+DEFAULT_PIXEL_THRESHOLD = 16
+DEFAULT_MAX_DIFF_RATIO = 0.001
+# max difference of the block means of a tile, in grey levels, to skip its pixel diff
+SKIP_TOLERANCE = 0.5
+# a hash bit is set for blocks brighter than the tile's mean by this many grey levels, so flat
+# tiles, e.g. white space, get stable bits
+HASH_MARGIN = 1.0
+# blocks per tile side of the tile signature
+GRID = 8
+
+DIFF_COLOR = (255, 0, 0)
+IGNORED_COLOR = (80, 80, 255)
+
+_RECTS_JS = """
+return [window.devicePixelRatio || 1, arguments[0].map(function (e) {
+  var r = e.getBoundingClientRect();
+  return [r.left, r.top, r.width, r.height];
+})];
+"""
+
+
+def _numpy():
+    # numpy is slow to import, only load it when a check runs, see framework/startup.py
+    try:
+        import numpy
+    except ImportError:
+        pytest.skip("visual checks need numpy")
+    return numpy
+
+
+def _pil_image():
+    try:
+        from PIL import Image
+    except ImportError:
+        pytest.skip("visual checks need Pillow")
+    return Image
+
+
+def decode_png(png):
+    """HxWx3 uint8 array of a PNG."""
+    np = _numpy()
+    return np.asarray(_pil_image().open(io.BytesIO(png)).convert("RGB"))
+
+
+def encode_png(image):
+    out = io.BytesIO()
+    _pil_image().fromarray(image).save(out, "PNG")
+    return out.getvalue()
+
+
+def _tiled(image, tile):
+    """(rows, cols, tile, tile, ...) view of image, whose sides are multiples of tile."""
+    h, w = image.shape[:2]
+    return image.reshape((h // tile, tile, w // tile, tile) + image.shape[2:]).swapaxes(1, 2)
+
+
+def tile_signatures(tiles):
+    """(block means, hash bits) of (n, tile, tile, 3) tiles.
+
+    Block means are (n, GRID, GRID) mean grey levels, hash bits the blocks brighter than their
+    tile's mean + HASH_MARGIN.
+    """
+    np = _numpy()
+    n, tile = tiles.shape[:2]
+    block = tile // GRID
+    # sums of the channels of block pixels of each row, as one BLAS product: much faster than
+    # numpy reductions over the short channel axis
+    ones = np.ones(block * 3, dtype=np.float32)
+    row_sums = np.ascontiguousarray(tiles).reshape(-1, block * 3).astype(np.float32) @ ones
+    sums = row_sums.reshape(n, GRID, block, GRID).sum(axis=2)
+    means = sums / (3.0 * block * block)
+    bits = means > means.mean(axis=(1, 2), keepdims=True) + HASH_MARGIN
+    return means, bits
+
+
+def _padded(image, tile):
+    np = _numpy()
+    h, w = image.shape[:2]
+    pad_h, pad_w = -h % tile, -w % tile
+    if not (pad_h or pad_w):
+        return np.ascontiguousarray(image)
+    return np.pad(image, ((0, pad_h), (0, pad_w), (0, 0)))
+
+
+def _channel_diff(a, b, pixel_threshold):
+    """Pixels of a and b whose channels differ by more than pixel_threshold."""
+    np = _numpy()
+    over = np.abs(a.astype(np.int16) - b) > pixel_threshold
+    return over[..., 0] | over[..., 1] | over[..., 2]
+
+
+def _changed_tiles(a, b, tile):
+    """(rows, cols) bool of tiles with any different byte, comparing 8 bytes at a time."""
+    np = _numpy()
+    h, w = a.shape[:2]
+    words = (a.reshape(h, -1).view(np.uint64) != b.reshape(h, -1).view(np.uint64))
+    return words.reshape(h // tile, tile, w // tile, tile * 3 // 8).any(axis=(1, 3))
+
+
+def compare(baseline, current, tile=DEFAULT_TILE, pixel_threshold=DEFAULT_PIXEL_THRESHOLD, ignore_mask=None):
+    """Pixels differing between two HxWx3 uint8 arrays of the same size.
+
+    Return (HxW bool mask of differing pixels, tiles with changes, tiles compared pixel by pixel).
+    ignore_mask: HxW bool, True for pixels to ignore.
+    """
+    np = _numpy()
+    if tile % GRID:
+        raise ValueError("tile must be a multiple of %d, got %d" % (GRID, tile))
+    h, w = current.shape[:2]
+    baseline = _padded(baseline, tile)
+    current = _padded(current, tile)
+    if ignore_mask is not None and ignore_mask.any():
+        baseline = baseline.copy()
+        current = current.copy()
+        baseline[:h, :w][ignore_mask] = 0
+        current[:h, :w][ignore_mask] = 0
+
+    # 1. tiles which are byte for byte the same are done
+    changed = np.nonzero(_changed_tiles(baseline, current, tile))
+    tiles_diff = np.zeros(baseline.shape[:2], dtype=bool)
+    if not changed[0].size:
+        return tiles_diff[:h, :w], 0, 0
+    if changed[0].size > tiles_diff.size // (2 * tile * tile):
+        # mostly changed, e.g. the layout moved: one diff of all pixels beats gathering tiles
+        mask = _channel_diff(baseline, current, pixel_threshold)[:h, :w]
+        return mask, int(changed[0].size), int(changed[0].size)
+    a = _tiled(baseline, tile)[changed]
+    b = _tiled(current, tile)[changed]
+
+    # 2. tiles whose perceptual signatures match only differ by noise, e.g. anti-aliasing
+    means_a, bits_a = tile_signatures(a)
+    means_b, bits_b = tile_signatures(b)
+    similar = (bits_a == bits_b).all(axis=(1, 2)) & (
+        np.abs(means_a - means_b).max(axis=(1, 2)) <= SKIP_TOLERANCE
+    )
+
+    # 3. pixel diff of the rest
+    rest = ~similar
+    _tiled(tiles_diff, tile)[changed[0][rest], changed[1][rest]] = _channel_diff(
+        a[rest], b[rest], pixel_threshold
+    )
+    return tiles_diff[:h, :w], int(changed[0].size), int(rest.sum())
+
+
+def diff_image(current, mask, ignore_mask=None):
+    """The current image faded, differing pixels in DIFF_COLOR, ignored ones in IGNORED_COLOR."""
+    np = _numpy()
+    out = current // 3 + 170
+    if ignore_mask is not None:
+        out[ignore_mask] = IGNORED_COLOR
+    out[mask] = DIFF_COLOR
+    return out.astype(np.uint8)
+
+
+class VisualSettings:
+    def __init__(self):
+        self.directory = "visual_baselines"
+        self.update = False
+        self.tile = DEFAULT_TILE
+        self.pixel_threshold = DEFAULT_PIXEL_THRESHOLD
+        self.max_diff_ratio = DEFAULT_MAX_DIFF_RATIO
+
+
+settings = VisualSettings()
+
+
+class VisualResult:
+    """Outcome of a visual check."""
+
+    def __init__(self, name, baseline_path, status, diff_pixels=0, total_pixels=0,
+                 tiles=(0, 0, 0), secs=0.0, diff_png=None, detail=""):
+        self.name = name
+        self.baseline_path = baseline_path
+        # "match", "mismatch" or "new"
+        self.status = status
+        self.diff_pixels = diff_pixels
+        self.total_pixels = total_pixels
+        # (tiles changed, tiles compared pixel by pixel, all tiles)
+        self.tiles = tiles
+        self.secs = secs
+        self.diff_png = diff_png
+        self.detail = detail
+
+    @property
+    def passed(self):
+        return self.status != "mismatch"
+
+    @property
+    def diff_ratio(self):
+        return self.diff_pixels / self.total_pixels if self.total_pixels else 0.0
+
+    @property
+    def message(self):
+        if self.detail:
+            return "Visual check '%s': %s" % (self.name, self.detail)
+        return "Visual check '%s': %d pixels (%.3f%%) differ from %s" % (
+            self.name,
+            self.diff_pixels,
+            self.diff_ratio * 100,
+            self.baseline_path,
+        )
+
+
+# nodeid -> [VisualResult]
+_records = {}
+
+
+def _locate(driver, element):
+    if isinstance(element, (tuple, list)):
+        return driver.find_element(*element)
+    return element
+
+
+def _regions(driver, element, ignore):
+    """(crop rect or None, ignore rects) in screenshot pixels."""
+    elements = [_locate(driver, element)] if element is not None else []
+    rects = []
+    for entry in ignore:
+        if isinstance(entry, (tuple, list)) and len(entry) == 4:
+            rects.append(entry)
+        elif isinstance(entry, (tuple, list)):
+            elements.extend(driver.find_elements(*entry))
+        else:
+            elements.append(entry)
+    # one round trip for the rects of all elements
+    ratio, element_rects = driver.execute_script(_RECTS_JS, elements)
+
+    crop = None
+    if element is not None:
+        crop = [round(v * ratio) for v in element_rects.pop(0)]
+    ignored = [[round(v * ratio) for v in rect] for rect in rects + element_rects]
+    if crop is not None:
+        ignored = [[x - crop[0], y - crop[1], w, h] for x, y, w, h in ignored]
+    return crop, ignored
+
+
+def _ignore_mask(shape, rects):
+    np = _numpy()
+    if not rects:
+        return None
+    mask = np.zeros(shape[:2], dtype=bool)
+    for x, y, w, h in rects:
+        mask[max(0, y):max(0, y + h), max(0, x):max(0, x + w)] = True
+    return mask
+
+
+def check_visual(driver, name, element=None, ignore=(), pixel_threshold=None, max_diff_ratio=None):
+    """Compare the viewport, or the region of element, with baseline name, see module doc.
+
+    element and ignore entries are (by, value) locators or WebElements, ignore entries also
+    (x, y, width, height) rects. Return a VisualResult, also shown in the HTML report.
+    """
+    pixel_threshold = settings.pixel_threshold if pixel_threshold is None else pixel_threshold
+    max_diff_ratio = settings.max_diff_ratio if max_diff_ratio is None else max_diff_ratio
+    path = os.path.join(settings.directory, "%s-%s.png" % (name, browser_of(driver)))
+
+    crop, ignored = _regions(driver, element, ignore)
+    current = decode_png(driver.get_screenshot_as_png())
+    if crop is not None:
+        x, y, w, h = crop
+        current = current[max(0, y):y + h, max(0, x):x + w]
+
+    if settings.update or not os.path.exists(path):
+        os.makedirs(settings.directory, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(encode_png(current))
+        log.info("Saved visual baseline %s", path)
+        result = VisualResult(name, path, "new", detail="baseline saved to %s" % path)
+    else:
+        with open(path, "rb") as f:
+            baseline = decode_png(f.read())
+        ignore_mask = _ignore_mask(current.shape, ignored)
+        if baseline.shape != current.shape:
+            result = VisualResult(
+                name,
+                path,
+                "mismatch",
+                detail="size %dx%d differs from baseline %dx%d"
+                % (current.shape[1], current.shape[0], baseline.shape[1], baseline.shape[0]),
+            )
+        else:
+            start = time.perf_counter()
+            mask, changed, compared = compare(
+                baseline, current, settings.tile, pixel_threshold, ignore_mask
+            )
+            secs = time.perf_counter() - start
+            diff_pixels = int(mask.sum())
+            total = mask.size - (int(ignore_mask.sum()) if ignore_mask is not None else 0)
+            tiles = -(-mask.shape[0] // settings.tile) * -(-mask.shape[1] // settings.tile)
+            status = "mismatch" if total and diff_pixels / total > max_diff_ratio else "match"
+            result = VisualResult(
+                name, path, status, diff_pixels, total, (changed, compared, tiles), secs,
+                encode_png(diff_image(current, mask, ignore_mask)) if diff_pixels else None,
+            )
+        log.info("%s", result.message)
+
+    nodeid = current_test()
+    if nodeid:
+        _records.setdefault(nodeid, []).append(result)
+    return result
+
+
+def assert_visual_match(driver, name, **kwargs):
+    """check_visual() and fail the test on a mismatch."""
+    result = check_visual(driver, name, **kwargs)
+    assert result.passed, result.message
+    return result
+
+
+def _result_extras(result):
+    rows = "<p>%s" % escape(result.message)
+    if result.status != "new" and not result.detail:
+        rows += ", %d of %d tiles changed, %d compared pixel by pixel, in %.1f ms" % (
+            result.tiles[0],
+            result.tiles[2],
+            result.tiles[1],
+            result.secs * 1000,
+        )
+    rows += "</p>"
+    shown = [extras.html(rows)]
+    if result.diff_png is not None:
+        shown.append(
+            extras.image(
+                base64.b64encode(result.diff_png).decode("ascii"),
+                name="Visual diff of %s" % result.name,
+                mime_type="image/png",
+            )
+        )
+    return shown
+
+
+def pytest_addoption(parser):
+    parser.addini("visual_baseline_dir", "Directory of visual baselines.", default="visual_baselines")
+    parser.addini(
+        "visual_tile", "Tile size in px of visual comparisons, a multiple of 8.", default=str(DEFAULT_TILE)
+    )
+    parser.addini(
+        "visual_pixel_threshold",
+        "Max difference of a color channel, 0-255, of pixels treated as equal.",
+        default=str(DEFAULT_PIXEL_THRESHOLD),
+    )
+    parser.addini(
+        "visual_max_diff_ratio",
+        "Max ratio of differing pixels of a passing visual check.",
+        default=str(DEFAULT_MAX_DIFF_RATIO),
+    )
+    parser.addoption(
+        "--update-visual-baselines",
+        action="store_true",
+        default=False,
+        help="Save the screenshots of visual checks as their new baselines.",
+    )
+
+
+def pytest_configure(config):
+    settings.directory = os.path.join(str(config.rootpath), config.getini("visual_baseline_dir"))
+    settings.update = config.getoption("update_visual_baselines")
+    settings.tile = int(config.getini("visual_tile"))
+    settings.pixel_threshold = int(config.getini("visual_pixel_threshold"))
+    settings.max_diff_ratio = float(config.getini("visual_max_diff_ratio"))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when != "call":
+        return
+    results = [result for result in _records.get(item.nodeid, ()) if result.status != "match"]
+    if not results:
+        return
+    new_extras = getattr(report, "extras", [])
+    for result in results:
+        new_extras.extend(_result_extras(result))
+    report.extras = new_extras
+
+
+def pytest_terminal_summary(terminalreporter):
+    results = [result for results in _records.values() for result in results]
+    if not results:
+        return
+    compared = [result for result in results if result.secs]
+    terminalreporter.write_sep("-", "visual checks")
+    terminalreporter.write_line(
+        "%d checks: %d mismatched, %d new baselines, %.1f ms per comparison"
+        % (
+            len(results),
+            sum(1 for result in results if result.status == "mismatch"),
+            sum(1 for result in results if result.status == "new"),
+            sum(result.secs for result in compared) / len(compared) * 1000 if compared else 0.0,
+        )
+    )
+
+
+def _synthetic_page(np, width, height, seed=0):
+    """A page-like image: white background, colored boxes and lines of "text"."""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(40):
+        x, y = rng.integers(0, width - 200), rng.integers(0, height - 100)
+        image[y:y + rng.integers(20, 100), x:x + rng.integers(50, 200)] = rng.integers(0, 255, 3)
+    for y in range(40, height - 20, 24):
+        line = rng.random((12, width // 2)) < 0.35
+        image[y:y + 12, 80:80 + width // 2][line] = 30
+    return image
+
+
+def benchmark(width=1920, height=1080, runs=20):
+    """{case: (p50 secs of compare(), of a diff of all pixels, tiles changed, tiles compared,
+    differing pixels)}, and the p50 secs of decoding the PNG as "decode png"."""
+    np = _numpy()
+    rng = np.random.default_rng(1)
+    baseline = _synthetic_page(np, width, height)
+    small = baseline.copy()
+    # one changed line of text
+    small[400:412, 80:400] = 255 - small[400:412, 80:400]
+    # +-1 on the pixels of the top third, like rendering differences of an image, perceptually
+    # the same
+    noise = baseline.copy()
+    top = noise[: height // 3].astype(np.int16) + rng.integers(-1, 2, (height // 3, width, 3))
+    noise[: height // 3] = top.clip(0, 255)
+    shifted = (baseline.astype(np.int16) + 40).clip(0, 255).astype(np.uint8)
+
+    def p50(fn):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return sorted(timings)[len(timings) // 2]
+
+    results = {}
+    cases = (
+        ("identical", baseline.copy()),
+        ("small change", small),
+        ("noise +-1", noise),
+        ("all changed", shifted),
+    )
+    for case, current in cases:
+        mask, changed, compared = compare(baseline, current)
+        results[case] = (
+            p50(lambda: compare(baseline, current)),
+            p50(lambda: _channel_diff(baseline, current, DEFAULT_PIXEL_THRESHOLD)),
+            changed,
+            compared,
+            int(mask.sum()),
+        )
+    png = encode_png(baseline)
+    results["decode png"] = p50(lambda: decode_png(png))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark visual comparisons of screenshots.")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    results = benchmark(args.width, args.height, args.runs)
+    tiles = -(-args.width // DEFAULT_TILE) * -(-args.height // DEFAULT_TILE)
+    print("%dx%d, %d tiles of %dpx, p50 of %d runs" % (args.width, args.height, tiles, DEFAULT_TILE, args.runs))
+    print(
+        "%-13s %10s %14s %8s %9s %12s"
+        % ("case", "tiled(ms)", "all pixels(ms)", "changed", "compared", "diff pixels")
+    )
+    for case, timings in results.items():
+        if case == "decode png":
+            continue
+        tiled, full, changed, compared, pixels = timings
+        print(
+            "%-13s %10.2f %14.2f %8d %9d %12d"
+            % (case, tiled * 1000, full * 1000, changed, compared, pixels)
+        )
+    print("decoding the PNG takes %.1f ms" % (results["decode png"] * 1000))
+
+
+if __name__ == "__main__":
+    main()
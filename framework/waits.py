@@ -0,0 +1,193 @@
+"""
+Adaptive page readiness waits, to replace fixed sleep() calls after navigation.
+
+wait_for_page_ready(driver) returns as soon as the page is ready, i.e.
+  - document.readyState is "complete"
+  - no fetch / XMLHttpRequest is pending
+  - the DOM had no mutations for a quiet period (0.3s by default), or it kept changing
+    for QUIET_MAX secs after the two above, e.g. a carousel or a ticker
+It polls with backoff, 50ms at first and up to 500ms, and gives up after TIMEWAIT_PAGE_LOAD.
+Only added / removed nodes and text changes count as mutations, not attributes, which
+CSS-driven animations change all the time.
+
+Pending requests are counted by a small probe script patching fetch / XMLHttpRequest.
+On Chromium it is registered via DevTools to run before page scripts, otherwise it is
+installed on first poll and only sees requests started after that.
+
+Each wait is recorded per test with the fixed sleep it replaces, and shown in the
+HTML report and the terminal summary as time saved.
+
+Usage:
+    wd.get("https://www.python.org/")
+    assert wait_for_page_ready(wd)  # instead of sleep(2), False if not ready in time
+"""
+
+import time
+from html import escape
+
+import pytest
+from pytest_html import extras
+from selenium.common.exceptions import WebDriverException
+
+from conftest import log
+from framework.timing import current_test
+
+# time to wait for get method to load a page completely before raising TimeoutException
+TIMEWAIT_PAGE_LOAD_GET = 60
+# explicit wait time in secs after loading a new page to check page match with driver.title.
+TIMEWAIT_PAGE_LOAD = 15
+# timeout for elements to load
+TIMEWAIT_ELEMENT_LOAD = TIMEWAIT_PAGE_LOAD
+
+# secs without DOM mutations to consider the page settled
+QUIET_PERIOD = 0.3
+# secs to wait for a quiet DOM once the page is loaded and has no pending requests
+QUIET_MAX = 1.0
+# the fixed sleep a readiness wait replaces by default, to report time saved
+FIXED_SLEEP = 2
+POLL_INITIAL = 0.05
+POLL_MAX = 0.5
+POLL_BACKOFF = 1.5
+
+_PROBE_INSTALL_JS = """
+if (!window.__readyProbe) {
+  var probe = window.__readyProbe = {pending: 0, lastMutation: Date.now()};
+  if (window.fetch) {
+    var origFetch = window.fetch;
+    window.fetch = function () {
+      probe.pending++;
+      return origFetch.apply(this, arguments).finally(function () { probe.pending--; });
+    };
+  }
+  var origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    probe.pending++;
+    this.addEventListener("loadend", function () { probe.pending--; });
+    return origSend.apply(this, arguments);
+  };
+  new MutationObserver(function () { probe.lastMutation = Date.now(); }).observe(
+    document, {subtree: true, childList: true, characterData: true});
+}
+"""
+
+_PROBE_STATE_JS = (
+    _PROBE_INSTALL_JS
+    + """
+return [document.readyState, window.__readyProbe.pending,
+        Date.now() - window.__readyProbe.lastMutation];
+"""
+)
+
+# nodeid -> list of (label, secs waited, fixed sleep replaced, ready)
+_records = {}
+
+
+def _install_probe(driver):
+    """Register the probe to run before page scripts on Chromium, once per driver."""
+    # unwrap EventFiringWebDriver, the probe belongs to the real driver
+    driver = getattr(driver, "wrapped_driver", driver)
+    if driver.__dict__.get("_ready_probe_installed") or not hasattr(
+        driver, "execute_cdp_cmd"
+    ):
+        return
+    try:
+        driver.execute_cdp_cmd(
+            "Page.addScriptToEvaluateOnNewDocument", {"source": _PROBE_INSTALL_JS}
+        )
+    except WebDriverException as e:
+        log.debug("Failed to register readiness probe: %s", e)
+    driver._ready_probe_installed = True
+
+
+def wait_for_page_ready(
+    driver,
+    timeout=TIMEWAIT_PAGE_LOAD,
+    quiet_period=QUIET_PERIOD,
+    label="page ready",
+    replaces_sleep=FIXED_SLEEP,
+    quiet_max=QUIET_MAX,
+):
+    """Wait until the page is loaded, has no pending requests and its DOM is quiet.
+
+    The DOM gets quiet_max secs to settle once the page is loaded and idle.
+    Return True if ready, False on timeout.
+    """
+    _install_probe(driver)
+    start = time.perf_counter()
+    deadline = start + timeout
+    interval = POLL_INITIAL
+    ready = False
+    # time the page was first seen loaded without pending requests
+    idle_since = None
+    while True:
+        try:
+            ready_state, pending, quiet_ms = driver.execute_script(_PROBE_STATE_JS)
+            if ready_state == "complete" and pending <= 0:
+                if idle_since is None:
+                    idle_since = time.perf_counter()
+                ready = (
+                    quiet_ms >= quiet_period * 1000
+                    or time.perf_counter() - idle_since >= quiet_max
+                )
+            else:
+                idle_since = None
+        except WebDriverException as e:
+            # e.g. document replaced during navigation, try again
+            log.debug("Readiness probe failed: %s", e)
+        if ready:
+            break
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        interval = min(interval * POLL_BACKOFF, POLL_MAX)
+
+    elapsed = time.perf_counter() - start
+    if ready:
+        log.info("%s in %.2fs", label, elapsed)
+    else:
+        log.warning("%s timed out after %.2fs", label, elapsed)
+    nodeid = current_test()
+    if nodeid:
+        _records.setdefault(nodeid, []).append((label, elapsed, replaces_sleep, ready))
+    return ready
+
+
+def _records_table(records):
+    rows = "".join(
+        "<tr><td>%s</td><td>%.2f</td><td>%.2f</td><td>%s</td></tr>"
+        % (escape(label), elapsed, replaced, "ready" if ready else "timeout")
+        for label, elapsed, replaced, ready in records
+    )
+    return (
+        "<table><tr><th>Readiness wait</th><th>Waited (s)</th>"
+        "<th>Fixed sleep (s)</th><th>Result</th></tr>%s</table>" % rows
+    )
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    if report.when != "call":
+        return
+    records = _records.get(item.nodeid)
+    if not records:
+        return
+    new_extras = getattr(report, "extras", [])
+    new_extras.append(extras.html(_records_table(records)))
+    report.extras = new_extras
+
+
+def pytest_terminal_summary(terminalreporter):
+    records = [record for records in _records.values() for record in records]
+    if not records:
+        return
+    waited = sum(record[1] for record in records)
+    replaced = sum(record[2] for record in records)
+    timeouts = sum(1 for record in records if not record[3])
+    terminalreporter.write_sep("-", "page readiness waits")
+    terminalreporter.write_line(
+        "%d waits took %.2fs, fixed sleeps would take %.2fs, saved %.2fs, %d timed out"
+        % (len(records), waited, replaced, replaced - waited, timeouts)
+    )
@@ -0,0 +1,170 @@
+"""
+Page objects of python.org / pypi.org and the screenshot listener used by test_selenium_pytest.py.
+
+They import all of selenium's remote WebDriver, so test modules import this module inside tests,
+not at module level, to keep collection fast:
+    def test_xxx(wd):
+        from pages import PythonOrgHomepage
+"""
+
+from datetime import datetime
+
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.events import AbstractEventListener, EventFiringWebDriver
+
+from conftest import log
+from framework.page import BasePage
+from framework.screenshots import capture
+
+
+# Take screenshot and save to local on Exception, e.g. cannot find elements.
+# But not in assert failure. However for assert failure you can control and take screenshot if needed.
+# Note: screenshot on any test failure is captured into pytest-html report via conftest.py / pytest_runtest_makereport.
+# The screenshot is taken once and kept on the driver, so the HTML report hook embeds the *exact*
+# screenshot taken at exception time (works with --self-contained-html) without taking another one.
+# Encoding and saving to file run in background, see framework/screenshots.py.
+class ScreenshotListener(AbstractEventListener):
+    def on_exception(self, exception, driver):
+        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        screenshot_name = "screenshot_on_exception_" + now
+        try:
+            capture(driver, screenshot_name)
+        except Exception as e:
+            log.info("Failed to take screenshot: %s" % e)
+
+
+def with_screenshots(wd):
+    """wd wrapped to take a screenshot on WebDriver exceptions, e.g. cannot find elements."""
+    return EventFiringWebDriver(wd, ScreenshotListener())
+
+
+# Page Object design
+#####################
+# https://www.seleniumhq.org/docs/06_test_design_considerations.jsp#page-object-design-pattern (Java Example only)
+# https://selenium-python.readthedocs.io/page-objects.html
+# https://github.com/gunesmes/page-object-python-selenium
+""" Principles
+When a page is changed, you only need to change that page object, not the test functions.
+Page objects themselves should never make verifications or assertions. 
+There is one verification which can, and should, be within the page object and that is to verify that the page, and possibly critical elements on the page, were loaded correctly.
+Declare locators once in the page object's `locators` and use self.element(name), see framework/page.py.
+Elements are found once per page and cached, instead of a find_element() round trip per use.
+"""
+
+
+class PythonOrgHomepage(BasePage):
+    locators = {"pypi_link": (By.XPATH, '//*[@title="Python Package Index"]')}
+
+    # Call this to verify if page is matched (1st check) right after initialization
+    def is_page_matched(self):
+        # Check if it is the right page by title
+        # return self.wd.title == 'Welcome to Python.org'
+        try:
+            ret = self.wait_until(
+                EC.title_is("Welcome to Python.org"), label="title is 'Welcome to Python.org'"
+            )
+        except TimeoutException:
+            # other errors fail the test, e.g. CircuitOpenError of framework/circuit_breaker.py
+            ret = False
+        if ret:
+            self.record_metrics()
+        return ret
+
+    def getTitle(self):
+        return self.wd.title
+
+    # return None if there are exceptions
+    def click_pypi(self):
+        # Catch find element failure to get better reading log prints
+        try:
+            self.with_element("pypi_link", lambda elem: elem.click(), navigates=True)
+        except NoSuchElementException:
+            log.info("Failed to locate PyPi link.")
+            return None
+        return PyPiHomepage(self.wd)
+
+
+class PyPiHomepage(BasePage):
+    locators = {"search": (By.ID, "search")}
+
+    def is_page_matched(self):
+        # return self.wd.title == 'PyPI – the Python Package Index · PyPI'
+        try:
+            ret = self.wait_until(
+                EC.title_is("PyPI · The Python Package Index"),
+                label="title is 'PyPI · The Python Package Index'",
+            )
+        except TimeoutException:
+            ret = False
+        if ret:
+            self.record_metrics()
+        return ret
+
+    def searchPackage(self, searchText):
+        def search(elem):
+            elem.clear()
+            elem.send_keys("%s" % str(searchText).strip())
+            elem.send_keys(Keys.ENTER)
+
+        self.with_element("search", search, navigates=True)
+        # wait for page to load, find an element on next page, order dropdown in this case. --- Removed and move to is_page_matched with wait-until function in next Page
+        # wait_element_nextPage = self.wd.find_element(By.XPATH,'//*[@id="order"]')
+        return PyPiSearchResultPage(self.wd)
+
+
+class PyPiSearchResultPage(BasePage):
+    locators = {
+        # name of every result row. Note: This xpath may change.
+        "result_names": (
+            By.XPATH,
+            '//*[@id="content"]/div/div/div[2]/form/div[3]/ul/li/a/h3/span[1]',
+        ),
+    }
+
+    def __init__(self, webdrive):
+        super().__init__(webdrive)
+        self._result_texts = None
+
+    def is_page_matched(self):
+        log.info("Current page title:" + self.wd.title)
+        # return self.wd.title == 'Search results · PyPI'
+        try:
+            ret = self.wait_until(
+                EC.title_is("Search results · PyPI"), label="title is 'Search results · PyPI'"
+            )
+        except TimeoutException:
+            ret = False
+        if ret:
+            self.record_metrics()
+        return ret
+
+    def clear_cache(self):
+        super().clear_cache()
+        self._result_texts = None
+
+    # Texts of all result rows, read in one round trip and cached for this page.
+    def getSearchResultTexts(self):
+        if self._result_texts is None:
+            # the script reading the texts doesn't get the implicit wait of find_element()
+            try:
+                self.wait_until(
+                    EC.presence_of_element_located(self.locators["result_names"]),
+                    label="search result rows present",
+                )
+            except TimeoutException:
+                return []
+            self._result_texts = self.texts("result_names")
+        return self._result_texts
+
+    # index starts with 1
+    def getSearchResultText(self, index):
+        texts = self.getSearchResultTexts()
+        if not 1 <= index <= len(texts):
+            log.info("Search result row not found.")
+            return None
+        log.info("Found search result row.")
+        log.info("element text: " + texts[index - 1])
+        return texts[index - 1]
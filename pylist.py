@@ -1,7 +1,477 @@
 #!/usr/bin/env python3
+"""
+List tests fast, without importing anything: test files are parsed with ast.
+
+Output is the node ids of 'pytest --collect-only -q', with literal parametrize lists expanded,
+e.g. test_selenium_pytest.py::TestPythonOrgMultiDrivers::test_python_homepage[Firefox].
+Parameters which aren't literals (or module level names of literals) are listed as [...].
+Tests with a smoke_row argument are expanded with the rows of the smoke tables in pytest.ini,
+see framework/smoke.py.
+
+Parsed files are cached in .pylist_cache.json by mtime, size and content hash, so repeat
+listings only stat the files.
+
+Usage:
+    python pylist.py                      # all tests under the current dir
+    python pylist.py test_selenium_pytest.py -k "python and not Firefox"
+    python pylist.py -m perf_budget       # tests with a marker, same expressions as pytest -m
+    python pylist.py --lines              # file:line: node id
+    python pylist.py --benchmark          # timings vs pytest --collect-only
+"""
+
+import argparse
+import ast
+import configparser
+import csv
+import fnmatch
+import hashlib
+import json
 import os
+import re
+import subprocess
+import sys
+import time
+
+CACHE_FILE = ".pylist_cache.json"
+# bump when the cached test format changes
+CACHE_VERSION = 2
+# pytest defaults, see python_files / norecursedirs
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py")
+NORECURSE = (
+    "*.egg", ".*", "_darcs", "build", "CVS", "dist", "node_modules", "venv", "{arch}", "__pycache__",
+)
+
+_UNRESOLVED = object()
+
+
+def find_test_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield os.path.normpath(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(
+                d for d in dirs if not any(fnmatch.fnmatch(d, p) for p in NORECURSE)
+            )
+            for name in sorted(files):
+                if any(fnmatch.fnmatch(name, p) for p in TEST_FILE_PATTERNS):
+                    yield os.path.normpath(os.path.join(root, name))
+
+
+# ---- parsing ----
+
+
+def _mark_of(decorator):
+    """(name, args, kwargs) of a @pytest.mark.X / @pytest.mark.X(...) decorator, else None."""
+    call = decorator if isinstance(decorator, ast.Call) else None
+    target = call.func if call else decorator
+    if (
+        isinstance(target, ast.Attribute)
+        and isinstance(target.value, ast.Attribute)
+        and target.value.attr == "mark"
+    ):
+        return target.attr, (call.args if call else []), (call.keywords if call else [])
+    return None
+
+
+def _marks_of(node):
+    """Marks of a class / function, closest to the definition first like pytest applies them."""
+    return [
+        mark
+        for mark in (_mark_of(d) for d in reversed(node.decorator_list))
+        if mark is not None
+    ]
+
+
+def _module_marks(tree):
+    """Marks of a module level 'pytestmark = ...'."""
+    for stmt in tree.body:
+        if (
+            isinstance(stmt, ast.Assign)
+            and any(isinstance(t, ast.Name) and t.id == "pytestmark" for t in stmt.targets)
+        ):
+            values = stmt.value.elts if isinstance(stmt.value, (ast.List, ast.Tuple)) else [stmt.value]
+            return [mark for mark in (_mark_of(v) for v in values) if mark is not None]
+    return []
+
+
+def _literal(node, names):
+    """Value of a literal or a module level name bound to one, else _UNRESOLVED."""
+    if isinstance(node, ast.Name):
+        return names.get(node.id, _UNRESOLVED)
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return _UNRESOLVED
+
+
+def _module_names(tree):
+    """Module level names assigned literal values, e.g. browser_list = ["Chrome", "Firefox"]."""
+    names = {}
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1:
+            target = stmt.targets[0]
+            if isinstance(target, ast.Name):
+                value = _literal(stmt.value, names)
+                if value is _UNRESOLVED:
+                    names.pop(target.id, None)
+                else:
+                    names[target.id] = value
+    return names
+
+
+def _id_of_value(value, argname, index):
+    """pytest's id of a parameter value."""
+    if isinstance(value, str):
+        return value.encode("unicode_escape").decode("ascii") if not value.isascii() else value
+    if value is None or isinstance(value, (bool, int, float, complex)):
+        return str(value)
+    return "%s%d" % (argname, index)
+
+
+def _param_set(entry, names, nargs):
+    """(values, explicit id or None) of one entry of a parametrize list, values None if unknown.
+
+    entry is an ast node, or a value of a module level name.
+    """
+    explicit = None
+    if (
+        isinstance(entry, ast.Call)
+        and isinstance(entry.func, ast.Attribute)
+        and entry.func.attr == "param"
+    ):
+        values = [_literal(arg, names) for arg in entry.args]
+        for keyword in entry.keywords:
+            if keyword.arg == "id":
+                explicit = _literal(keyword.value, names)
+    else:
+        value = _literal(entry, names) if isinstance(entry, ast.AST) else entry
+        if nargs == 1:
+            values = [value]
+        elif isinstance(value, (list, tuple)):
+            values = list(value)
+        else:
+            values = [_UNRESOLVED]
+    if len(values) != nargs or any(v is _UNRESOLVED for v in values):
+        values = None
+    return values, explicit
+
+
+def _parametrize_ids(args, kwargs, names):
+    """ids of a parametrize mark, or None if they can't be resolved statically."""
+    if len(args) < 2:
+        return None
+    argnames = _literal(args[0], names)
+    if argnames is _UNRESOLVED:
+        return None
+    if isinstance(argnames, str):
+        argnames = [name.strip() for name in argnames.split(",") if name.strip()]
+    argnames = list(argnames)
+
+    source = args[1]
+    if isinstance(source, (ast.List, ast.Tuple)):
+        entries = source.elts
+    else:
+        entries = _literal(source, names)
+        if not isinstance(entries, (list, tuple)):
+            return None
+
+    explicit_ids = None
+    for keyword in kwargs:
+        if keyword.arg == "ids":
+            explicit_ids = _literal(keyword.value, names)
+            if explicit_ids is not None and not isinstance(explicit_ids, (list, tuple)):
+                return None
+
+    ids = []
+    for index, entry in enumerate(entries):
+        values, explicit = _param_set(entry, names, len(argnames))
+        if explicit_ids is not None and index < len(explicit_ids) and explicit_ids[index] is not None:
+            explicit = explicit_ids[index]
+        if explicit is _UNRESOLVED:
+            return None
+        if explicit is not None:
+            ids.append(str(explicit))
+        elif values is None:
+            return None
+        else:
+            ids.append("-".join(_id_of_value(v, n, index) for v, n in zip(values, argnames)))
+    if not ids:
+        # pytest runs a test with an empty parameter list once, skipped
+        return ["NOTSET"]
+    return _make_unique(ids)
+
+
+def _make_unique(ids):
+    """pytest suffixes duplicate ids with a counter, e.g. a0, a1 or 10_0, 10_1."""
+    duplicates = {i for i in ids if ids.count(i) > 1}
+    counters = {}
+    unique = []
+    for i in ids:
+        if i in duplicates:
+            counter = counters.get(i, 0)
+            counters[i] = counter + 1
+            i = "%s_%d" % (i, counter) if i[-1:].isdigit() else "%s%d" % (i, counter)
+        unique.append(i)
+    return unique
+
+
+def _expand(base, marks, names):
+    """Node ids of a test function for its parametrize marks, closest first."""
+    callspecs = [[]]
+    for name, args, kwargs in marks:
+        if name != "parametrize":
+            continue
+        ids = _parametrize_ids(args, kwargs, names)
+        if ids is None:
+            return ["%s[...]" % base]
+        callspecs = [callspec + [i] for callspec in callspecs for i in ids]
+    if callspecs == [[]]:
+        return [base]
+    return ["%s[%s]" % (base, "-".join(callspec)) for callspec in callspecs]
+
+
+def _has_init(cls):
+    return any(
+        isinstance(stmt, ast.FunctionDef) and stmt.name == "__init__" for stmt in cls.body
+    )
+
+
+def _collect(body, prefix, inherited_marks, names, tests):
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            marks = _marks_of(node) + inherited_marks
+            smoke = any(arg.arg == "smoke_row" for arg in node.args.args)
+            for nodeid in _expand(prefix + node.name, marks, names):
+                tests.append(
+                    {
+                        "nodeid": nodeid,
+                        "line": node.lineno,
+                        "marks": sorted({name for name, _, _ in marks}),
+                        "smoke": smoke,
+                    }
+                )
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test") and not _has_init(node):
+            _collect(
+                node.body,
+                "%s%s::" % (prefix, node.name),
+                _marks_of(node) + inherited_marks,
+                names,
+                tests,
+            )
+
+
+def parse_tests(path, source):
+    """Tests of a test file: list of {"nodeid", "line", "marks", "smoke"}."""
+    tree = ast.parse(source, filename=path)
+    names = _module_names(tree)
+    tests = []
+    _collect(tree.body, path.replace(os.sep, "/") + "::", _module_marks(tree), names, tests)
+    return tests
+
+
+def smoke_ids(ini_file="pytest.ini"):
+    """Ids of the rows of the smoke tables, like framework/smoke.py parametrizes smoke_row."""
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(ini_file)
+    tables = config.get("pytest", "smoke_tables", fallback="smoke_sites.csv")
+    ids = []
+    for table in tables.split():
+        if not os.path.exists(table):
+            continue
+        with open(table, newline="") as f:
+            for line in csv.DictReader(f):
+                url = (line.get("url") or "").strip()
+                row_id = (line.get("id") or "").strip() or url.split("://", 1)[-1]
+                if url and not url.startswith("#") and not row_id.startswith("#"):
+                    ids.append(row_id)
+    return _make_unique(ids)
+
+
+def _expand_smoke(test, ids):
+    if not test.get("smoke"):
+        return [test]
+    if "[" in test["nodeid"]:
+        # combined with parametrize marks, order depends on pytest internals
+        return [dict(test, nodeid=test["nodeid"].split("[")[0] + "[...]")]
+    return [dict(test, nodeid="%s[%s]" % (test["nodeid"], i)) for i in ids]
+
+
+# ---- cache ----
+
+
+class Cache:
+    """Parsed tests per file, valid while mtime and size or the content hash are unchanged."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.changed = False
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def tests(self, path):
+        st = os.stat(path)
+        entry = self.entries.get(path)
+        if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["tests"]
+        with open(path, "rb") as f:
+            source = f.read()
+        digest = hashlib.sha1(source).hexdigest()
+        if entry is None or entry["sha1"] != digest:
+            entry = {"sha1": digest, "tests": parse_tests(path, source)}
+        entry.update(mtime=st.st_mtime_ns, size=st.st_size)
+        self.entries[path] = entry
+        self.changed = True
+        return entry["tests"]
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            with open(self.path, "w") as f:
+                json.dump({"version": CACHE_VERSION, "files": self.entries}, f)
+        except OSError as e:
+            print("pylist: failed to write cache %s: %s" % (self.path, e), file=sys.stderr)
+
+
+# ---- filters ----
+
+_TOKEN_RE = re.compile(r"\s*(\(|\)|[^\s()]+)")
+
+
+def matcher(expression, matches):
+    """Predicate of an expression like pytest -k / -m: names with and, or, not, parentheses.
+
+    matches(name, test) tells if one name matches a test.
+    """
+    tokens = _TOKEN_RE.findall(expression)
+    names = []
+    python = []
+    for token in tokens:
+        if token in ("(", ")", "and", "or", "not"):
+            python.append(token)
+        else:
+            python.append("_[%d]" % len(names))
+            names.append(token)
+    code = compile(" ".join(python) or "True", "<expression>", "eval")
+
+    def predicate(test):
+        values = [matches(name, test) for name in names]
+        return eval(code, {"__builtins__": {}}, {"_": values})
+
+    return predicate
+
+
+def keyword_matches(name, test):
+    # like pytest -k: case-insensitive substring of the module, class and function names
+    parts = test["nodeid"].lower().split("::")
+    parts[0] = os.path.basename(parts[0])
+    return any(name.lower() in part for part in parts) or name in test["marks"]
+
+
+def marker_matches(name, test):
+    return name in test["marks"]
+
+
+def list_tests(paths, keyword=None, marker=None, cache_file=CACHE_FILE):
+    cache = Cache(cache_file) if cache_file else None
+    tests = []
+    for path in find_test_files(paths):
+        try:
+            if cache is not None:
+                file_tests = cache.tests(path)
+            else:
+                with open(path, "rb") as f:
+                    file_tests = parse_tests(path, f.read())
+        except SyntaxError as e:
+            print("pylist: %s: %s" % (path, e), file=sys.stderr)
+            continue
+        tests.extend(dict(test, file=path) for test in file_tests)
+    if cache is not None:
+        cache.save()
+    if any(test.get("smoke") for test in tests):
+        ids = smoke_ids()
+        tests = [expanded for test in tests for expanded in _expand_smoke(test, ids)]
+    if keyword:
+        tests = list(filter(matcher(keyword, keyword_matches), tests))
+    if marker:
+        tests = list(filter(matcher(marker, marker_matches), tests))
+    return tests
+
+
+# ---- benchmark ----
+
+
+def _pytest_collect(paths):
+    cmd = [sys.executable, "-m", "pytest", "--collect-only", "-q", "-o", "addopts=", "-p", "no:cacheprovider"]
+    output = subprocess.run(cmd + list(paths), capture_output=True, text=True).stdout
+    return [line for line in output.splitlines() if "::" in line]
+
+
+def benchmark(paths, runs=5):
+    """Best secs of pytest --collect-only, pylist without cache and with a warm cache."""
+    timings = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        collected = _pytest_collect(paths)
+        timings.setdefault("pytest --collect-only", []).append(time.perf_counter() - start)
+    cache_file = os.path.join(os.path.dirname(os.path.abspath(CACHE_FILE)), ".pylist_bench_cache.json")
+    try:
+        for _ in range(runs):
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+            start = time.perf_counter()
+            list_tests(paths, cache_file=cache_file)
+            timings.setdefault("pylist, cold cache", []).append(time.perf_counter() - start)
+        for _ in range(runs):
+            start = time.perf_counter()
+            listed = list_tests(paths, cache_file=cache_file)
+            timings.setdefault("pylist, warm cache", []).append(time.perf_counter() - start)
+    finally:
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+    return {name: min(secs) for name, secs in timings.items()}, collected, [t["nodeid"] for t in listed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List tests without importing them.")
+    parser.add_argument("paths", nargs="*", default=["."])
+    parser.add_argument("-k", dest="keyword", help="keyword expression, like pytest -k")
+    parser.add_argument("-m", dest="marker", help="marker expression, like pytest -m")
+    parser.add_argument("--lines", action="store_true", help="print file:line: node id")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--benchmark", action="store_true", help="compare with pytest --collect-only")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        timings, collected, listed = benchmark(args.paths)
+        for name, secs in timings.items():
+            print("%-22s %8.1f ms" % (name, secs * 1000))
+        missing = sorted(set(collected) - set(listed))
+        extra = sorted(set(listed) - set(collected))
+        print("same node ids as pytest: %s" % ("yes" if not missing and not extra else "no"))
+        for nodeid in missing:
+            print("  only pytest: %s" % nodeid)
+        for nodeid in extra:
+            print("  only pylist: %s" % nodeid)
+        return
+
+    tests = list_tests(
+        args.paths, args.keyword, args.marker, cache_file=None if args.no_cache else CACHE_FILE
+    )
+    for test in tests:
+        if args.lines:
+            print("%s:%d: %s" % (test["file"], test["line"], test["nodeid"]))
+        else:
+            print(test["nodeid"])
+    # Note 'pytest --collectonly -q' is slow relatively, see --benchmark
+
 
-cmd = 'egrep --with-filename --line-number "def test|class Test" test*.py /dev/null'
-print(f"+ {cmd}")
-os.system(cmd)
-# Note 'pytest --collectonly -q' is slow relatively
+if __name__ == "__main__":
+    main()
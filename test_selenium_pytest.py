@@ -19,91 +19,97 @@ Selenium timeouts:
     Some attributes of a driver like tltle, url, etc. are not updated immediately after loading a new page,
     so we need to wait for a while before checking them, and the implicit wait cannot be used here.
 
+Drivers:
+Tests get a warm driver from a session pool via the "wd" fixture (see framework/driver_pool.py),
+so a browser is not launched and quit for every test. Don't quit the "wd" driver in tests.
+
+Sites:
+Load URLs via site.url(url) of the "site" fixture, so tests can run against recorded sites served
+locally with --site-replay=replay, see framework/site_replay.py.
+
 Tricks:
 1/ Always maximize window on setup by drive.maximize_window().
     Reason: Some responsive website have dynamic xpath / css for elements. e.g., xpath you see in chrome dev tool in full window
     could be different when the window size is smaller during tests.
 """
 
-from time import sleep
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-import logging
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.events import EventFiringWebDriver
-from selenium.webdriver.support.events import AbstractEventListener
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import inspect
 import pytest
-import pdb
 
 # it is said it is better to define a logger fixture instead of direct import, but it works.
 from conftest import log
 
-# time to wait for get method to load a page completely before raising TimeoutException
-TIMEWAIT_PAGE_LOAD_GET = 60
-# explicit wait time in secs after loading a new page to check page match with driver.title.
-TIMEWAIT_PAGE_LOAD = 15
-# timeout for elements to load
-TIMEWAIT_ELEMENT_LOAD = TIMEWAIT_PAGE_LOAD
-
-
-# Notes:
-#    - To use function without class, use 'global' browser scope across functions.
-def setup_function():
-    log.info("Setup function")
-    global browser
-    browser = webdriver.Chrome()
+# Timeouts are defined in framework/waits.py.
+# Use assert wait_for_page_ready(driver) instead of a fixed sleep() after loading a page, it returns False on timeout.
+from framework.waits import (
+    TIMEWAIT_ELEMENT_LOAD,
+    TIMEWAIT_PAGE_LOAD_GET,
+    wait_for_page_ready,
+)
+from framework.screenshots import capture
+from framework.elements import (
+    elements_present,
+    is_element_absent,
+    is_element_present,
+    is_element_present_by_xpath,
+)
+from framework.visual import assert_visual_match
 
 
-def teardown_function():
-    log.info("Teardown function")
-    global browser
-    browser.quit()
+# Page objects and the screenshot listener are in pages.py. They import all of selenium's remote
+# WebDriver, so tests import them when they run, which keeps collection (and pylist.py) fast.
 
 
+# Notes:
+#    - Test functions without class just request the "wd" fixture, a pooled Chrome driver by default.
 # request is a pytest built-in fixture providing information of the requesting test function.
 # https://docs.pytest.org/en/stable/reference/reference.html#std-fixture-request
-def test_seleniumhq_homepage(request):
+@pytest.mark.block_resources(types=["image", "font", "analytics"])
+def test_seleniumhq_homepage(wd, site, request):
     # print test function name
     log.info("test_func %s" % request.node.nodeid)
     # Output: test_func test_seleniumhq_homepage:
-    global browser
-    browser.get("https://www.selenium.dev/")
-    assert "Selenium" in browser.title
-    sleep(2)
+    wd.get(site.url("https://www.selenium.dev/"))
+    assert "Selenium" in wd.title
+    assert wait_for_page_ready(wd), "selenium.dev not ready"
+
+
+# One test per row of smoke_sites.csv: load the URL, match the title, find the locators.
+# The rows are checked concurrently by the "smoke" fixture, see framework/smoke.py
+def test_smoke(smoke_row, smoke):
+    result = smoke.result(smoke_row)
+    assert result.ok, result.message
 
 
 class TestPythonOrgChrome:
-    def setup_method(self):
+    # autouse fixture runs for every test in the class, like setup_method but can use other fixtures.
+    @pytest.fixture(autouse=True)
+    def setup(self, wd, site):
+        from pages import with_screenshots
+
         log.info("Setting up browser...")
-        self.wd = webdriver.Chrome()  # webdriver.Firefox()
+        self.site = site
         # set viewport / window size
-        self.wd.set_window_size(1024, 800)
+        wd.set_window_size(1024, 800)
         # take screenshots on exceptions like element not found
-        self.wd = EventFiringWebDriver(self.wd, ScreenshotListener())
-
-    def teardown_method(self):
-        log.info("tearing down browser...")
-        self.wd.quit()
+        self.wd = with_screenshots(wd)
 
     def test_python_homepage(self, request):
         # print test function name, e.g. test_selenium_pytest.py::test_seleniumhq_homepage
         log.info("test_func %s" % request.node.nodeid)
-        self.wd.get("https://www.python.org/")
+        self.wd.get(self.site.url("https://www.python.org/"))
         # change to 'Welcome to Python.org1' to see the failure report
         assert "Welcome to Python.org" == self.wd.title
         # or change this to "q1"
         self.wd.find_element(By.NAME, "q")
-        sleep(2)
+        assert wait_for_page_ready(self.wd), "python.org not ready"
 
 
-# Test with a list of browsers, and headless mode
+# Test with a list of browsers
 # Design:
-#   Define own setup function so we can assign browser as argument and use pytest.parametrize().
+#   The "wd" fixture picks the browser from the "browser" argument of pytest.parametrize().
 
 # Define browsers you want to test, you can read from a config file as well.
 browser_list = ["Chrome", "Firefox"]
@@ -111,60 +117,29 @@ browser_list = ["Chrome", "Firefox"]
 
 
 class TestPythonOrgMultiDrivers:
-    def setupOwn(self, browser):
+    def setupOwn(self, wd):
         log.info("Setting up browser...")
-        try:
-            if str(browser).lower() == "firefox":
-                self.wd = webdriver.Firefox()
-                # To run headless mode in Firefox, add below options.
-                """
-                vOptions = webdriver.firefox.options.Options()
-                vOptions.headless = True 
-                self.wd = webdriver.Firefox(options=vOptions)
-                """
-            else:
-                self.wd = webdriver.Chrome()
-                # To run headless mode, i.e. no UI, add below options.
-                # And you can ignore this error (no impact):  [0101/115120.672:ERROR:gpu_process_transport_factory.cc(967)] Lost UI shared context.
-                """
-                options = webdriver.ChromeOptions()
-                options.add_argument("--headless")
-                options.add_argument("--disable-gpu")
-                self.wd = webdriver.Chrome(chrome_options=options)
-                """
-        except Exception as e:
-            log.info("Failed to setup browser.")
-            raise e
-
-    def teardown_method(self):
-        log.info("teardown_method::tearing down browser...")
-        self.wd.quit()
+        self.wd = wd
 
     # parametrize means for browser in browser_list run this test function.
     @pytest.mark.parametrize("browser", browser_list)
-    def test_python_homepage(self, browser, request):
+    def test_python_homepage(self, browser, wd, site, request):
         # print test function name
         log.info("test_func %s" % request.node.nodeid)
-        self.setupOwn(browser)
-        self.wd.get("https://www.python.org/")
+        self.setupOwn(wd)
+        self.wd.get(site.url("https://www.python.org/"))
         assert "Welcome to Python.org" == self.wd.title
-        sleep(2)
+        assert wait_for_page_ready(self.wd), "python.org not ready"
 
 
 # Page Object Model
 class TestPythonOrgPageModel:
-    def setupOwn(self, browser):
-        log.info("Setting up browser...")
-        try:
-            if str(browser).lower() == "firefox":
-                self.wd = webdriver.Firefox()
-            else:
-                self.wd = webdriver.Chrome()
-        except:
-            log.info("Failed to setup browser.")
+    def setupOwn(self, wd):
+        from pages import with_screenshots
 
+        log.info("Setting up browser...")
         # taking screenshots on Exception,e.g. cannot find elements. But not in assert failure.
-        self.wd = EventFiringWebDriver(self.wd, ScreenshotListener())
+        self.wd = with_screenshots(wd)
         self.wd.set_page_load_timeout(TIMEWAIT_PAGE_LOAD_GET)
         # set implicitly_wait for elements to load
         self.wd.implicitly_wait(TIMEWAIT_ELEMENT_LOAD)
@@ -172,30 +147,30 @@ class TestPythonOrgPageModel:
         # some responsive website have dynamic xpath / css for elements, so it is better to max window unless testing diff win size on purpose.
         self.wd.maximize_window()
 
-    def teardown_method(self):
-        log.info("teardown_method::tearing down browser...")
-        self.wd.quit()
-
     # parametrize means for browser in browser_list run this test function.
     @pytest.mark.parametrize("browser", browser_list)
-    def test_python_homepage_pageObject(self, browser, request):
+    # fail if python.org takes longer than 5s to send the first byte, see framework/page_metrics.py
+    @pytest.mark.perf_budget(page="PythonOrgHomepage", ttfb=5000)
+    def test_python_homepage_pageObject(self, browser, wd, site, request):
+        from pages import PythonOrgHomepage
+
         # print test function name
         log.info("test_func %s" % request.node.nodeid)
         # Set up browser
-        self.setupOwn(browser)
+        self.setupOwn(wd)
 
         # Test function
-        self.wd.get("https://www.python.org/")
+        self.wd.get(site.url("https://www.python.org/"))
         homepage = PythonOrgHomepage(self.wd)
         # Always check if it is the right page first
         assert homepage.is_page_matched()
         # Test Validations
         # assert homepage.getTitle() == "Failed Title"
-        sleep(2)
+        assert wait_for_page_ready(self.wd, label="python.org ready")
         pyPiHomepage = homepage.click_pypi()
         # Check it redirects to PyPi website.
         assert pyPiHomepage.is_page_matched()
-        sleep(2)
+        assert wait_for_page_ready(self.wd, label="pypi.org ready")
 
         # Note: pypi is protected by capctcha using fastly now, cannot bypass it w/o human interaction
         # Search by 'selenium' and check 1st result is selenium package.
@@ -212,158 +187,45 @@ class TestPythonOrgPageModel:
         assert actual_resultText == expected_resultText, 'search result not matched'
         """
 
+    # Start on pypi.org without clicking through python.org: the flow runs once, later tests
+    # (and runs) restore its cookies, storage and URL, see framework/storage_state.py
+    @pytest.mark.parametrize("browser", browser_list)
+    def test_pypi_homepage_from_state(self, browser, wd, site, storage_states):
+        from pages import PyPiHomepage, PythonOrgHomepage
+
+        self.setupOwn(wd)
+
+        def open_pypi(driver):
+            driver.get(site.url("https://www.python.org/"))
+            assert PythonOrgHomepage(driver).click_pypi() is not None
+
+        storage_states.ensure(
+            "pypi_home_%s" % browser,
+            self.wd,
+            open_pypi,
+            depends_on=[PythonOrgHomepage],
+            context=site.url("https://www.python.org/"),
+        )
+        assert PyPiHomepage(self.wd).is_page_matched()
+        assert wait_for_page_ready(self.wd, label="pypi.org ready")
+
     def take_screenshot(self):
+        import inspect
+
         class_name = self.__class__.__name__
         # This return caller function's name, not this function take_screenshot.
         caller_func_name = inspect.stack()[1][3]
         now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = (
-            "screenshot_" + class_name + "-" + caller_func_name + "_" + now + ".png"
-        )
-        self.wd.save_screenshot(filename)
+        # extension is added by the screenshot pipeline, e.g. .png
+        filename = "screenshot_" + class_name + "-" + caller_func_name + "_" + now
+        capture(self.wd, filename)
 
 
-# Take screenshot and save to local on Exception, e.g. cannot find elements.
-# But not in assert failure. However for assert failure you can control and take screenshot if needed.
-# Note: screenshot on any test failure is captured into pytest-html report via conftest.py / pytest_runtest_makereport.
-class ScreenshotListener(AbstractEventListener):
-    def on_exception(self, exception, driver):
-        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        screenshot_name = "screenshot_on_exception_" + now + ".png"
-        driver.save_screenshot(screenshot_name)
-        log.info("Screenshot saved as '%s'" % screenshot_name)
-
-        # Also capture base64 so the HTML report hook can embed the *exact*
-        # screenshot taken at exception time (works with --self-contained-html).
-        try:
-            driver._last_screenshot_base64 = driver.get_screenshot_as_base64()
-        except Exception:
-            pass
-
-
-# Usage example:
-# self.wd = EventFiringWebDriver(self.wd, ScreenshotListener())
-
-# Page Object design
-#####################
-# https://www.seleniumhq.org/docs/06_test_design_considerations.jsp#page-object-design-pattern (Java Example only)
-# https://selenium-python.readthedocs.io/page-objects.html
-# https://github.com/gunesmes/page-object-python-selenium
-""" Principles
-When a page is changed, you only need to change that page object, not the test functions.
-Page objects themselves should never make verifications or assertions. 
-There is one verification which can, and should, be within the page object and that is to verify that the page, and possibly critical elements on the page, were loaded correctly.
-"""
-
-
-class PythonOrgHomepage:
-    def __init__(self, webdrive):
-        self.wd = webdrive
-
-    # Call this to verify if page is matched (1st check) right after initialization
-    def is_page_matched(self):
-        # Check if it is the right page by title
-        # return self.wd.title == 'Welcome to Python.org'
-        try:
-            ret = WebDriverWait(self.wd, TIMEWAIT_PAGE_LOAD).until(
-                EC.title_is("Welcome to Python.org")
-            )
-        except:
-            ret = False
-        return ret
-
-    def getTitle(self):
-        return self.wd.title
-
-    # return None if there are exceptions
-    def click_pypi(self):
-        # Catch find element failure to get better reading log prints
-        try:
-            elem = self.wd.find_element(By.XPATH, '//*[@title="Python Package Index"]')
-        except NoSuchElementException:
-            log.info("Failed to locate PyPi link.")
-            return None
-
-        elem.click()
-        return PyPiHomepage(self.wd)
-
-
-class PyPiHomepage:
-    def __init__(self, webdrive):
-        self.wd = webdrive
-
-    def is_page_matched(self):
-        # return self.wd.title == 'PyPI – the Python Package Index · PyPI'
-        try:
-            ret = WebDriverWait(self.wd, TIMEWAIT_PAGE_LOAD).until(
-                EC.title_is("PyPI · The Python Package Index")
-            )
-        except:
-            ret = False
-        return ret
-
-    def searchPackage(self, searchText):
-        self.wd.find_element(By.ID, "search").clear()
-        self.wd.find_element(By.ID, "search").send_keys("%s" % str(searchText).strip())
-        self.wd.find_element(By.ID, "search").send_keys(Keys.ENTER)
-        # wait for page to load, find an element on next page, order dropdown in this case. --- Removed and move to is_page_matched with wait-until function in next Page
-        # wait_element_nextPage = self.wd.find_element(By.XPATH,'//*[@id="order"]')
-        return PyPiSearchResultPage(self.wd)
-
-
-class PyPiSearchResultPage:
-    def __init__(self, webdrive):
-        self.wd = webdrive
-
-    def is_page_matched(self):
-        log.info("Current page title:" + self.wd.title)
-        # return self.wd.title == 'Search results · PyPI'
-        try:
-            ret = WebDriverWait(self.wd, TIMEWAIT_PAGE_LOAD).until(
-                EC.title_is("Search results · PyPI")
-            )
-        except:
-            ret = False
-        return ret
-
-    # index starts with 1
-    def getSearchResultText(self, index):
-        self.result_index = index
-        elem_found = True
-        try:
-            # Note: This xpath may change.
-            self.elem = self.wd.find_element(
-                By.XPATH,
-                '//*[@id="content"]/div/div/div[2]/form/div[3]/ul/li[%s]/a/h3/span[1]'
-                % self.result_index,
-            )
-        except NoSuchElementException:
-            log.info("Search result row not found.")
-            elem_found = False
-            return None
-        if elem_found == True:
-            log.info("Found search result row.")
-            log.info("element text: " + self.elem.text)
-            return self.elem.text
-
-
-# Check exist by xpath
-def is_element_present_by_xpath(webdriver, xpath):
-    try:
-        webdriver.find_element(By.XPATH, xpath)
-    except NoSuchElementException:
-        return False
-    return True
-
-
-# A common check exist function
+# Check exist functions are in framework/elements.py. They don't wait for the implicit wait of the driver
+# but their own timeout (0 by default), so checking an absent element is instant.
 # Example: is_element_present(browser,By.NAME,'username')
-def is_element_present(webdriver, byHow, byValue):
-    try:
-        webdriver.find_element(byHow, byValue)
-    except NoSuchElementException:
-        return False
-    return True
+#          is_element_absent(browser,By.ID,'spinner',timeout=5)
+#          elements_present(browser,[(By.NAME,'username'),(By.NAME,'password')]) - one round trip for all
 
 
 # Different Locators
@@ -388,9 +250,11 @@ Chrome: //*[@id="sidebar"]/div[2]/form/input[3]
 Firfox: /html/body/div[3]/div[2]/div[1]/div[2]/form/input[3]
 """
 
-""" Example page:
+# Example page, served by the local server of the "site" fixture.
+LOGIN_PAGE_HTML = """
 <html>
  <body>
+  <p>Simple page</p>
   <form id="loginForm">
    <input name="username" type="text" />
    <input name="password" type="password" />
@@ -398,36 +262,35 @@ Firfox: /html/body/div[3]/div[2]/div[1]/div[2]/form/input[3]
    <input name="continue" type="button" value="Clear" />
   </form>
 </body>
-<html> 
+</html>
 """
 
 
-# To run this test, install a web host server, e.g. Fenix for windows, and host above HTML file, e.g. index.html.
-# Then rename the function as test_locators().
-def disabled_test_locators():
-    global browser
+def test_locators(wd, site):
+    browser = wd
     # wd.get('https://www.seleniumhq.org/')
-    browser.get("http://127.0.0.1:8000/")
+    site.add_page("/login.html", LOGIN_PAGE_HTML)
+    browser.get(site.local_url("/login.html"))
     elem_found = True
     try:
         elem = browser.find_element(By.ID, "loginForm")
         elem = browser.find_element(By.NAME, "password")
 
         # Below all find the same form element
-        login_form = browserwd.find_element(By.XPATH, "/html/body/form")
-        login_form = browserwd.find_element(By.XPATH, "/html/body/form[1]")
-        login_form = browserwd.find_element(By.XPATH, "//form[1]")
-        login_form = browserwd.find_element(By.XPATH, "//form[@id='loginForm']")
-        login_form = browserwd.find_element(By.XPATH, "//*[@id='loginForm']")
-        login_form = browserwd.find_element(By.XPATH, "//*[@id='loginForm'][1]")
-        login_form = browserwd.find_element(
+        login_form = browser.find_element(By.XPATH, "/html/body/form")
+        login_form = browser.find_element(By.XPATH, "/html/body/form[1]")
+        login_form = browser.find_element(By.XPATH, "//form[1]")
+        login_form = browser.find_element(By.XPATH, "//form[@id='loginForm']")
+        login_form = browser.find_element(By.XPATH, "//*[@id='loginForm']")
+        login_form = browser.find_element(By.XPATH, "//*[@id='loginForm'][1]")
+        login_form = browser.find_element(
             By.XPATH, "//*[contains(@id,'login')]"
         )  # contains, yet to test
 
         # Below all find the same username element
-        username_elem = browserwd.find_element(By.XPATH, "//input[@name='username']")
-        username_elem = browserwd.find_element(By.XPATH, "//*[@name='username']")
-        username_elem = browserwd.find_element(
+        username_elem = browser.find_element(By.XPATH, "//input[@name='username']")
+        username_elem = browser.find_element(By.XPATH, "//*[@name='username']")
+        username_elem = browser.find_element(
             By.XPATH, "//*[@id='loginForm']/input[1]"
         )
 
@@ -436,15 +299,15 @@ def disabled_test_locators():
         username_elem = browser.find_element(By.NAME, "username")
 
         # Find element by text
-        text_elem = browserwd.find_element(
+        text_elem = browser.find_element(
             By.XPATH, "//*[text()='Simple page']"
         )  # Exact match
-        text_elem = browserwd.find_element(
+        text_elem = browser.find_element(
             By.XPATH, "//*[contains(text(),'Simple')]"
         )  # contain
         # Find element by value
-        submit_button = browserwd.find_element(By.XPATH, "//*[@value='Login']")
-        clear_button = browserwd.find_element(By.XPATH, "//input[@value='Clear']")
+        submit_button = browser.find_element(By.XPATH, "//*[@value='Login']")
+        clear_button = browser.find_element(By.XPATH, "//input[@value='Clear']")
 
         """ These are the attributes available for By class:
         ID = "id"
@@ -465,4 +328,21 @@ def disabled_test_locators():
         log.info("Found element.")
         username_elem.send_keys("Peter")
 
-    sleep(2)
+    # presence checks of framework/elements.py, instant as they don't wait for the implicit wait
+    assert is_element_present(browser, By.NAME, "username")
+    assert is_element_present_by_xpath(browser, "//input[@value='Clear']")
+    assert is_element_absent(browser, By.ID, "spinner")
+    present = elements_present(browser, [(By.NAME, "username"), (By.NAME, "password")])
+    assert all(present.values()), present
+
+    assert wait_for_page_ready(browser), "login page not ready"
+
+
+# Visual regression check of the form, against visual_baselines/login_form-<browser>.png.
+# The first run saves the baseline, see framework/visual.py
+def test_login_form_visual(wd, site):
+    site.add_page("/login.html", LOGIN_PAGE_HTML)
+    wd.set_window_size(1024, 800)
+    wd.get(site.local_url("/login.html"))
+    assert wait_for_page_ready(wd), "login page not ready"
+    assert_visual_match(wd, "login_form", element=(By.ID, "loginForm"))
@@ -0,0 +1,74 @@
+"""Unit tests of screenshot deduplication of framework/artifacts.py."""
+
+import base64
+import io
+
+import pytest
+
+from framework.artifacts import ArtifactStore
+
+Image = pytest.importorskip("PIL.Image")
+
+
+class FakeShot:
+    def __init__(self, png, page):
+        self.png = png
+        self.page = page
+        self.name = "screenshot"
+        self.path = "/tmp/screenshot.png"
+        self.capture_secs = 0.1
+
+    def encoded(self):
+        return base64.b64encode(self.png).decode("ascii"), "image/png", len(self.png)
+
+
+def _png(color, size=(64, 32), right=False):
+    """A white image with its left or right half in color."""
+    out = io.BytesIO()
+    image = Image.new("RGB", size, "white")
+    half = size[0] // 2
+    image.paste(color, (half if right else 0, 0, size[0] if right else half, size[1]))
+    image.save(out, "PNG")
+    return out.getvalue()
+
+
+def test_same_screenshot_of_same_page_stored_once():
+    store = ArtifactStore()
+    png = _png("black")
+    extra = store.screenshot_extra(FakeShot(png, "https://www.python.org/"), "t::a[x y]")
+    assert extra["format_type"] == "image"
+    extra = store.screenshot_extra(FakeShot(png, "https://www.python.org/"), "t::b")
+    assert '<a href="#t::a[x%20y]"><b>t::a[x y]</b></a>' in extra["content"]
+    assert "base64" not in extra["content"]
+    assert (store.stored, store.deduped) == (1, 1)
+
+
+def test_over_cap_gives_saved_file():
+    store = ArtifactStore(max_bytes=1)
+    extra = store.screenshot_extra(FakeShot(_png("black"), "https://www.python.org/"), "t::a")
+    assert "See screenshot file /tmp/screenshot.png" in extra["content"]
+    assert (store.stored, store.over_cap) == (0, 1)
+
+
+def test_same_layout_of_other_page_is_kept():
+    store = ArtifactStore()
+    png = _png("black")
+    store.screenshot_extra(FakeShot(png, "https://www.python.org/"), "t::a")
+    extra = store.screenshot_extra(FakeShot(png, "https://pypi.org/"), "t::b")
+    assert extra["format_type"] == "image"
+    assert (store.stored, store.deduped) == (2, 0)
+
+
+def test_near_identical_only_within_distance():
+    # re-encoding at another size keeps the perceptual hash, not the bytes
+    page = "https://www.python.org/"
+    store = ArtifactStore(phash_distance=0)
+    store.screenshot_extra(FakeShot(_png("black"), page), "t::a")
+    store.screenshot_extra(FakeShot(_png("black", (128, 64)), page), "t::b")
+    store.screenshot_extra(FakeShot(_png("black", right=True), page), "t::c")
+    assert (store.stored, store.deduped) == (2, 1)
+
+    store = ArtifactStore(phash_distance=-1)
+    store.screenshot_extra(FakeShot(_png("black"), page), "t::a")
+    store.screenshot_extra(FakeShot(_png("black", (128, 64)), page), "t::b")
+    assert (store.stored, store.deduped) == (2, 0)
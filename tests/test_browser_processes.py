@@ -0,0 +1,37 @@
+"""Unit tests of leak detection of framework/browser_processes.py."""
+
+from framework.browser_processes import LEAK_MIN_MB, LEAK_RUNS, MAX_RUNS, MemoryHistory
+
+
+def _history(runs, new=None):
+    history = MemoryHistory()
+    history.runs = {"t::a": list(runs)}
+    if new is not None:
+        history.add("t::a", new)
+    return history
+
+
+def test_growing_peak_over_runs_is_leaking():
+    step = LEAK_MIN_MB / LEAK_RUNS
+    runs = [300 + i * step for i in range(LEAK_RUNS)]
+    assert _history(runs, new=runs[-1] + step).leaking("t::a")
+
+
+def test_not_leaking():
+    step = LEAK_MIN_MB / LEAK_RUNS
+    # too few runs
+    assert not _history([300 + i * step for i in range(LEAK_RUNS)]).leaking("t::a")
+    # one run didn't grow
+    runs = [300 + i * step for i in range(LEAK_RUNS)]
+    runs[2] = runs[1]
+    assert not _history(runs, new=runs[-1] + step).leaking("t::a")
+    # growing, but by less than LEAK_MIN_MB in total
+    assert not _history([300 + i * 0.1 for i in range(LEAK_RUNS)], new=301).leaking("t::a")
+    assert not MemoryHistory().leaking("t::unknown")
+
+
+def test_merge_keeps_last_runs():
+    history = _history([100.0] * MAX_RUNS, new=200.0)
+    history.merge(history.new_runs)
+    assert len(history.runs["t::a"]) == MAX_RUNS
+    assert history.runs["t::a"][-1] == 200.0
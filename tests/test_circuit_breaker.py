@@ -0,0 +1,74 @@
+"""Unit tests of failure causes and the circuit of framework/circuit_breaker.py."""
+
+import pytest
+
+from framework import circuit_breaker
+from framework.circuit_breaker import Cause, CircuitBreaker, CircuitOpenError, describe_error, normalize_url
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    running = {"nodeid": None}
+    monkeypatch.setattr(circuit_breaker, "current_test", lambda: running["nodeid"])
+    breaker = CircuitBreaker()
+    breaker.threshold = 2
+
+    def run(nodeid):
+        running["nodeid"] = nodeid
+
+    breaker.run = run
+    return breaker
+
+
+def test_normalize_url_and_describe_error():
+    assert normalize_url("http://127.0.0.1:54321/path?q=1#top") == "http://127.0.0.1/path"
+    assert normalize_url("https://www.python.org") == "https://www.python.org/"
+    error = RuntimeError("session 0123456789abcdef0123 at 0x7f00aa\nstack")
+    assert describe_error(error) == "RuntimeError: session ... at ..."
+
+
+def test_cause_grouping(breaker):
+    # a failed wait is the cause, not the assertion it led to
+    breaker.run("t::a")
+    breaker.check_load(None, "https://www.python.org/?x=1")
+    breaker.wait_failed(None, "PythonOrgHomepage", "title")
+    assert breaker.cause_of("t::a", AssertionError("assert False")) == Cause("page", "PythonOrgHomepage", "title")
+
+    # a load error comes first
+    breaker.run("t::b")
+    breaker.wait_failed(None, "PythonOrgHomepage", "title")
+    breaker.load_failed(None, "https://www.python.org/", RuntimeError("net::ERR_NAME_NOT_RESOLVED"))
+    assert breaker.cause_of("t::b", None).kind == "load"
+
+    # other errors are grouped by message and the last URL
+    breaker.run("t::c")
+    breaker.check_load(None, "https://pypi.org/")
+    cause = breaker.cause_of("t::c", KeyError("x"))
+    assert cause == Cause("error", "https://pypi.org/", "KeyError: 'x'")
+
+
+def test_circuit_opens_at_threshold(breaker):
+    cause = Cause("page", "PyPiHomepage", "title")
+    for nodeid in ("t::a", "t::a", "t::b"):
+        assert not breaker.is_open(cause)
+        breaker.failed(nodeid, cause)
+    assert breaker.is_open(cause)
+
+    breaker.run("t::c")
+    breaker.check_wait(None, "PythonOrgHomepage", "title")
+    with pytest.raises(CircuitOpenError, match="first t::a"):
+        breaker.check_wait(None, "PyPiHomepage", "title")
+    assert breaker.tripped == {"t::c": cause}
+
+
+def test_open_load_circuit_trips_same_url_only(breaker):
+    cause = Cause("load", "https://www.python.org/", "TimeoutException: timeout")
+    breaker.failed("t::a", cause)
+    breaker.failed("t::b", cause)
+    breaker.run("t::c")
+    breaker.check_load(None, "https://pypi.org/")
+    with pytest.raises(CircuitOpenError):
+        breaker.check_load(None, "https://www.python.org/#about")
+
+    breaker.threshold = 0
+    breaker.check_load(None, "https://www.python.org/")
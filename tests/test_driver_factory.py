@@ -0,0 +1,90 @@
+"""Unit tests of framework/driver_factory.py, with a fake launch instead of a browser."""
+
+import os
+
+import pytest
+
+from framework import driver_factory
+from framework.driver_factory import (
+    PROFILES,
+    chrome_options,
+    create_driver,
+    firefox_options,
+    percentile,
+)
+
+
+class FakeDriver:
+    def get(self, url):
+        pass
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def launches(monkeypatch, tmp_path):
+    """(browser, settings, files in user data dir) of each launch, the first one seeds it."""
+    launches = []
+
+    def launch(browser, settings, user_data_dir=None, proxy=None):
+        files = sorted(os.listdir(user_data_dir)) if user_data_dir else None
+        launches.append((browser, settings, files))
+        if user_data_dir and not files:
+            # what a browser writes on its first run
+            with open(os.path.join(user_data_dir, "Preferences"), "w") as f:
+                f.write("{}")
+            os.makedirs(os.path.join(user_data_dir, "Cache"))
+        return FakeDriver()
+
+    monkeypatch.setattr(driver_factory, "_launch", launch)
+    monkeypatch.setattr(driver_factory, "SEEDED_PROFILES_DIR", str(tmp_path))
+    return launches
+
+
+def test_percentile_is_nearest_rank():
+    values = [5, 1, 4, 2, 3, 10, 9, 8, 7, 6]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 95) == 10
+    assert percentile(values, 0) == 1
+    assert percentile([0.3], 95) == 0.3
+
+
+def test_fast_profile_options():
+    options = chrome_options(PROFILES["fast"], "/tmp/profile")
+    assert {"--headless=new", "--disable-gpu", "--disable-extensions"} <= set(options.arguments)
+    assert "--user-data-dir=/tmp/profile" in options.arguments
+    assert options.page_load_strategy == "eager"
+
+    options = firefox_options(PROFILES["fast"])
+    assert options.arguments == ["-headless"]
+    assert options.preferences["layers.acceleration.disabled"] is True
+    assert options.page_load_strategy == "eager"
+
+
+def test_default_profile_options():
+    assert chrome_options(PROFILES["default"]).arguments == []
+    assert firefox_options(PROFILES["default"]).arguments == []
+    assert chrome_options(PROFILES["headless"]).arguments == ["--headless=new"]
+
+
+def test_unknown_profile(launches):
+    with pytest.raises(ValueError, match="Unknown driver profile 'slow'"):
+        create_driver("Chrome", profile="slow")
+    assert launches == []
+
+
+def test_fast_profile_copies_seeded_user_data_dir(launches, tmp_path):
+    first = create_driver("Chrome", profile="fast")
+    second = create_driver("Chrome", profile="fast")
+
+    # seeded once, then each driver starts from its own copy without caches
+    assert [files for _, _, files in launches] == [[], ["Preferences"], ["Preferences"]]
+    assert os.listdir(tmp_path) == ["chrome-fast"]
+    assert first._user_data_dir.name != second._user_data_dir.name
+
+
+def test_default_profile_has_no_user_data_dir(launches):
+    driver = create_driver("Firefox")
+    assert launches == [("Firefox", {}, None)]
+    assert not hasattr(driver, "_user_data_dir")
@@ -0,0 +1,176 @@
+"""Unit tests of framework/driver_pool.py, with a fake driver instead of a browser."""
+
+from framework.driver_pool import DriverPool, remember_origin, reset_driver
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current_window_handle = handle
+
+    def new_window(self, type_hint):
+        handle = "tab%d" % len(self.driver.urls)
+        self.driver.urls[handle] = "about:blank"
+        self.driver.current_window_handle = handle
+
+
+class FakeDriver:
+    def __init__(self, urls, cdp=True):
+        # window handle -> URL
+        self.urls = dict(urls)
+        self.current_window_handle = next(iter(self.urls))
+        self.switch_to = FakeSwitchTo(self)
+        self.commands = []
+        self.rect = {"x": 0, "y": 0, "width": 800, "height": 600}
+        if cdp:
+            self.execute_cdp_cmd = lambda cmd, params: self.commands.append((cmd, params))
+
+    @property
+    def window_handles(self):
+        return list(self.urls)
+
+    @property
+    def current_url(self):
+        return self.urls[self.current_window_handle]
+
+    def get(self, url):
+        self.urls[self.current_window_handle] = url
+
+    def close(self):
+        del self.urls[self.current_window_handle]
+
+    def get_window_rect(self):
+        return dict(self.rect)
+
+    def set_window_rect(self, x, y, width, height):
+        self.rect = {"x": x, "y": y, "width": width, "height": height}
+
+    def execute_script(self, script):
+        self.commands.append(("script", self.current_url))
+
+    def delete_all_cookies(self):
+        self.commands.append(("cookies", self.current_url))
+
+    def implicitly_wait(self, secs):
+        pass
+
+    def set_page_load_timeout(self, secs):
+        pass
+
+
+def test_reset_clears_every_visited_origin_via_cdp():
+    driver = FakeDriver({"w1": "https://pypi.org/search/?q=x", "w2": "about:blank"})
+    remember_origin(driver, "https://www.python.org/")
+    remember_origin(driver, "data:text/html,x")
+    driver.rect["width"] = 1920
+
+    reset_driver(driver, window_rect={"x": 0, "y": 0, "width": 800, "height": 600})
+
+    assert driver.commands == [
+        ("Network.clearBrowserCookies", {}),
+        ("Storage.clearDataForOrigin", {"origin": "https://pypi.org", "storageTypes": "all"}),
+        ("Storage.clearDataForOrigin", {"origin": "https://www.python.org", "storageTypes": "all"}),
+    ]
+    # the test's windows are replaced by a new blank tab
+    assert list(driver.urls.values()) == ["about:blank"]
+    assert driver.rect["width"] == 800
+    assert "_visited_origins" not in driver.__dict__
+
+
+def test_reset_visits_each_origin_without_cdp():
+    driver = FakeDriver({"w1": "https://pypi.org/"}, cdp=False)
+    remember_origin(driver, "https://www.python.org/")
+
+    reset_driver(driver)
+
+    assert driver.commands == [
+        ("script", "https://pypi.org/robots.txt"),
+        ("cookies", "https://pypi.org/robots.txt"),
+        ("script", "https://www.python.org/robots.txt"),
+        ("cookies", "https://www.python.org/robots.txt"),
+    ]
+
+
+def test_pool_restores_window_of_launch():
+    pool = DriverPool(launcher=lambda browser, **options: FakeDriver({"w1": "about:blank"}))
+    driver = pool.acquire("Chrome")
+    driver.rect = {"x": 0, "y": 0, "width": 1920, "height": 1080}
+    pool.release(driver)
+
+    assert pool.acquire("Chrome") is driver
+    assert driver.rect == {"x": 0, "y": 0, "width": 800, "height": 600}
+
+
+class LaunchedDriver:
+    """Driver of a fake launcher, only quit() is called by the pool in these tests."""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.quitted = False
+
+    def get_window_rect(self):
+        return {"x": 0, "y": 0, "width": 800, "height": 600}
+
+    def quit(self):
+        self.quitted = True
+
+
+def test_acquire_hands_out_prewarmed_driver():
+    launched = []
+
+    def launcher(browser, **options):
+        launched.append(LaunchedDriver(browser))
+        return launched[-1]
+
+    pool = DriverPool(launcher=launcher)
+    pool.prewarm("Firefox")
+    assert pool.available("Firefox") == 1
+    assert pool.available("Chrome") == 0
+
+    assert pool.acquire("Firefox") is launched[0]
+    assert pool.available("Firefox") == 0
+    assert (pool.launched, pool.prewarmed, pool.acquired) == (1, 1, 1)
+    pool.close()
+    assert pool.prewarmed_unused == 0
+
+
+def test_close_quits_unused_prewarmed_driver():
+    launched = []
+
+    def launcher(browser, **options):
+        launched.append(LaunchedDriver(browser))
+        return launched[-1]
+
+    pool = DriverPool(launcher=launcher)
+    pool.prewarm("Chrome")
+    pool.close()
+    assert launched[0].quitted
+    assert pool.prewarmed_unused == 1
+
+
+def test_failed_prewarm_falls_back_to_launch():
+    launches = []
+
+    def launcher(browser, **options):
+        launches.append(browser)
+        if len(launches) == 1:
+            raise RuntimeError("browser crashed")
+        return LaunchedDriver(browser)
+
+    pool = DriverPool(launcher=launcher)
+    pool.prewarm("Chrome")
+    assert pool.acquire("Chrome").browser == "Chrome"
+    assert launches == ["Chrome", "Chrome"]
+    pool.close()
+
+
+def test_will_return_until_max_uses():
+    pool = DriverPool(launcher=lambda browser, **options: LaunchedDriver(browser), max_uses=2)
+    driver = pool.acquire("Chrome")
+    assert pool.will_return(driver)
+    assert not pool.will_return(LaunchedDriver("Chrome"))
+
+    pool = DriverPool(launcher=lambda browser, **options: LaunchedDriver(browser), max_uses=1)
+    assert not pool.will_return(pool.acquire("Chrome"))
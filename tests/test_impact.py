@@ -0,0 +1,93 @@
+"""Unit tests of change-impact selection of framework/impact.py."""
+
+import time
+
+from framework.impact import MAP_VERSION, MODULE_UNIT, affected_tests, unit_hashes, watched_files
+
+PAGES = '''
+import os
+
+class HomePage:
+    title = "Home"
+
+    def open(self):
+        return 1
+
+    def search(self):
+        return 2
+'''
+
+
+def _write(root, source):
+    (root / "pages.py").write_text(source)
+
+
+def _map(root, tests):
+    return {
+        "version": MAP_VERSION,
+        "created": time.time(),
+        "files": watched_files(str(root)),
+        "sources": ["pages.py"],
+        "units": unit_hashes(str(root / "pages.py"), "pages.py"),
+        "tests": tests,
+    }
+
+
+def _test(*units, failed=False, urls=()):
+    return {"units": list(units), "urls": list(urls), "failed": failed}
+
+
+def test_unit_hashes_per_function_class_and_module(tmp_path):
+    _write(tmp_path, PAGES)
+    units = unit_hashes(str(tmp_path / "pages.py"), "pages.py")
+    assert sorted(units) == [
+        "pages.py::" + MODULE_UNIT,
+        "pages.py::HomePage",
+        "pages.py::HomePage.open",
+        "pages.py::HomePage.search",
+    ]
+
+    # moving code and changing one method only changes that method
+    _write(tmp_path, "\n\n" + PAGES.replace("return 2", "return 3"))
+    changed = unit_hashes(str(tmp_path / "pages.py"), "pages.py")
+    assert [u for u in units if units[u] != changed[u]] == ["pages.py::HomePage.search"]
+
+
+def test_affected_tests_by_changed_method(tmp_path):
+    _write(tmp_path, PAGES)
+    impact_map = _map(
+        tmp_path,
+        {
+            "t::open": _test("pages.py::HomePage.open", "pages.py::HomePage"),
+            "t::search": _test("pages.py::HomePage.search", "pages.py::HomePage"),
+            "t::failed": _test(failed=True),
+            "t::pypi": _test(urls=["https://pypi.org/"]),
+        },
+    )
+    _write(tmp_path, PAGES.replace("return 2", "return 3"))
+
+    affected, reason = affected_tests(impact_map, str(tmp_path), url_patterns=["pypi.org"])
+    assert affected == {"t::search", "t::failed", "t::pypi"}
+    assert "pages.py::HomePage.search" in reason
+
+
+def test_class_body_change_affects_its_methods_tests(tmp_path):
+    _write(tmp_path, PAGES)
+    impact_map = _map(tmp_path, {"t::open": _test("pages.py::HomePage.open", "pages.py::HomePage")})
+    _write(tmp_path, PAGES.replace('"Home"', '"Start"'))
+    assert affected_tests(impact_map, str(tmp_path))[0] == {"t::open"}
+
+
+def test_everything_runs_when_untraced_file_changed_or_map_is_old(tmp_path):
+    _write(tmp_path, PAGES)
+    impact_map = _map(tmp_path, {"t::open": _test("pages.py::HomePage.open")})
+    assert affected_tests(None, str(tmp_path))[0] is None
+    assert affected_tests(impact_map, str(tmp_path))[0] == set()
+
+    (tmp_path / "conftest.py").write_text("x = 1\n")
+    affected, reason = affected_tests(impact_map, str(tmp_path))
+    assert affected is None and "conftest.py" in reason
+
+    (tmp_path / "conftest.py").unlink()
+    impact_map["created"] -= 8 * 86400
+    assert affected_tests(impact_map, str(tmp_path), max_age_days=7)[0] is None
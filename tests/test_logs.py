@@ -0,0 +1,88 @@
+"""Unit tests of framework/logs.py."""
+
+import contextvars
+import json
+import logging
+import threading
+
+import pytest
+
+from framework import logs
+
+
+def _stop(logger, log_file):
+    """Write pending records of logger and close its files."""
+    listener = logs._listeners.pop(log_file)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    logger.removeHandler(logs._queue_handler(logger))
+
+
+@pytest.fixture
+def logger(tmp_path):
+    log_file = str(tmp_path / "test.log")
+    logger = logs.setup_logger(log_file, name="tests.logs")
+    logger.propagate = False
+    yield logger, log_file
+    if log_file in logs._listeners:
+        _stop(logger, log_file)
+
+
+def test_setup_logger_is_idempotent(logger):
+    logger, log_file = logger
+    assert logs.setup_logger(log_file, name="tests.logs") is logger
+    assert [h for h in logger.handlers if isinstance(h, logs._QueueHandler)] == [
+        logs._queue_handler(logger)
+    ]
+
+
+def test_worker_log_file(monkeypatch):
+    monkeypatch.delenv("PYTEST_XDIST_WORKER", raising=False)
+    assert logs.worker_log_file("debug.log") == "debug.log"
+    monkeypatch.setenv("PYTEST_XDIST_WORKER", "gw1")
+    assert logs.worker_log_file("debug.log") == "debug_gw1.log"
+    assert logs.worker_log_file("logs/debug.jsonl") == "logs/debug_gw1.jsonl"
+
+
+def test_records_carry_test_and_args_at_call_time(logger, tmp_path, request):
+    logger, log_file = logger
+    jsonl_file = str(tmp_path / "test.jsonl")
+    logs.add_jsonl(logger, jsonl_file)
+    pages = ["home"]
+    logger.info("Visited %s", pages)
+    # formatted on the listener thread, but with the args of the call
+    pages.append("search")
+    logger.debug("not logged")
+    _stop(logger, log_file)
+
+    with open(log_file) as f:
+        assert f.read().endswith("]: Visited ['home']\n")
+    with open(jsonl_file) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    assert records[0]["message"] == "Visited ['home']"
+    assert records[0]["level"] == "INFO"
+    assert (records[0]["nodeid"], records[0]["phase"]) == (request.node.nodeid, "call")
+
+
+def test_threads_carry_only_the_test_of_their_context(logger, tmp_path, request):
+    logger, log_file = logger
+    jsonl_file = str(tmp_path / "test.jsonl")
+    logs.add_jsonl(logger, jsonl_file)
+    background = threading.Thread(target=logger.info, args=("background",))
+    background.start()
+    background.join()
+    submitted = threading.Thread(target=contextvars.copy_context().run, args=(logger.info, "submitted"))
+    submitted.start()
+    submitted.join()
+    _stop(logger, log_file)
+
+    with open(jsonl_file) as f:
+        records = {r["message"]: (r["nodeid"], r["phase"]) for r in map(json.loads, f)}
+    assert records == {"background": (None, None), "submitted": (request.node.nodeid, "call")}
+
+
+def test_add_jsonl_needs_setup_logger(tmp_path):
+    with pytest.raises(ValueError):
+        logs.add_jsonl(logging.getLogger("tests.logs.plain"), str(tmp_path / "x.jsonl"))
@@ -0,0 +1,61 @@
+"""Unit tests of the element cache of framework/page.py, with a fake driver instead of a browser."""
+
+from selenium.common.exceptions import StaleElementReferenceException
+
+from framework.page import BasePage
+
+
+class FakeElement:
+    def __init__(self, driver):
+        self.driver = driver
+        self.page = driver.page
+
+    def click(self):
+        if self.page != self.driver.page:
+            raise StaleElementReferenceException("element of a previous page")
+        self.driver.page += 1
+
+
+class FakeDriver:
+    def __init__(self):
+        # number of the loaded page, elements of other pages are stale
+        self.page = 0
+        self.finds = 0
+
+    def find_element(self, by, value):
+        self.finds += 1
+        return FakeElement(self)
+
+
+class LinkPage(BasePage):
+    locators = {"link": ("id", "link"), "logo": ("id", "logo")}
+
+
+def test_element_is_found_once_per_page():
+    driver = FakeDriver()
+    page = LinkPage(driver)
+    assert page.element("link") is page.element("link")
+    assert driver.finds == 1
+
+
+def test_navigating_action_clears_cache():
+    driver = FakeDriver()
+    page = LinkPage(driver)
+    page.element("logo")
+    page.with_element("link", lambda elem: elem.click(), navigates=True)
+    assert driver.page == 1
+    assert page._elements == {}
+
+
+def test_stale_element_is_found_again():
+    driver = FakeDriver()
+    page = LinkPage(driver)
+    page.element("logo")
+    page.element("link")
+    # e.g. the page re-rendered after a script ran
+    driver.page = 5
+    page.with_element("link", lambda elem: elem.click())
+    assert driver.page == 6
+    assert driver.finds == 3
+    # the other elements were found on the old page
+    assert list(page._elements) == ["link"]
@@ -0,0 +1,87 @@
+"""Unit tests of framework/page_metrics.py, with a fake driver instead of a browser."""
+
+from types import SimpleNamespace
+
+import pytest
+
+from framework import page_metrics
+from framework.logs import set_current_test
+from framework.page_metrics import budget_violations, collect_page_metrics
+
+
+class FakeDriver:
+    """Returns the given raw metrics for the current URL."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.current_url = "about:blank"
+
+    def get(self, url):
+        self.current_url = url
+
+    def execute_async_script(self, script):
+        return dict(self.raw, url=self.current_url)
+
+
+RAW = {
+    "ttfb": 120.4,
+    "dom_content_loaded": 800.6,
+    "load_event": 1500.2,
+    "lcp": None,
+    "cls": 0.01234,
+    "transfer_kb": 20.7,
+    "resource_count": 12,
+    "resource_kb": 300.49,
+}
+
+
+def test_collect_rounds_metrics_and_skips_blank_pages():
+    driver = FakeDriver(RAW)
+    assert collect_page_metrics(driver) is None
+
+    driver.get("https://www.python.org/")
+    metrics = collect_page_metrics(driver)
+    assert metrics["ttfb"] == 120
+    assert metrics["load_event"] == 1500
+    assert metrics["cls"] == 0.012
+    assert metrics["lcp"] is None
+
+
+def test_page_object_names_record_of_last_load():
+    nodeid = "test_x.py::test_y"
+    set_current_test(nodeid, "call")
+    driver = page_metrics.track_page_loads(FakeDriver(RAW))
+    try:
+        driver.get("https://www.python.org/")
+        assert [r["page"] for r in page_metrics._records[nodeid]] == ["https://www.python.org/"]
+
+        page_metrics.record_page_metrics(driver, "PythonOrgHomepage")
+        driver.get("https://pypi.org/")
+        records = page_metrics._records[nodeid]
+        assert [r["page"] for r in records] == ["PythonOrgHomepage", "https://pypi.org/"]
+    finally:
+        page_metrics._records.pop(nodeid, None)
+
+
+def test_budget_violations():
+    records = [
+        {"page": "Home", "url": "https://a/", "ttfb": 900, "lcp": None},
+        {"page": "Search", "url": "https://a/s", "ttfb": 300, "lcp": 3000},
+    ]
+    budgets = [(None, {"ttfb": 800}), ("Search", {"lcp": 2500}), ("Home", {"lcp": 1})]
+    assert budget_violations(records, budgets) == [
+        "Home (https://a/): ttfb 900 > budget 800 (+100)",
+        "Search (https://a/s): lcp 3000 > budget 2500 (+500)",
+    ]
+    assert budget_violations(records, [(None, {"ttfb": 1000})]) == []
+
+
+def test_unknown_budget_metric():
+    marker = pytest.mark.perf_budget(page="Home", fcp=100).mark
+    item = SimpleNamespace(iter_markers=lambda name: [marker])
+    with pytest.raises(ValueError, match="Unknown perf_budget metrics"):
+        page_metrics._budgets(item)
+
+    marker = pytest.mark.perf_budget(page="Home", ttfb=100).mark
+    item = SimpleNamespace(iter_markers=lambda name: [marker])
+    assert page_metrics._budgets(item) == [("Home", {"ttfb": 100})]
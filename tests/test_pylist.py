@@ -0,0 +1,106 @@
+"""Unit tests of pylist.py: node ids, -k / -m expressions and the cache."""
+
+import pylist
+
+pytest_plugins = ["pytester"]
+
+SOURCE = b'''
+import pytest
+
+browser_list = ["Chrome", "Firefox"]
+pytestmark = pytest.mark.slow
+
+
+def test_plain():
+    pass
+
+
+@pytest.mark.parametrize("n", [1, 1, 2])
+@pytest.mark.parametrize("browser", browser_list)
+def test_matrix(browser, n):
+    pass
+
+
+@pytest.mark.parametrize("value", [pytest.param(None, id="none"), [1, 2]])
+def test_ids(value):
+    pass
+
+
+@pytest.mark.parametrize("value", make_values())
+def test_dynamic(value):
+    pass
+
+
+@pytest.mark.perf_budget(ttfb=800)
+class TestPages:
+    def test_home(self):
+        pass
+
+
+class TestNotCollected:
+    def __init__(self):
+        pass
+
+    def test_x(self):
+        pass
+'''
+
+
+def _nodeids(tests):
+    return [test["nodeid"] for test in tests]
+
+
+def test_parse_tests_expands_literal_parameters():
+    assert _nodeids(pylist.parse_tests("test_a.py", SOURCE)) == [
+        "test_a.py::test_plain",
+        "test_a.py::test_matrix[Chrome-1_0]",
+        "test_a.py::test_matrix[Chrome-1_1]",
+        "test_a.py::test_matrix[Chrome-2]",
+        "test_a.py::test_matrix[Firefox-1_0]",
+        "test_a.py::test_matrix[Firefox-1_1]",
+        "test_a.py::test_matrix[Firefox-2]",
+        "test_a.py::test_ids[none]",
+        "test_a.py::test_ids[value1]",
+        "test_a.py::test_dynamic[...]",
+        "test_a.py::TestPages::test_home",
+    ]
+
+
+def test_same_node_ids_as_pytest(pytester):
+    source = SOURCE.replace(b"make_values()", b"[3]")
+    pytester.makepyfile(test_a=source.decode())
+    result = pytester.runpytest("--collect-only", "-q", "-p", "no:cacheprovider")
+    collected = [line for line in result.outlines if "::" in line]
+    # pytester runs in its own dir
+    assert _nodeids(pylist.list_tests(["."], cache_file=None)) == collected
+
+
+def test_keyword_and_marker_expressions(tmp_path):
+    path = tmp_path / "test_a.py"
+    path.write_bytes(SOURCE)
+    cache_file = str(tmp_path / "cache.json")
+
+    tests = pylist.list_tests(
+        [str(path)], keyword="matrix and Firefox and not 2", cache_file=cache_file
+    )
+    assert _nodeids(tests) == [
+        "%s::test_matrix[Firefox-1_0]" % path.as_posix(),
+        "%s::test_matrix[Firefox-1_1]" % path.as_posix(),
+    ]
+    tests = pylist.list_tests(
+        [str(path)], marker="perf_budget or parametrize", cache_file=cache_file
+    )
+    assert len(tests) == 10
+    assert len(pylist.list_tests([str(path)], marker="slow", cache_file=cache_file)) == 11
+
+
+def test_cache_is_invalidated_by_content(tmp_path):
+    path = tmp_path / "test_a.py"
+    path.write_bytes(b"def test_one():\n    pass\n")
+    cache_file = str(tmp_path / "cache.json")
+    assert len(pylist.list_tests([str(path)], cache_file=cache_file)) == 1
+
+    cache = pylist.Cache(cache_file)
+    assert list(cache.entries) == [str(path)]
+    path.write_bytes(b"def test_one():\n    pass\n\n\ndef test_two():\n    pass\n")
+    assert len(pylist.list_tests([str(path)], cache_file=cache_file)) == 2
@@ -0,0 +1,77 @@
+"""Unit tests of framework/resource_blocking.py: block rules and the blocking proxy, no browser."""
+
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from framework.resource_blocking import BlockingProxy, BlockRules
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+
+def test_rules_of_types_and_patterns():
+    rules = BlockRules(["*://ads.example.com/*"], types=["image", "analytics"])
+    assert rules.blocks("https://www.python.org/static/img/logo.png")
+    assert rules.blocks("https://www.google-analytics.com/analytics.js")
+    assert rules.blocks("http://ads.example.com/banner.html")
+    assert not rules.blocks("https://www.python.org/static/js/main.js")
+
+
+def test_rules_of_hosts_only_use_host_patterns():
+    rules = BlockRules(["*.png*", "*://ads.example.com/*"], types=["analytics"])
+    assert rules.blocks_host("ads.example.com")
+    assert rules.blocks_host("stats.g.doubleclick.net")
+    # the path of a tunneled HTTPS request is unknown
+    assert not rules.blocks_host("www.python.org")
+
+
+def test_unknown_type():
+    with pytest.raises(ValueError, match="Unknown block_resources types"):
+        BlockRules(types=["video"])
+
+
+def test_rules_of_all_markers():
+    markers = [
+        pytest.mark.block_resources("*.svg*").mark,
+        pytest.mark.block_resources(types=["font"]).mark,
+    ]
+    rules = BlockRules.of(SimpleNamespace(iter_markers=lambda name: markers))
+    assert rules.blocks("https://a/logo.svg")
+    assert rules.blocks("https://a/x.woff2")
+    assert BlockRules.of(SimpleNamespace(iter_markers=lambda name: [])) is None
+
+
+def test_proxy_blocks_matching_http_requests():
+    upstream = HTTPServer(("127.0.0.1", 0), _OkHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    proxy = BlockingProxy().start()
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({"http": "http://%s" % proxy.address})
+    )
+    base = "http://127.0.0.1:%d" % upstream.server_address[1]
+    try:
+        assert opener.open(base + "/logo.png", timeout=10).read() == b"ok"
+
+        proxy.rules = BlockRules(types=["image"])
+        with pytest.raises(urllib.error.HTTPError) as e:
+            opener.open(base + "/logo.png", timeout=10)
+        assert e.value.code == 403
+        assert opener.open(base + "/index.html", timeout=10).read() == b"ok"
+        assert proxy.blocked == 1
+    finally:
+        proxy.stop()
+        upstream.shutdown()
+        upstream.server_close()
@@ -0,0 +1,111 @@
+"""Unit tests of framework/scheduling.py, they need no browser."""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from framework.scheduling import DurationScheduling, DurationStore, browser_of
+
+pytest_plugins = ["pytester"]
+
+
+class FakeConfig:
+    def __init__(self, numprocesses):
+        self.tx = ["%d*popen" % numprocesses]
+
+    def getvalue(self, name):
+        assert name == "tx"
+        return self.tx
+
+
+class FakeNode:
+    def __init__(self):
+        self.shutting_down = False
+        self.sent = []
+
+    def send_runtest_some(self, indexes):
+        self.sent.extend(indexes)
+
+    def shutdown(self):
+        self.shutting_down = True
+
+
+def test_browser_of():
+    assert browser_of("test_x.py::test_a[Firefox]") == "Firefox"
+    assert browser_of("test_x.py::test_a[1-chrome-x]") == "chrome"
+    assert browser_of("test_x.py::test_a[other]") == "Chrome"
+    assert browser_of("test_x.py::test_a") == "Chrome"
+
+
+def test_duration_store_smooths_and_skips_unchanged(tmp_path):
+    path = tmp_path / "durations.json"
+    path.write_text(json.dumps({"t::a": 2.0}))
+    store = DurationStore()
+    store.load(str(path))
+    store.add("t::a", 3.0)
+    store.add("t::a", 1.0)
+    assert store.save()
+    assert json.loads(path.read_text()) == {"t::a": 3.0}
+
+    # the same duration again leaves the file alone
+    store.add("t::a", 3.0)
+    path.write_text("untouched")
+    assert not store.save()
+    assert path.read_text() == "untouched"
+
+
+def test_scheduler_sends_longest_first_by_browser():
+    collection = ["t::a[Chrome]", "t::b[Firefox]", "t::c[Chrome]", "t::d[Firefox]", "t::e"]
+    durations = DurationStore()
+    durations.durations = {"t::a[Chrome]": 1.0, "t::b[Firefox]": 5.0, "t::c[Chrome]": 3.0}
+    sched = DurationScheduling(FakeConfig(2), durations)
+    assert sched.numnodes == 2
+    nodes = [FakeNode(), FakeNode()]
+    for node in nodes:
+        sched.add_node(node)
+        assert not sched.collection_is_completed or node is nodes[1]
+        sched.add_node_collection(node, collection)
+    sched.schedule()
+
+    # Firefox has the longest test, the other worker takes the Chrome tests
+    # (t::e counts as the average of the known durations, 3s)
+    assert nodes[0].sent == [1, 3]
+    assert nodes[1].sent == [2, 4]
+    sched.mark_test_complete(nodes[1], 2)
+    assert nodes[1].sent == [2, 4, 0]
+
+    for node, index in ((nodes[0], 1), (nodes[0], 3), (nodes[1], 4), (nodes[1], 0)):
+        sched.mark_test_complete(node, index)
+    assert all(node.shutting_down for node in nodes)
+    assert sched.tests_finished
+
+
+def test_scheduler_under_xdist(pytester, monkeypatch):
+    pytest.importorskip("xdist")
+    # the repo root, for the framework package in the pytest subprocess
+    monkeypatch.setenv("PYTHONPATH", str(Path(__file__).resolve().parents[1]))
+
+    pytester.makeconftest(
+        """
+        import logging
+        from framework.logs import setup_logger
+
+        log = setup_logger("debug.log", logging.INFO, name=__name__)
+        pytest_plugins = ["framework.scheduling"]
+        """
+    )
+    pytester.makepyfile(
+        test_a="""
+        import pytest
+
+        @pytest.mark.parametrize("browser", ["Chrome", "Firefox"])
+        def test_a(browser):
+            pass
+
+        def test_b():
+            pass
+        """
+    )
+    result = pytester.runpytest_subprocess("-n", "2", "--duration-scheduling", "-p", "no:cacheprovider")
+    result.assert_outcomes(passed=3)
@@ -0,0 +1,26 @@
+"""Unit tests of the background encode and save of framework/screenshots.py."""
+
+import os
+
+from framework.screenshots import Screenshot, ScreenshotPipeline
+
+
+def test_failed_save_is_logged(tmp_path, caplog):
+    pipeline = ScreenshotPipeline()
+    shot = Screenshot(b"png", str(tmp_path / "missing" / "shot"), 0.1)
+    pipeline.submit(shot)
+    pipeline.flush()
+    # the encoded image is still there for the report
+    assert shot.encoded()[1] == "image/png"
+    assert "Failed to encode or save screenshot" in caplog.text
+
+
+def test_saved_path_is_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipeline = ScreenshotPipeline()
+    shot = Screenshot(b"png", "shot", 0.1)
+    pipeline.submit(shot)
+    shot.encoded()
+    assert shot.path == str(tmp_path / "shot.png")
+    pipeline.flush()
+    assert os.path.exists(shot.path)
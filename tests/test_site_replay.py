@@ -0,0 +1,120 @@
+"""Unit tests of framework/site_replay.py: the archive and the local replay server, no browser."""
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+from framework import site_replay
+from framework.site_replay import Recorder, ReplayServer, SiteArchive, cookie_header
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    archive = SiteArchive(str(tmp_path_factory.mktemp("archive")))
+    archive.add(
+        "https://www.python.org/",
+        200,
+        "text/html",
+        b'<a href="https://www.python.org/about/">About</a><link href="/static/x.css">',
+    )
+    archive.add("https://www.python.org/static/x.css", 200, "text/css", b"body {}")
+    archive.add("https://www.python.org/missing", 404, "text/html", b"Not here")
+    archive.save()
+    return archive
+
+
+@pytest.fixture(scope="module")
+def server(archive):
+    server = ReplayServer(SiteArchive(archive.path)).start()
+    yield server
+    server.stop()
+
+
+def _get(url, headers=None):
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def test_archive_round_trip(archive):
+    loaded = SiteArchive(archive.path)
+    assert "https://www.python.org/static/x.css" in loaded
+    assert "https://www.python.org/about/" not in loaded
+    assert loaded.get("https://www.python.org/static/x.css") == (200, "text/css", b"body {}")
+    assert loaded.get("https://www.python.org/missing")[0] == 404
+    assert loaded.origins() == {"https://www.python.org"}
+
+
+def test_replay_rewrites_archived_origins(server):
+    status, body = _get(server.replay_url("https://www.python.org/"))
+    assert status == 200
+    assert body.startswith(b'<a href="%s/https/www.python.org/about/"' % server.base.encode())
+
+    assert _get(server.replay_url("https://www.python.org/missing")) == (404, b"Not here")
+    assert _get(server.replay_url("https://www.python.org/about/"))[0] == 404
+
+
+def test_replay_redirects_root_relative_urls_by_referer(server):
+    referer = server.replay_url("https://www.python.org/")
+    status, body = _get(server.local_url("/static/x.css"), headers={"Referer": referer})
+    assert (status, body) == (200, b"body {}")
+
+
+def test_replay_serves_added_pages(server):
+    server.add_page("/login.html", "<form></form>")
+    assert _get(server.local_url("/login.html")) == (200, b"<form></form>")
+
+
+def test_cookie_header_matches_domain_path_and_scheme():
+    cookies = [
+        {"name": "session", "value": "1", "domain": ".python.org", "path": "/"},
+        {"name": "host", "value": "2", "domain": "www.python.org", "path": "/"},
+        {"name": "docs", "value": "3", "domain": "www.python.org", "path": "/docs"},
+        {"name": "secure", "value": "4", "domain": "www.python.org", "path": "/", "secure": True},
+        {"name": "other", "value": "5", "domain": "pypi.org", "path": "/"},
+    ]
+    assert cookie_header(cookies, "https://www.python.org/") == "session=1; host=2; secure=4"
+    assert cookie_header(cookies, "http://www.python.org/docs/x") == "session=1; host=2; docs=3"
+    assert cookie_header(cookies, "https://docs.python.org/") == "session=1"
+    assert cookie_header(cookies, "https://files.pythonhosted.org/x.css") is None
+
+
+class FakeDriver:
+    def __init__(self, urls, cookies):
+        self.urls = urls
+        self.cookies = cookies
+
+    def execute_script(self, script):
+        return {"userAgent": "FakeBrowser/1.0", "urls": self.urls}
+
+    def get_cookies(self):
+        return self.cookies
+
+
+def test_recorder_fetches_with_browser_user_agent_and_cookies(tmp_path, monkeypatch):
+    fetched = {}
+
+    def fake_fetch(url, headers=None):
+        fetched[url] = headers
+        return 200, "text/css", b"body {}"
+
+    monkeypatch.setattr(site_replay, "fetch", fake_fetch)
+    recorder = Recorder(SiteArchive(str(tmp_path)), skip_prefix="http://127.0.0.1:1")
+    driver = FakeDriver(
+        [
+            "https://www.python.org/#top",
+            "https://www.python.org/x.css",
+            "http://127.0.0.1:1/login.html",
+        ],
+        [{"name": "session", "value": "1", "domain": ".python.org", "path": "/"}],
+    )
+    recorder.page_loaded(driver, None)
+    recorder.close()
+
+    headers = {"User-Agent": "FakeBrowser/1.0", "Cookie": "session=1"}
+    assert fetched == {"https://www.python.org/": headers, "https://www.python.org/x.css": headers}
+    assert "https://www.python.org/x.css" in SiteArchive(str(tmp_path))
@@ -0,0 +1,72 @@
+"""Unit tests of framework/smoke.py which need no browser."""
+
+import pytest
+
+from framework import smoke
+from framework.smoke import SmokeRow, SmokeRunner, parse_locators
+from framework.timing import current_test
+
+
+def test_parse_locators():
+    assert parse_locators("id=search; css=ul li") == (("id", "search"), ("css selector", "ul li"))
+    assert parse_locators("") == ()
+    with pytest.raises(ValueError):
+        parse_locators("label=Search")
+
+
+def test_launch_failure_fails_only_its_row(monkeypatch):
+    def create_driver(browser, **options):
+        raise RuntimeError("no %s here" % browser)
+
+    monkeypatch.setattr(smoke, "create_driver", create_driver)
+    runner = SmokeRunner(workers=1)
+    row = SmokeRow("python", "https://www.python.org/", None, "Python", (), "Chrome")
+    try:
+        result = runner.result(row)
+    finally:
+        runner.close()
+    assert not result.ok
+    assert result.errors == ["RuntimeError: no Chrome here"]
+
+
+def test_check_runs_as_the_test_of_its_row(monkeypatch):
+    tests = []
+
+    def create_driver(browser, **options):
+        tests.append(current_test())
+        raise RuntimeError("no %s here" % browser)
+
+    monkeypatch.setattr(smoke, "create_driver", create_driver)
+    python = SmokeRow("python", "https://www.python.org/", None, "Python", (), "Chrome")
+    pypi = SmokeRow("pypi", "https://pypi.org/", None, "PyPI", (), "Chrome")
+    runner = SmokeRunner(workers=1)
+    try:
+        runner.submit(python, "test_x.py::test_python").result()
+        runner.submit(pypi).result()
+    finally:
+        runner.close()
+    assert tests == ["test_x.py::test_python", current_test()]
+
+
+class BrokenDriver:
+    def quit(self):
+        raise RuntimeError("already gone")
+
+
+def test_failed_reset_replaces_driver_and_logs_failed_quit(monkeypatch, caplog):
+    def reset_driver(driver):
+        raise RuntimeError("session deleted")
+
+    monkeypatch.setattr(smoke, "reset_driver", reset_driver)
+    runner = SmokeRunner(workers=1)
+    driver = BrokenDriver()
+    runner._local.drivers = {"Chrome": driver}
+    runner._drivers.append(driver)
+    try:
+        with caplog.at_level("INFO", logger=smoke.log.name):
+            runner._reset(driver, "Chrome")
+    finally:
+        runner.close()
+    assert runner._local.drivers == {}
+    assert runner._drivers == []
+    assert "Failed to quit Chrome smoke driver: already gone" in caplog.text
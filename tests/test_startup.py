@@ -0,0 +1,55 @@
+"""Unit tests of framework/startup.py, in pytester runs."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest_plugins = ["pytester"]
+
+
+def _run(pytester, budget_ms, *args):
+    pytester.makepyfile("def test_one():\n    pass\n")
+    options = ["-p", "framework.startup", "-p", "no:cacheprovider"]
+    return pytester.runpytest(*options, "-o", "collect_budget_ms=%s" % budget_ms, *args)
+
+
+def test_within_budget(pytester):
+    result = _run(pytester, 10**9)
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["imports and collection took *ms, budget 1000000000ms"])
+
+
+def test_no_budget(pytester):
+    result = _run(pytester, 0)
+    result.assert_outcomes(passed=1)
+    result.stdout.fnmatch_lines(["imports and collection took *ms"])
+
+
+# startup counts from the import of conftest, long before the runs below
+def test_over_budget_only_warns_in_test_runs(pytester):
+    result = _run(pytester, 1)
+    result.assert_outcomes(passed=1)
+    assert result.ret == pytest.ExitCode.OK
+    result.stdout.fnmatch_lines(["Startup took *ms, over collect_budget_ms 1ms*"])
+
+
+def test_over_budget_fails_collect_only_and_checked_runs(pytester):
+    assert _run(pytester, 1, "--collect-only").ret == pytest.ExitCode.TESTS_FAILED
+
+    result = _run(pytester, 1, "--check-collect-budget")
+    result.assert_outcomes(passed=1)
+    assert result.ret == pytest.ExitCode.TESTS_FAILED
+
+
+def test_plugins_leave_heavy_modules_unloaded():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = (
+        "import sys, conftest\n"
+        "for name in conftest.pytest_plugins: __import__(name)\n"
+        "from framework.startup import HEAVY_MODULES\n"
+        "print(','.join(name for name in HEAVY_MODULES if name in sys.modules))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
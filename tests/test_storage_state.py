@@ -0,0 +1,101 @@
+"""Unit tests of framework/storage_state.py, with a fake driver without DevTools."""
+
+import json
+import os
+
+import pytest
+
+from framework import storage_state
+from framework.storage_state import StateStore, fingerprint
+
+
+class FakeDriver:
+    """Keeps the cookies and storage set on it, see storage_state._READ_STORAGE_JS."""
+
+    def __init__(self):
+        self.current_url = "about:blank"
+        self.cookies = []
+        self.local = {}
+        self.session = {}
+        self.loads = []
+
+    def get(self, url):
+        self.current_url = url
+        self.loads.append(url)
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def execute_script(self, script, *args):
+        if script == storage_state._READ_STORAGE_JS:
+            return [dict(self.local), dict(self.session)]
+        # the write script, parse its arguments back
+        origin, local, session = json.loads("[%s]" % script.rsplit("})(", 1)[1][:-3])
+        if self.current_url.startswith(origin):
+            self.local.update(local)
+            self.session.update(session)
+
+
+class BasePage:
+    url = "https://pypi.org/"
+
+
+class LoginPage(BasePage):
+    pass
+
+
+def log_in(driver):
+    driver.get("https://pypi.org/account/")
+    driver.cookies.append({"name": "session", "value": "abc", "domain": "pypi.org", "path": "/"})
+    driver.local["theme"] = "dark"
+
+
+def log_in_again(driver):
+    log_in(driver)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StateStore(str(tmp_path))
+
+
+def test_setup_runs_once_then_state_is_restored(store):
+    assert not store.ensure("login", FakeDriver(), log_in, depends_on=[LoginPage])
+
+    driver = FakeDriver()
+    assert store.ensure("login", driver, log_in, depends_on=[LoginPage])
+    assert driver.loads == ["https://pypi.org/", "https://pypi.org/account/"]
+    assert driver.cookies == [
+        {"name": "session", "value": "abc", "domain": "pypi.org", "path": "/"}
+    ]
+    assert driver.local == {"theme": "dark"}
+    assert (store.created, store.restored) == (1, 1)
+
+
+def test_state_of_other_code_or_context_is_not_restored(store):
+    store.ensure("login", FakeDriver(), log_in, context="http://127.0.0.1:8000")
+    assert not store.ensure("login", FakeDriver(), log_in_again, context="http://127.0.0.1:8000")
+    assert not store.ensure("login", FakeDriver(), log_in_again, context="http://127.0.0.1:9000")
+    assert store.ensure("login", FakeDriver(), log_in_again, context="http://127.0.0.1:9000")
+
+
+def test_expired_state_is_not_restored(tmp_path):
+    store = StateStore(str(tmp_path), max_age=60)
+    store.ensure("login", FakeDriver(), log_in)
+    path = os.path.join(str(tmp_path), "login.json")
+    with open(path) as f:
+        saved = json.load(f)
+    saved["saved_at"] -= 61
+    with open(path, "w") as f:
+        json.dump(saved, f)
+    assert not store.ensure("login", FakeDriver(), log_in)
+
+
+def test_fingerprint_covers_base_classes():
+    assert fingerprint(LoginPage) != fingerprint(BasePage)
+    assert fingerprint(LoginPage, context=1) != fingerprint(LoginPage, context=2)
+    assert fingerprint(log_in) != fingerprint(log_in_again)
+    assert fingerprint(log_in, LoginPage) == fingerprint(log_in, LoginPage)
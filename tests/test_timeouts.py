@@ -0,0 +1,101 @@
+"""Unit tests of the learned wait timeouts of framework/timeouts.py."""
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from framework import timeouts, timing
+from framework.timeouts import MIN_SAMPLES, MIN_TIMEOUT, WaitHistory
+
+
+class FakeDriver:
+    capabilities = {"browserName": "chrome"}
+
+
+class FakeWait:
+    """TimedWebDriverWait whose condition is met once a wait may take needed secs."""
+
+    needed = 0.0
+    timeouts = []
+
+    def __init__(self, driver, timeout, label=None):
+        self.timeout = timeout
+        FakeWait.timeouts.append(timeout)
+
+    def until(self, condition):
+        if sum(FakeWait.timeouts) < FakeWait.needed:
+            raise TimeoutException("too fast")
+        return True
+
+
+@pytest.fixture
+def history(monkeypatch):
+    history = WaitHistory()
+    monkeypatch.setattr(timeouts, "history", history)
+    monkeypatch.setattr(timing, "TimedWebDriverWait", FakeWait, raising=False)
+    monkeypatch.setattr(FakeWait, "timeouts", [])
+    return history
+
+
+def test_upper_bound_until_enough_samples(history):
+    history.samples = {"Home|chrome": [0.5] * (MIN_SAMPLES - 1)}
+    assert history.timeout("Home", "chrome", upper_bound=15) == 15
+    history.samples["Home|chrome"].append(0.5)
+    # p95 0.5s * 1.5 + 1s margin, at least MIN_TIMEOUT
+    assert history.timeout("Home", "chrome", upper_bound=15) == max(MIN_TIMEOUT, 1.75)
+    history.adaptive = False
+    assert history.timeout("Home", "chrome", upper_bound=15) == 15
+
+
+def test_learned_timeout_is_clamped(history):
+    history.samples = {"Slow|chrome": [20.0] * MIN_SAMPLES, "Fast|chrome": [0.01] * MIN_SAMPLES}
+    assert history.timeout("Slow", "chrome", upper_bound=15) == 15
+    assert history.timeout("Fast", "chrome", upper_bound=15) == MIN_TIMEOUT
+
+
+def test_merge_keeps_last_samples(history):
+    history.samples = {"Home|chrome": [1.0] * timeouts.MAX_SAMPLES}
+    history.merge({"Home|chrome": [2.0]})
+    assert len(history.samples["Home|chrome"]) == timeouts.MAX_SAMPLES
+    assert history.samples["Home|chrome"][-1] == 2.0
+
+
+def test_timeout_fails_fast_and_is_recorded_as_sample(history, monkeypatch):
+    failed = []
+    monkeypatch.setattr(timeouts, "wait_failure_listeners", [lambda *args: failed.append(args)])
+    history.samples = {"Home|chrome": [0.5] * MIN_SAMPLES}
+    FakeWait.needed = 5.0
+
+    with pytest.raises(TimeoutException):
+        timeouts.wait_until(FakeDriver(), None, "Home", label="title", upper_bound=15)
+
+    assert FakeWait.timeouts == [MIN_TIMEOUT]
+    # it took at least the learned timeout
+    assert history.new_samples == {"Home|chrome": [MIN_TIMEOUT]}
+    assert [failure[1:] for failure in history.fast_failures] == [("Home|chrome", MIN_TIMEOUT, 15)]
+    assert len(failed) == 1
+
+
+def test_repeated_timeouts_widen_learned_timeout(history):
+    history.samples = {"Home|chrome": [0.5] * MIN_SAMPLES}
+    FakeWait.needed = 100.0
+
+    for run in range(5):
+        history.new_samples = {}
+        with pytest.raises(TimeoutException):
+            timeouts.wait_until(FakeDriver(), None, "Home", upper_bound=15)
+        history.merge(history.new_samples)
+
+    # each timeout becomes the p95, so the next one is * 1.5 + 1s, up to the upper bound
+    assert FakeWait.timeouts == [2.0, 4.0, 7.0, 11.5, 15]
+    # a timeout at the upper bound says nothing new
+    assert not history.new_samples
+
+
+def test_wait_within_learned_timeout_is_recorded(history):
+    history.samples = {"Home|chrome": [0.5] * MIN_SAMPLES}
+    FakeWait.needed = 1.0
+
+    assert timeouts.wait_until(FakeDriver(), None, "Home", upper_bound=15)
+    assert FakeWait.timeouts == [MIN_TIMEOUT]
+    assert len(history.new_samples["Home|chrome"]) == 1
+    assert not history.fast_failures
@@ -0,0 +1,55 @@
+"""Unit tests of framework/timing.py, with a fake driver instead of a browser."""
+
+import json
+from types import SimpleNamespace
+
+from framework import timing
+from framework.logs import set_current_test
+
+
+class FakeDriver:
+    def execute(self, driver_command, params=None):
+        return {"value": None}
+
+
+def test_summarize_sorts_by_total_time():
+    commands = [("get", 1.0), ("findElement", 0.25), ("findElement", 0.5), ("click", 0.1)]
+    assert timing.summarize(commands) == [
+        ("get", 1, 1.0, 1.0),
+        ("findElement", 2, 0.75, 0.5),
+        ("click", 1, 0.1, 0.1),
+    ]
+
+
+def test_instrument_records_commands_of_running_test():
+    nodeid = "test_x.py::test_y"
+    set_current_test(nodeid, "call")
+    driver = timing.instrument(FakeDriver())
+    # instrumented once
+    assert timing.instrument(driver) is driver
+
+    driver.execute("get", {"url": "https://www.python.org/"})
+    driver.execute("findElement")
+    commands = timing._commands.pop(nodeid)
+    assert [command for command, _ in commands] == ["get", "findElement"]
+    assert all(secs >= 0 for _, secs in commands)
+
+
+def test_instrument_unwraps_event_firing_driver():
+    set_current_test("test_x.py::test_z", "call")
+    raw = FakeDriver()
+    assert timing.instrument(SimpleNamespace(wrapped_driver=raw)) is raw
+    raw.execute("click")
+    assert [command for command, _ in timing._commands.pop("test_x.py::test_z")] == ["click"]
+
+
+def test_write_record_appends_jsonl(tmp_path):
+    timing_file = tmp_path / "timings" / "run.jsonl"
+    config = SimpleNamespace(stash={timing.timing_file_key: str(timing_file)})
+    timing._write_record(config, "test_x.py::test_y", [("get", 0.12345)], [("page", 1.5, 3, True)])
+    timing._write_record(config, "test_x.py::test_z", [], [("page", 2.0, 9, False)])
+
+    records = [json.loads(line) for line in timing_file.read_text().splitlines()]
+    assert [r["nodeid"] for r in records] == ["test_x.py::test_y", "test_x.py::test_z"]
+    assert records[0]["commands"] == [{"command": "get", "secs": 0.1235}]
+    assert records[1]["waits"] == [{"label": "page", "secs": 2.0, "polls": 9, "ok": False}]
@@ -0,0 +1,47 @@
+"""Unit tests of the tiled comparison of framework/visual.py."""
+
+import pytest
+
+from framework.visual import compare
+
+np = pytest.importorskip("numpy")
+
+
+def _page(seed=0, height=120, width=200):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_identical_images_skip_every_tile():
+    image = _page()
+    mask, changed, compared = compare(image, image.copy())
+    assert mask.shape == (120, 200)
+    assert not mask.any()
+    assert (changed, compared) == (0, 0)
+
+
+def test_changed_region_is_found():
+    baseline = _page()
+    current = baseline.copy()
+    current[10:20, 50:60] = 255 - current[10:20, 50:60]
+    mask, changed, compared = compare(baseline, current)
+    assert changed == compared == 1
+    differing = mask[10:20, 50:60]
+    assert mask.sum() == differing.sum() > 0
+
+
+def test_noise_below_threshold_and_ignored_pixels_pass():
+    baseline = np.full((80, 80, 3), 128, dtype=np.uint8)
+    current = baseline.copy()
+    current[0:5, 0:5] = 131
+    assert not compare(baseline, current)[0].any()
+
+    current[40:50, 40:50] = 0
+    ignore = np.zeros((80, 80), dtype=bool)
+    ignore[40:50, 40:50] = True
+    assert compare(baseline, current)[0].any()
+    assert not compare(baseline, current, ignore_mask=ignore)[0].any()
+
+
+def test_tile_must_fit_the_signature_grid():
+    with pytest.raises(ValueError):
+        compare(_page(), _page(), tile=42)
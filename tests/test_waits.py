@@ -0,0 +1,34 @@
+"""Unit tests of wait_for_page_ready() of framework/waits.py, with a fake driver."""
+
+from framework import waits
+from framework.waits import wait_for_page_ready
+
+
+class FakeDriver:
+    """Answers the readiness probe with a list of (readyState, pending requests, quiet ms)."""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.polls = 0
+
+    def execute_script(self, script):
+        self.polls += 1
+        return self.states[min(self.polls, len(self.states)) - 1]
+
+
+def test_ready_once_quiet():
+    driver = FakeDriver([("loading", 0, 0), ("complete", 1, 500), ("complete", 0, 500)])
+    assert wait_for_page_ready(driver, timeout=5)
+    assert driver.polls == 3
+
+
+def test_busy_dom_is_ready_after_quiet_max(monkeypatch):
+    monkeypatch.setattr(waits, "POLL_MAX", 0.01)
+    # a carousel: loaded and idle, but never quiet
+    driver = FakeDriver([("complete", 0, 0)])
+    assert wait_for_page_ready(driver, timeout=5, quiet_max=0.1)
+
+
+def test_pending_requests_time_out():
+    driver = FakeDriver([("complete", 2, 1000)])
+    assert not wait_for_page_ready(driver, timeout=0.2)